@@ -0,0 +1,742 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Signik Broker internals.
+Runs the broker components in-process (no server needed) and prints timings.
+
+Usage: python benchmark_broker.py [scenario ...]
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "signik_broker"))
+
+from models import (  # noqa: E402
+    EnqueueDocRequest, EnqueueBundleRequest, BundleItem,
+    Device, Document, DeviceConnection, DeviceType, DocStatus, ConnectionStatus, SignikMessage
+)
+from records import DeviceRecord, DocumentRecord, ConnectionRecord  # noqa: E402
+from storage import StorageManager  # noqa: E402
+from wal import WriteAheadLog  # noqa: E402
+from websocket_manager import WebSocketManager  # noqa: E402
+from workers import PayloadWorkers, INLINE, THREAD, PROCESS  # noqa: E402
+from log_pipeline import LogPipeline, StructuredFormatter  # noqa: E402
+from api_routes import APIRoutes  # noqa: E402
+from admission import RateLimiter  # noqa: E402
+
+
+def make_routes():
+    """Build a fresh broker stack."""
+    storage = StorageManager()
+    ws_manager = WebSocketManager(storage)
+    return storage, ws_manager, APIRoutes(storage, ws_manager)
+
+
+def report(label, count, elapsed):
+    """Print a single benchmark line."""
+    rate = count / elapsed if elapsed else float("inf")
+    print(f"  {label:<40} {elapsed * 1000:9.1f} ms  {rate:12.0f} items/s")
+
+
+def http_client():
+    """In-process HTTP client for the broker app (needs httpx for TestClient)."""
+    from fastapi.testclient import TestClient
+    import main
+    return TestClient(main.app)
+
+
+async def bench_bulk(count=500):
+    """Single-item vs bulk registration and enqueue over the HTTP API."""
+    print(f"\n📦 Bulk vs single-item ({count} devices, {count} documents)")
+    client = http_client()
+
+    def devices(prefix):
+        return [
+            {"device_name": f"{prefix}-{i}", "device_type": "android", "ip_address": f"10.0.{i // 250}.{i % 250}"}
+            for i in range(count)
+        ]
+
+    start = time.perf_counter()
+    for item in devices("Single"):
+        client.post("/register_device", json=item)
+    single = time.perf_counter() - start
+    report("POST /register_device x N", count, single)
+
+    start = time.perf_counter()
+    client.post("/register_devices", json={"devices": devices("Bulk")})
+    bulk = time.perf_counter() - start
+    report("POST /register_devices", count, bulk)
+    print(f"  speedup: {single / bulk:.1f}x")
+
+    windows_id = client.post("/register_device", json={
+        "device_name": "Bench-PC", "device_type": "windows", "ip_address": "10.1.0.1"
+    }).json()["device_id"]
+    documents = [
+        {"name": f"contract-{i}.pdf", "windows_device_id": windows_id, "pdf_data": "JVBERi0xLjQK"}
+        for i in range(count)
+    ]
+
+    start = time.perf_counter()
+    for item in documents:
+        client.post("/enqueue_doc", json=item)
+    single = time.perf_counter() - start
+    report("POST /enqueue_doc x N", count, single)
+
+    start = time.perf_counter()
+    client.post("/enqueue_docs", json={"documents": documents})
+    bulk = time.perf_counter() - start
+    report("POST /enqueue_docs", count, bulk)
+    print(f"  speedup: {single / bulk:.1f}x")
+    print("  (in-process transport; real network round trips widen the gap)")
+
+
+async def bench_response_cache(device_count=1000, requests=300):
+    """GET /devices/online served from the response cache vs rebuilt every time."""
+    print(f"\n🗄️  Response cache ({device_count} devices, {requests} requests)")
+    client = http_client()
+    import main
+    client.post("/register_devices", json={"devices": [
+        {"device_name": f"Cache-{i}", "device_type": "android", "ip_address": "10.2.0.1"}
+        for i in range(device_count)
+    ]})
+
+    cache = main.api_routes.response_cache
+    for label, enabled in (("uncached", False), ("cached", True)):
+        main.api_routes.response_cache = cache if enabled else None
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.get("/devices/online", params={"device_type": "android"})
+        report(f"GET /devices/online ({label})", requests, time.perf_counter() - start)
+    print(f"  {cache.stats()}")
+
+
+async def bench_recovery(record_count=200000, batch=1000):
+    """Write-ahead log append rate and restart time from log only vs snapshot + tail."""
+    print(f"\n💾 Write-ahead log recovery ({record_count} records)")
+    directory = tempfile.mkdtemp(prefix="signik-bench-")
+    try:
+        storage = StorageManager()
+        wal = WriteAheadLog(directory, snapshot_every=10 ** 12)
+        storage.add_listener(wal.record)
+        windows_id = str(uuid.uuid4())
+        await storage.add_device(Device(
+            id=windows_id, name="Bench-PC", device_type=DeviceType.WINDOWS,
+            ip_address="10.3.0.1", last_heartbeat=datetime.now()
+        ))
+
+        async def write(count):
+            now = datetime.now()
+            for offset in range(0, count, batch):
+                await storage.add_documents([
+                    Document(
+                        id=str(uuid.uuid4()), name=f"doc-{i}.pdf", status=DocStatus.QUEUED,
+                        created_at=now, updated_at=now, windows_device_id=windows_id
+                    )
+                    for i in range(offset, min(offset + batch, count))
+                ])
+
+        start = time.perf_counter()
+        await write(record_count)
+        wal.sync()
+        report("append (fsync=interval)", record_count, time.perf_counter() - start)
+        wal.close()
+
+        recovered = StorageManager()
+        result = await WriteAheadLog(directory).recover(recovered)
+        report("recover from log only", result.replayed, result.seconds)
+
+        start = time.perf_counter()
+        await wal.snapshot(storage)
+        report("snapshot", record_count, time.perf_counter() - start)
+        await write(record_count // 10)
+        wal.close()
+
+        recovered = StorageManager()
+        result = await WriteAheadLog(directory).recover(recovered)
+        report(f"recover from snapshot + {result.replayed} tail", len(recovered.documents), result.seconds)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"  on disk: {size / 1e6:.1f} MB")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def allocated_per_item(build, count):
+    """Bytes still allocated per item after building ``count`` items."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [build(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return (after - before) / count
+
+
+async def bench_memory(count=100000):
+    """Memory per stored entity: pydantic models vs the compact storage records."""
+    print(f"\n🧮 Memory per record ({count} of each)")
+    windows_ids = [str(uuid.uuid4()) for _ in range(100)]
+
+    def device_fields(i):
+        return dict(
+            id=str(uuid.uuid4()), name=f"Tablet-{i}", device_type=DeviceType.ANDROID,
+            ip_address="10.0.0.1", last_heartbeat=datetime.now()
+        )
+
+    def connection_fields(i):
+        # Device IDs arrive as fresh strings (parsed from requests), as in the API
+        return dict(
+            id=str(uuid.uuid4()), windows_device_id="".join(windows_ids[i % 100]),
+            android_device_id=str(uuid.uuid4()), status=ConnectionStatus.CONNECTED,
+            created_at=datetime.now(), updated_at=datetime.now(),
+            initiated_by="".join(windows_ids[i % 100])
+        )
+
+    def document_fields(i):
+        return dict(
+            id=str(uuid.uuid4()), name=f"contract-{i}.pdf", status=DocStatus.QUEUED,
+            created_at=datetime.now(), updated_at=datetime.now(),
+            windows_device_id="".join(windows_ids[i % 100])
+        )
+
+    for label, model, record, fields in (
+        ("device", Device, DeviceRecord, device_fields),
+        ("connection", DeviceConnection, ConnectionRecord, connection_fields),
+        ("document", Document, DocumentRecord, document_fields),
+    ):
+        before = allocated_per_item(lambda i: model(**fields(i)), count)
+        after = allocated_per_item(lambda i: record(**fields(i)), count)
+        print(f"  {label:<12} pydantic {before:7.0f} B   record {after:7.0f} B   ({before / after:.1f}x smaller)")
+
+
+async def sample_loop_lag(stop, interval=0.001):
+    """Scheduling delays of a task that wakes every ``interval`` until ``stop`` is set."""
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+    return sorted(lags)
+
+
+async def bench_offload(uploads=16, size=8 * 1024 * 1024):
+    """Event-loop lag while concurrent uploads decode their base64 PDFs."""
+    print(f"\n🧵 Loop lag under {uploads} concurrent {size // (1024 * 1024)} MiB uploads")
+    pdf_data = base64.b64encode(os.urandom(size)).decode()
+    for mode in (INLINE, THREAD, PROCESS):
+        workers = PayloadWorkers(mode)
+        storage = StorageManager()
+        routes = APIRoutes(storage, WebSocketManager(storage, workers=workers))
+        windows = Device(
+            id=str(uuid.uuid4()), name="PC", device_type=DeviceType.WINDOWS,
+            ip_address="10.0.0.1", last_heartbeat=datetime.now()
+        )
+        await storage.add_device(windows)
+        requests = [
+            EnqueueDocRequest(name=f"upload-{i}.pdf", windows_device_id=windows.id, pdf_data=pdf_data)
+            for i in range(uploads)
+        ]
+
+        stop = asyncio.Event()
+        probe = asyncio.create_task(sample_loop_lag(stop))
+        await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        await asyncio.gather(*(routes.enqueue_document(request) for request in requests))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        lags = await probe
+        workers.close()
+        p99 = lags[int(len(lags) * 0.99)] * 1000
+        print(f"  {mode:<8} max lag {lags[-1] * 1000:7.1f} ms   p99 {p99:6.1f} ms   "
+              f"{uploads * size / elapsed / 1e6:7.1f} MB/s decoded")
+
+
+class NullSocket:
+    """Stands in for a connected WebSocket."""
+
+    async def send_text(self, text):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+
+async def route_frames(count):
+    """Route ``count`` forwarded messages and binary frames between a paired PC and tablet."""
+    storage = StorageManager()
+    ws_manager = WebSocketManager(storage)
+    now = datetime.now()
+    pc, tablet = (
+        Device(id=str(uuid.uuid4()), name=name, device_type=device_type,
+               ip_address="10.0.0.1", last_heartbeat=now)
+        for name, device_type in (("PC", DeviceType.WINDOWS), ("Tab", DeviceType.ANDROID))
+    )
+    await storage.add_devices([pc, tablet])
+    for device in (pc, tablet):
+        ws_manager.connections[device.id] = NullSocket()
+    ws_manager.selector.last_target[pc.id] = tablet.id
+    message = SignikMessage(type="connectionRequest", device_id=tablet.id, sender_device_id=pc.id)
+    frame = os.urandom(1024)
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await ws_manager.route_message(message, None)
+        await ws_manager.route_binary_data(frame, pc.id)
+    return time.perf_counter() - start
+
+
+async def bench_logging(count=20000):
+    """Routing throughput with logging off, written inline, queued, and queued with sampling."""
+    print(f"\n📝 Routing {count} messages and {count} binary frames")
+    devnull = open(os.devnull, "w")
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    try:
+        report("logging off", count * 2, await route_frames(count))
+        logging.disable(logging.NOTSET)
+
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(StructuredFormatter())
+        root.handlers[:] = [handler]
+        root.setLevel(logging.INFO)
+        report("written on the event loop", count * 2, await route_frames(count))
+
+        for label, per_second in (("queued", 0), ("queued, sampled at 50/s per category", 50)):
+            pipeline = LogPipeline("INFO", per_second, handler=logging.StreamHandler(devnull))
+            pipeline.start()
+            elapsed = await route_frames(count)
+            pipeline.stop()
+            report(label, count * 2, elapsed)
+    finally:
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+        logging.disable(logging.CRITICAL)
+        devnull.close()
+
+
+class SlowSocket(NullSocket):
+    """A viewer that needs ``delay`` seconds per message."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = []
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.received.append(text)
+
+
+async def bench_previews(count=120, per_second=60, viewer_delay=0.05):
+    """Signature previews from a fast signer to a slow viewer, forwarded latest-wins."""
+    print(f"\n✍️  {count} previews at {per_second}/s to a viewer taking {viewer_delay * 1000:.0f} ms each")
+    for max_per_second in (15.0, 0.0):
+        storage = StorageManager()
+        ws_manager = WebSocketManager(storage, preview_max_per_second=max_per_second)
+        now = datetime.now()
+        pc, tablet = (
+            Device(id=str(uuid.uuid4()), name=name, device_type=device_type,
+                   ip_address="10.0.0.1", last_heartbeat=now)
+            for name, device_type in (("PC", DeviceType.WINDOWS), ("Tab", DeviceType.ANDROID))
+        )
+        await storage.add_devices([pc, tablet])
+        viewer = SlowSocket(viewer_delay)
+        ws_manager.connections[pc.id] = viewer
+        doc = Document(
+            id=str(uuid.uuid4()), name="contract.pdf", status=DocStatus.SENT,
+            windows_device_id=pc.id, android_device_id=tablet.id, created_at=now, updated_at=now
+        )
+        await storage.add_document(doc)
+
+        writes = 0
+
+        def count_writes(event):
+            nonlocal writes
+            writes += event.collection == "documents"
+        storage.add_listener(count_writes)
+
+        start = time.perf_counter()
+        for i in range(count):
+            await ws_manager.route_message(SignikMessage(
+                type="signaturePreview", doc_id=doc.id, sender_device_id=tablet.id,
+                data={"points": i}
+            ), None)
+            await asyncio.sleep(1 / per_second)
+        while ws_manager.previews.stats()["active_documents"]:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        stats = ws_manager.previews.stats()
+        newest = {"points": count - 1}
+        shown = SignikMessage.model_validate_json(viewer.received[-1]).data == newest
+        stored = (await storage.get_document(doc.id)).signature_data == newest
+        label = f"{max_per_second:g}/s" if max_per_second else "unlimited"
+        print(f"  {label:<10} delivered {stats['delivered']:4}  coalesced {stats['coalesced']:4}  "
+              f"document writes {writes:3}  in {elapsed:5.2f} s  newest shown/stored: {shown}/{stored}")
+
+
+def draw_signature(strokes=6, points=80, per_message=4):
+    """Batches of new points as a tablet would report them: (stroke index, points) per message."""
+    batches = []
+    for stroke in range(strokes):
+        path = [[round(100 + stroke * 60 + i * 0.7, 1), round(50 + 20 * ((i % 17) - 8) / 8, 1)]
+                for i in range(points)]
+        for i in range(0, points, per_message):
+            batches.append((stroke, path[i:i + per_message]))
+    return batches
+
+
+async def bench_strokes():
+    """Bytes on the wire per signature: full previews vs incremental strokes."""
+    batches = draw_signature()
+    print(f"\n🖊️  One signature: {len(batches)} updates of 4 points, {len(batches) * 4} points")
+    storage = StorageManager()
+    ws_manager = WebSocketManager(storage)
+    now = datetime.now()
+    pc, tablet = (
+        Device(id=str(uuid.uuid4()), name=name, device_type=device_type,
+               ip_address="10.0.0.1", last_heartbeat=now)
+        for name, device_type in (("PC", DeviceType.WINDOWS), ("Tab", DeviceType.ANDROID))
+    )
+    await storage.add_devices([pc, tablet])
+    doc = Document(
+        id=str(uuid.uuid4()), name="contract.pdf", status=DocStatus.SENT,
+        windows_device_id=pc.id, android_device_id=tablet.id, created_at=now, updated_at=now
+    )
+    await storage.add_document(doc)
+
+    strokes, preview_bytes, stroke_bytes = [], 0, 0
+    start = time.perf_counter()
+    for seq, (stroke, points) in enumerate(batches, 1):
+        if stroke == len(strokes):
+            strokes.append([])
+        strokes[stroke].extend(points)
+        preview = SignikMessage(type="signaturePreview", doc_id=doc.id, sender_device_id=tablet.id,
+                                data={"strokes": strokes})
+        preview_bytes += len(preview.model_dump_json())
+        message = SignikMessage(type="signatureStroke", doc_id=doc.id, sender_device_id=tablet.id,
+                                data={"seq": seq, "segments": [{"stroke": stroke, "points": points}]})
+        stroke_bytes += len(message.model_dump_json())
+        await ws_manager.route_message(message, None)
+    elapsed = time.perf_counter() - start
+    snapshot = ws_manager.strokes.snapshot(doc.id)
+    assert snapshot["strokes"] == strokes
+
+    print(f"  {'full previews':<24} {preview_bytes:9} bytes  {preview_bytes / len(batches):8.0f} per update")
+    print(f"  {'incremental strokes':<24} {stroke_bytes:9} bytes  {stroke_bytes / len(batches):8.0f} per update"
+          f"  ({preview_bytes / stroke_bytes:.1f}x less)")
+    print(f"  {'snapshot for a late viewer':<24} {len(json.dumps(snapshot)):9} bytes")
+    report("strokes accumulated", len(batches), elapsed)
+
+
+class CountingSocket(NullSocket):
+    """Counts the messages, frames and bytes a device receives."""
+
+    def __init__(self):
+        self.texts = self.frames = self.bytes = 0
+
+    async def send_text(self, text):
+        self.texts += 1
+        self.bytes += len(text)
+
+    async def send_bytes(self, data):
+        self.frames += 1
+        self.bytes += len(data)
+
+
+async def bench_bundles(visits=50, per_visit=8, size=64 * 1024):
+    """A visit's documents enqueued and sent one by one vs as one bundle."""
+    print(f"\n📚 {visits} visits of {per_visit} documents ({size // 1024} KiB each)")
+    pdf_data = base64.b64encode(os.urandom(size)).decode()
+    for label in ("one by one", "bundled"):
+        storage = StorageManager()
+        ws_manager = WebSocketManager(storage, max_inflight_per_tablet=per_visit)
+        routes = APIRoutes(storage, ws_manager)
+        now = datetime.now()
+        pc, tablet = (
+            Device(id=str(uuid.uuid4()), name=name, device_type=device_type,
+                   ip_address="10.0.0.1", last_heartbeat=now)
+            for name, device_type in (("PC", DeviceType.WINDOWS), ("Tab", DeviceType.ANDROID))
+        )
+        await storage.add_devices([pc, tablet])
+        pc_socket, tablet_socket = CountingSocket(), CountingSocket()
+        ws_manager.connections.update({pc.id: pc_socket, tablet.id: tablet_socket})
+
+        requests = 0
+        start = time.perf_counter()
+        for _ in range(visits):
+            if label == "bundled":
+                response = await routes.enqueue_bundle(EnqueueBundleRequest(
+                    windows_device_id=pc.id,
+                    documents=[BundleItem(name=f"form-{i}.pdf", pdf_data=pdf_data) for i in range(per_visit)]
+                ))
+                await ws_manager.route_message(SignikMessage(
+                    type="bundleStart", bundle_id=response.bundle_id, sender_device_id=pc.id
+                ), None)
+                doc_ids, requests = response.doc_ids, requests + 2
+            else:
+                doc_ids = []
+                for i in range(per_visit):
+                    response = await routes.enqueue_document(
+                        EnqueueDocRequest(name=f"form-{i}.pdf", windows_device_id=pc.id, pdf_data=pdf_data)
+                    )
+                    await ws_manager.route_message(SignikMessage(
+                        type="sendStart", doc_id=response.doc_id, sender_device_id=pc.id, device_id=tablet.id
+                    ), None)
+                    doc_ids.append(response.doc_id)
+                requests += per_visit * 2
+            for doc_id in doc_ids:
+                await ws_manager.route_message(SignikMessage(
+                    type="signatureAccepted", doc_id=doc_id, sender_device_id=pc.id
+                ), None)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<11} {requests / visits:4.0f} PC requests, {tablet_socket.texts / visits:4.0f} messages "
+              f"+ {tablet_socket.frames / visits:2.0f} frames to the tablet, "
+              f"{pc_socket.texts / visits:3.0f} messages to the PC per visit   {elapsed * 1000 / visits:6.1f} ms/visit")
+
+
+async def bench_search(count=1_000_000, repeat=20):
+    """Search latency over ``count`` documents, against filtering the full list."""
+    print(f"\n🔎 Search over {count} documents")
+    rng = random.Random(3)
+    kinds = ["invoice", "contract", "nda", "consent", "lease", "waiver", "receipt", "order"]
+    customers = [f"{rng.choice('bcdfghklmnprstvw')}{rng.choice('aeiou')}{rng.choice('lmnrst')}"
+                 f"{rng.choice('aeiou')}{rng.choice('dknrsz')}{i}" for i in range(5000)]
+    statuses = list(DocStatus)
+    now = datetime.now()
+    storage = StorageManager()
+    start = time.perf_counter()
+    batch = []
+    for i in range(count):
+        batch.append(DocumentRecord(
+            id=str(uuid.uuid4()), name=f"{rng.choice(kinds)}-{rng.choice(customers)}-{i}.pdf",
+            status=rng.choice(statuses), created_at=now, updated_at=now
+        ))
+        if len(batch) == 10000:
+            await storage.add_documents(batch)
+            batch = []
+    if batch:
+        await storage.add_documents(batch)
+    print(f"  indexed in {time.perf_counter() - start:.1f} s")
+
+    customer = customers[42]
+    queries = [
+        ("exact number", str(count // 2), None),
+        ("customer prefix", customer[:4], None),
+        ("kind + customer", f"invoice {customer}", None),
+        ("kind, status filter", "contract", DocStatus.SIGNED),
+        ("one letter", "w", None),
+    ]
+    for label, query, status in queries:
+        timings = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            total, page = storage.search_documents(query, status, limit=50)
+            timings.append(time.perf_counter() - t)
+        timings.sort()
+        print(f"  {label:<22} q={query!r:<22} {total:7} matches  "
+              f"p50 {timings[len(timings) // 2] * 1000:8.2f} ms  max {timings[-1] * 1000:8.2f} ms")
+
+    t = time.perf_counter()
+    names = [doc for doc in storage.documents.values() if customer in doc.name.lower()]
+    print(f"  {'full scan (before)':<22} q={customer!r:<22} {len(names):7} matches  "
+          f"     {(time.perf_counter() - t) * 1000:8.2f} ms")
+
+
+async def bench_admission(devices=10000, seconds=10, flood_per_second=2000):
+    """One device floods while 10k others send a frame a second; simulated clock."""
+    print(f"\n🚦 Admission control: 1 device at {flood_per_second}/s among {devices} at 1/s")
+    keys = [f"tablet-{i}" for i in range(devices)]
+    for label, limiter in (
+        ("no limits", RateLimiter()),
+        ("per device 20/s", RateLimiter(20, 40)),
+        ("per device 20/s + global 8000/s", RateLimiter(20, 40, 8000, 8000)),
+    ):
+        quiet_admitted = quiet_sent = flood_admitted = 0
+        checks = 0
+        elapsed = 0.0
+        for second in range(seconds):
+            for i in range(devices):
+                now = second + i / devices
+                t = time.perf_counter()
+                admitted = not limiter.check(keys[i], now)
+                if i % (devices // flood_per_second or 1) == 0:
+                    flood_admitted += not limiter.check("noisy", now)
+                    checks += 1
+                elapsed += time.perf_counter() - t
+                quiet_sent += 1
+                quiet_admitted += admitted
+                checks += 1
+        print(f"  {label:<34} quiet admitted {quiet_admitted / quiet_sent:6.1%}  "
+              f"flood admitted {flood_admitted:6}  {elapsed / checks * 1e9:6.0f} ns/check")
+
+
+async def bench_client(count=300, concurrency=10):
+    """signik_client against a local uvicorn: a connection per call vs the pooled client, then bulk."""
+    import httpx
+    import uvicorn
+    import main
+    from signik_client import DeviceType as ClientDeviceType, SignikClient
+
+    print(f"\n🔗 Async client: {count} enqueues, {concurrency} at a time, over local TCP")
+    clients = set()  # (host, port) of every TCP connection the server saw
+
+    async def counting_app(scope, receive, send):
+        if scope["type"] == "http":
+            clients.add(tuple(scope["client"]))
+        await main.app(scope, receive, send)
+
+    port = 18000 + os.getpid() % 1000
+    url = f"http://127.0.0.1:{port}"
+    server = uvicorn.Server(uvicorn.Config(counting_app, host="127.0.0.1", port=port, log_level="critical", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    def line(label, items, elapsed):
+        print(f"  {label:<34} {elapsed * 1000:8.1f} ms  {items / elapsed:8.0f} docs/s  {len(clients):4} connections")
+        clients.clear()
+
+    try:
+        async with SignikClient(url) as client:
+            pc = await client.register_device("Bench-Client-PC", ClientDeviceType.WINDOWS, "10.0.0.1")
+        clients.clear()
+        slots = asyncio.Semaphore(concurrency)
+
+        # Like requests.post: a new TCP connection for every call
+        async with httpx.AsyncClient(base_url=url, limits=httpx.Limits(max_keepalive_connections=0)) as http:
+            async def fresh_connection(i):
+                async with slots:
+                    response = await http.post("/enqueue_doc", json={"name": f"fresh-{i}.pdf", "windows_device_id": pc})
+                    response.raise_for_status()
+
+            t = time.perf_counter()
+            await asyncio.gather(*(fresh_connection(i) for i in range(count)))
+            line("new connection per call", count, time.perf_counter() - t)
+
+        async with SignikClient(url, max_connections=concurrency) as client:
+            async def pooled(i):
+                async with slots:
+                    await client.enqueue_document(pc, f"pooled-{i}.pdf")
+
+            t = time.perf_counter()
+            await asyncio.gather(*(pooled(i) for i in range(count)))
+            line("pooled keep-alive connections", count, time.perf_counter() - t)
+
+            documents = [{"name": f"bulk-{i}.pdf", "windows_device_id": pc} for i in range(count * 10)]
+            t = time.perf_counter()
+            result = await client.enqueue_documents(documents, batch_size=count)
+            assert result.succeeded == len(documents)
+            line(f"pipelined bulk ({len(documents) // count} batches)", len(documents), time.perf_counter() - t)
+        print("  (loopback: each connection saved is a TCP handshake, plus TLS, on a real network)")
+    finally:
+        server.should_exit = True
+        await task
+
+
+async def bench_presence(pcs=50, tablets_per_pc=4, seconds=3.0, poll_interval=0.1, flap_share=0.25):
+    """PCs polling /devices/online vs presence pushes while a share of the tablets flaps; time runs 20x fast."""
+    print(f"\n📶 Presence: {pcs} PCs with {tablets_per_pc} tablets each, {flap_share:.0%} of tablets flapping")
+    storage, ws_manager, routes = make_routes()
+    ws_manager.presence.online_delay, ws_manager.presence.offline_delay = 0.05, 0.25  # 1 s and 5 s at 20x
+    now = datetime.now()
+    pc_ids, tablet_ids = [], []
+    for i in range(pcs):
+        pc = Device(id=str(uuid.uuid4()), name=f"PC-{i}", device_type=DeviceType.WINDOWS,
+                    ip_address="10.0.0.1", last_heartbeat=now)
+        await storage.add_device(pc)
+        pc_ids.append(pc.id)
+        for j in range(tablets_per_pc):
+            tablet = Device(id=str(uuid.uuid4()), name=f"Tab-{i}-{j}", device_type=DeviceType.ANDROID,
+                            ip_address="10.0.0.2", last_heartbeat=now)
+            await storage.add_device(tablet)
+            await storage.add_connection(DeviceConnection(
+                id=str(uuid.uuid4()), windows_device_id=pc.id, android_device_id=tablet.id,
+                status=ConnectionStatus.CONNECTED, created_at=now, updated_at=now, initiated_by=pc.id
+            ))
+            tablet_ids.append(tablet.id)
+
+    sockets = {}
+    for pc_id in pc_ids:
+        sockets[pc_id] = ws_manager.connections[pc_id] = CountingSocket()
+        await ws_manager.route_message(SignikMessage(
+            type="subscribe", data={"topic": "presence"}, sender_device_id=pc_id
+        ), None)
+
+    rng = random.Random(7)
+    flapping = rng.sample(tablet_ids, int(len(tablet_ids) * flap_share))
+
+    async def flap():
+        # Drop and return every 10-40 ms for the first half, then settle either way
+        deadline = time.perf_counter() + seconds / 2
+        online = dict.fromkeys(flapping, True)
+        while time.perf_counter() < deadline:
+            for tablet_id in flapping:
+                if rng.random() < 0.5:
+                    online[tablet_id] = not online[tablet_id]
+                    await storage.update_device_status(tablet_id, online[tablet_id])
+            await asyncio.sleep(rng.uniform(0.01, 0.04))
+
+    polls = {"requests": 0, "bytes": 0, "etag_bytes": 0}
+
+    async def poll():
+        # Every PC gets the same /devices/online body, so one request per tick stands for all of them
+        deadline = time.perf_counter() + seconds
+        etag = None
+        while time.perf_counter() < deadline:
+            response = await routes.get_online_devices(DeviceType.ANDROID)
+            conditional = await routes.get_online_devices(DeviceType.ANDROID, if_none_match=etag)
+            etag = conditional.headers.get("etag", etag)
+            polls["requests"] += pcs
+            polls["bytes"] += pcs * len(response.body)
+            polls["etag_bytes"] += pcs * len(conditional.body)
+            await asyncio.sleep(poll_interval)
+
+    await asyncio.gather(flap(), poll())
+    await asyncio.sleep(0.3)  # Let the last changes settle
+    stats = ws_manager.presence.stats()
+    pushes = sum(socket.texts for socket in sockets.values())
+    pushed_bytes = sum(socket.bytes for socket in sockets.values())
+    print(f"  {'tablet online/offline flips':<34} {stats['flips']:8}")
+    print(f"  {'polling every 2 s (simulated)':<34} {polls['requests']:8} requests  {polls['bytes']:10} bytes")
+    print(f"  {'polling with If-None-Match':<34} {polls['requests']:8} requests  {polls['etag_bytes']:10} bytes")
+    print(f"  {'presence subscription':<34} {pushes:8} messages  {pushed_bytes:10} bytes"
+          f"  ({stats['published']} changes, {pcs} snapshots)")
+
+
+SCENARIOS = {
+    "bulk": bench_bulk,
+    "cache": bench_response_cache,
+    "recovery": bench_recovery,
+    "memory": bench_memory,
+    "offload": bench_offload,
+    "logging": bench_logging,
+    "previews": bench_previews,
+    "strokes": bench_strokes,
+    "bundles": bench_bundles,
+    "search": bench_search,
+    "admission": bench_admission,
+    "client": bench_client,
+    "presence": bench_presence,
+}
+
+
+async def main(names):
+    """Run the selected scenarios (all by default)."""
+    print("🚀 Signik Broker benchmarks")
+    print("=" * 50)
+    for name in names or SCENARIOS:
+        await SCENARIOS[name]()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main(sys.argv[1:]))
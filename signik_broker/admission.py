@@ -0,0 +1,134 @@
+"""Admission control: token buckets on requests and frames, caps on queued documents.
+
+Each device has a token bucket refilled at ``rate`` tokens per second up to
+``burst``, and all devices share a global one; a request or frame takes a
+token from both. Buckets are refilled lazily when checked, so a check is
+O(1) and nothing runs in the background. A rate of 0 disables a bucket.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import math
+import time
+
+# Rejection reasons
+DEVICE = "device"
+GLOBAL = "global"
+
+# Retry-After sent when a device's queue is full: documents leave it at signing speed, not token speed
+QUEUE_RETRY_SECONDS = 30
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After value: whole seconds, at least 1."""
+    return str(max(1, math.ceil(seconds)))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token: 0 if one was available, else seconds until there is one."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    """Per-device and global token buckets for one kind of traffic.
+
+    Up to ``max_devices`` per-device buckets are kept, least recently used
+    first out; a device whose bucket was dropped starts again with a full one.
+    """
+
+    def __init__(
+        self,
+        per_device_rate: float = 0.0,
+        per_device_burst: float = 1.0,
+        global_rate: float = 0.0,
+        global_burst: float = 1.0,
+        max_devices: int = 10000
+    ):
+        self.per_device_rate = per_device_rate
+        self.per_device_burst = max(1.0, per_device_burst)
+        self.max_devices = max_devices
+        self._global = TokenBucket(global_rate, max(1.0, global_burst), 0.0) if global_rate > 0 else None
+        self._devices: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.admitted = 0
+        self.rejected = {DEVICE: 0, GLOBAL: 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_device_rate > 0 or self._global is not None
+
+    def check(self, key: str, now: Optional[float] = None) -> float:
+        """Admit one request from ``key``: 0 if admitted, else seconds to wait before retrying."""
+        if now is None:
+            now = time.monotonic()
+        bucket = None
+        if self.per_device_rate > 0:
+            bucket = self._devices.get(key)
+            if bucket is None:
+                bucket = self._devices[key] = TokenBucket(self.per_device_rate, self.per_device_burst, now)
+                if len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+            else:
+                self._devices.move_to_end(key)
+            wait = bucket.take(now)
+            if wait:
+                self.rejected[DEVICE] += 1
+                return wait
+        if self._global is not None:
+            wait = self._global.take(now)
+            if wait:
+                if bucket is not None:
+                    bucket.refund()  # Not the device's fault
+                self.rejected[GLOBAL] += 1
+                return wait
+        self.admitted += 1
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "devices": len(self._devices)
+        }
+
+
+class AdmissionControl:
+    """Rate limits on REST requests and WebSocket frames, and the per-device queue cap."""
+
+    def __init__(
+        self,
+        rest: Optional[RateLimiter] = None,
+        websocket: Optional[RateLimiter] = None,
+        max_queued_per_device: int = 0
+    ):
+        self.rest = rest or RateLimiter()
+        self.websocket = websocket or RateLimiter()
+        self.max_queued_per_device = max_queued_per_device
+        self.queue_rejected = 0
+
+    def queue_has_room(self, queued: int, adding: int = 1) -> bool:
+        """Whether a Windows device with ``queued`` documents waiting may enqueue ``adding`` more (0 = no cap)."""
+        return not self.max_queued_per_device or queued + adding <= self.max_queued_per_device
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rest": self.rest.stats(),
+            "websocket": self.websocket.stats(),
+            "queue": {"max_per_device": self.max_queued_per_device, "rejected": self.queue_rejected}
+        }
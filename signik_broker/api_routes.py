@@ -1,33 +1,80 @@
 """API route handlers for Signik Broker."""
 import uuid
-import base64
+from collections import Counter
 from datetime import datetime
-from typing import Optional
-from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+from fastapi import HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+import asyncio
 import json
 import logging
 
 from models import (
     Device, Document, DeviceConnection, DeviceType, DocStatus, ConnectionStatus,
     RegisterDeviceRequest, RegisterDeviceResponse, EnqueueDocRequest, EnqueueDocResponse,
+    EnqueueBundleRequest, EnqueueBundleResponse,
+    BulkRegisterDevicesRequest, BulkEnqueueDocsRequest, BulkItemResult, BulkOperationResponse,
     ConnectDeviceRequest, UpdateConnectionRequest, DeviceListResponse, 
-    DocumentListResponse, ConnectionListResponse, SignikMessage
+    DocumentListResponse, ConnectionListResponse
 )
 from storage import StorageManager
+from response_cache import ResponseCache
+from events import EventFilter, DEVICES, DOCUMENTS, CONNECTIONS
 from websocket_manager import WebSocketManager
+from bundles import manifest
+from admission import AdmissionControl, QUEUE_RETRY_SECONDS, retry_after_header
+from workers import decode_base64, parse_message
+from log_pipeline import CategoryLogger, CONNECTION, DISPATCH
 
 logger = logging.getLogger(__name__)
+connection_log = CategoryLogger(logger, CONNECTION)
+dispatch_log = CategoryLogger(logger, DISPATCH)
+
+
+def _first_error(error: ValidationError) -> str:
+    """Summarise a pydantic validation error as a single line."""
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first.get("loc", ()))
+    return f"{location}: {first.get('msg')}" if location else first.get("msg", "Invalid item")
+
+
+def _encode_json(body: BaseModel) -> bytes:
+    """Encode a response model to compact JSON bytes."""
+    return body.json().encode()
+
+
+def _etag(*parts: Any) -> str:
+    """Weak ETag built from collection versions."""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value matches the current ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
 
 
 class APIRoutes:
     """Handles all API route logic."""
     
-    def __init__(self, storage: StorageManager, ws_manager: WebSocketManager):
+    def __init__(
+        self,
+        storage: StorageManager,
+        ws_manager: WebSocketManager,
+        response_cache: Optional[ResponseCache] = None,
+        admission: Optional[AdmissionControl] = None
+    ):
         self.storage = storage
         self.ws_manager = ws_manager
+        self.response_cache = response_cache
+        self.admission = admission or AdmissionControl()
+        self.workers = ws_manager.workers
     
-    async def register_device(self, request: RegisterDeviceRequest) -> RegisterDeviceResponse:
-        """Register a new device or update existing one."""
+    async def _build_device(self, request: RegisterDeviceRequest) -> tuple[Device, bool]:
+        """Build the device record for a registration, reusing an existing one if present."""
         # Check for existing device (deduplication)
         existing_device = await self.storage.find_device_by_name_and_type(
             request.device_name, 
@@ -39,35 +86,30 @@ class APIRoutes:
             existing_device.ip_address = request.ip_address
             existing_device.last_heartbeat = datetime.now()
             existing_device.is_online = True
-            await self.storage.add_device(existing_device)
-            
-            logger.info(f"Updated existing device: {existing_device.name} ({existing_device.id})")
-            return RegisterDeviceResponse(
-                device_id=existing_device.id,
-                message="Device updated successfully",
-                is_update=True
-            )
+            return existing_device, True
         
         # Create new device
-        device_id = str(uuid.uuid4())
         device = Device(
-            id=device_id,
+            id=str(uuid.uuid4()),
             name=request.device_name,
             device_type=request.device_type,
             ip_address=request.ip_address,
             last_heartbeat=datetime.now()
         )
-        await self.storage.add_device(device)
-        
-        logger.info(f"Registered new device: {device.name} ({device.id})")
-        return RegisterDeviceResponse(
-            device_id=device_id,
-            message="Device registered successfully",
-            is_update=False
-        )
+        return device, False
     
-    async def enqueue_document(self, request: EnqueueDocRequest) -> EnqueueDocResponse:
-        """Add a document to the signing queue."""
+    def _check_queue(self, windows_device_id: str, adding: int = 1) -> None:
+        """Reject an enqueue that would take a Windows device past its queued document cap."""
+        if not self.admission.queue_has_room(self.storage.stats.queued_for(windows_device_id), adding):
+            self.admission.queue_rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many queued documents (at most {self.admission.max_queued_per_device} per device)",
+                headers={"Retry-After": retry_after_header(QUEUE_RETRY_SECONDS)}
+            )
+    
+    async def _build_document(self, request: EnqueueDocRequest, bundle_id: Optional[str] = None) -> Document:
+        """Validate an enqueue request and build the document record."""
         # Validate Windows device exists
         windows_device = await self.storage.get_device(request.windows_device_id)
         if not windows_device:
@@ -80,65 +122,330 @@ class APIRoutes:
         pdf_data = None
         if request.pdf_data:
             try:
-                pdf_data = base64.b64decode(request.pdf_data)
+                pdf_data = await self.workers.run(decode_base64, len(request.pdf_data), request.pdf_data)
             except Exception as e:
-                logger.error(f"Failed to decode PDF data: {e}")
+                logger.error("Failed to decode PDF data: %s", e)
                 raise HTTPException(status_code=400, detail="Invalid PDF data encoding")
         
         # Create document
-        doc_id = str(uuid.uuid4())
-        document = Document(
-            id=doc_id,
+        return Document(
+            id=str(uuid.uuid4()),
             name=request.name,
             status=DocStatus.QUEUED,
             created_at=datetime.now(),
             updated_at=datetime.now(),
             windows_device_id=request.windows_device_id,
-            pdf_data=pdf_data
+            pdf_data=pdf_data,
+            bundle_id=bundle_id
+        )
+    
+    async def register_device(self, request: RegisterDeviceRequest) -> RegisterDeviceResponse:
+        """Register a new device or update existing one."""
+        device, is_update = await self._build_device(request)
+        await self.storage.add_device(device)
+        
+        if is_update:
+            logger.info("Updated existing device: %s (%s)", device.name, device.id, extra={"device_id": device.id})
+            return RegisterDeviceResponse(
+                device_id=device.id,
+                message="Device updated successfully",
+                is_update=True
+            )
+        
+        logger.info("Registered new device: %s (%s)", device.name, device.id, extra={"device_id": device.id})
+        return RegisterDeviceResponse(
+            device_id=device.id,
+            message="Device registered successfully",
+            is_update=False
         )
+    
+    async def enqueue_document(self, request: EnqueueDocRequest) -> EnqueueDocResponse:
+        """Add a document to the signing queue."""
+        self._check_queue(request.windows_device_id)
+        document = await self._build_document(request)
         await self.storage.add_document(document)
         
-        logger.info(f"Document '{request.name}' enqueued with ID: {doc_id}")
+        dispatch_log.info("Document '%s' enqueued with ID: %s", request.name, document.id, extra={
+            "device_id": request.windows_device_id, "doc_id": document.id
+        })
         return EnqueueDocResponse(
-            doc_id=doc_id,
+            doc_id=document.id,
             message="Document enqueued successfully"
         )
     
-    async def get_devices(self, device_type: Optional[DeviceType] = None) -> DeviceListResponse:
-        """Get all registered devices."""
-        devices = await self.storage.get_all_devices(device_type=device_type)
-        return DeviceListResponse(
-            devices=[d.dict() for d in devices],
-            total=len(devices)
+    async def register_devices_bulk(self, request: BulkRegisterDevicesRequest) -> BulkOperationResponse:
+        """Register or update many devices, writing them in one storage transaction."""
+        results: list[BulkItemResult] = []
+        batch: dict[tuple[str, DeviceType], Device] = {}
+        
+        for index, item in enumerate(request.devices):
+            try:
+                item_request = RegisterDeviceRequest.parse_obj(item)
+            except ValidationError as e:
+                results.append(BulkItemResult(index=index, success=False, error=_first_error(e)))
+                continue
+            
+            key = (item_request.device_name, item_request.device_type)
+            if key in batch:
+                # Same device listed twice in one batch: update the pending record
+                device, is_update = batch[key], True
+                device.ip_address = item_request.ip_address
+                device.last_heartbeat = datetime.now()
+            else:
+                device, is_update = await self._build_device(item_request)
+                batch[key] = device
+            
+            results.append(BulkItemResult(
+                index=index,
+                success=True,
+                id=device.id,
+                message="Device updated successfully" if is_update else "Device registered successfully"
+            ))
+        
+        if batch:
+            await self.storage.add_devices(list(batch.values()))
+        
+        succeeded = sum(1 for r in results if r.success)
+        logger.info("Bulk registration: %d succeeded, %d failed", succeeded, len(results) - succeeded)
+        return BulkOperationResponse(
+            results=results,
+            succeeded=succeeded,
+            failed=len(results) - succeeded
         )
     
-    async def get_online_devices(self, device_type: Optional[DeviceType] = None) -> DeviceListResponse:
-        """Get only online devices."""
-        devices = await self.storage.get_all_devices(
-            device_type=device_type,
-            online_only=True
+    async def enqueue_documents_bulk(self, request: BulkEnqueueDocsRequest) -> BulkOperationResponse:
+        """Enqueue many documents, writing them in one storage transaction."""
+        results: list[BulkItemResult] = []
+        documents: list[Document] = []
+        accepted: Counter = Counter()  # Documents of this batch per Windows device
+        
+        for index, item in enumerate(request.documents):
+            try:
+                item_request = EnqueueDocRequest.parse_obj(item)
+                self._check_queue(item_request.windows_device_id, accepted[item_request.windows_device_id] + 1)
+                document = await self._build_document(item_request)
+            except ValidationError as e:
+                results.append(BulkItemResult(index=index, success=False, error=_first_error(e)))
+                continue
+            except HTTPException as e:
+                results.append(BulkItemResult(index=index, success=False, error=e.detail))
+                continue
+            
+            documents.append(document)
+            accepted[document.windows_device_id] += 1
+            results.append(BulkItemResult(
+                index=index,
+                success=True,
+                id=document.id,
+                message="Document enqueued successfully"
+            ))
+        
+        if documents:
+            await self.storage.add_documents(documents)
+        
+        logger.info("Bulk enqueue: %d succeeded, %d failed", len(documents), len(results) - len(documents))
+        return BulkOperationResponse(
+            results=results,
+            succeeded=len(documents),
+            failed=len(results) - len(documents)
+        )
+    
+    async def enqueue_bundle(self, request: EnqueueBundleRequest) -> EnqueueBundleResponse:
+        """Enqueue a bundle: all of its documents are written in one transaction, or none."""
+        self._check_queue(request.windows_device_id, len(request.documents))
+        bundle_id = str(uuid.uuid4())
+        documents = await asyncio.gather(*(
+            self._build_document(
+                EnqueueDocRequest(windows_device_id=request.windows_device_id, **item.model_dump()),
+                bundle_id
+            )
+            for item in request.documents
+        ))
+        await self.storage.add_documents(documents)
+        
+        dispatch_log.info("Bundle %s enqueued with %d documents", bundle_id, len(documents),
+                          extra={"device_id": request.windows_device_id})
+        return EnqueueBundleResponse(
+            bundle_id=bundle_id,
+            doc_ids=[document.id for document in documents],
+            message="Bundle enqueued successfully"
         )
-        return DeviceListResponse(
-            devices=[d.dict() for d in devices],
-            total=len(devices)
+    
+    async def get_bundle(self, bundle_id: str) -> dict:
+        """Bundle manifest with the status of each document."""
+        documents = await self.storage.get_bundle(bundle_id)
+        if not documents:
+            raise HTTPException(status_code=404, detail="Bundle not found")
+        
+        return {"windows_device_id": documents[0].windows_device_id, **manifest(bundle_id, documents)}
+    
+    async def _select_entities(
+        self,
+        collection: str,
+        lookup: Callable[[str], Optional[Any]],
+        matches: Callable[[Any], bool],
+        full_list: Callable[[], Awaitable[list]],
+        since: Optional[int]
+    ) -> tuple[list, Optional[list[str]]]:
+        """Entities for a list endpoint: all of them, or only those changed since a version.
+        
+        For a delta the second element lists IDs the client should drop:
+        deleted entities and ones that no longer match the filters. It is None
+        for a full listing (including when ``since`` is too old for a delta).
+        """
+        if since is not None:
+            delta = self.storage.versions.changed_since(collection, since)
+            if delta is not None:
+                changed_ids, removed = delta
+                entities = []
+                for entity_id in changed_ids:
+                    entity = lookup(entity_id)
+                    if entity is not None and matches(entity):
+                        entities.append(entity)
+                    else:
+                        removed.append(entity_id)
+                return entities, removed
+        return await full_list(), None
+    
+    def _versioned(self, collection: str, entity: Any) -> dict:
+        """Entity as a dict tagged with its version."""
+        data = entity.to_dict()
+        data["version"] = self.storage.versions.entity_version(collection, entity.id)
+        return data
+    
+    async def _device_list(
+        self,
+        device_type: Optional[DeviceType],
+        online_only: bool,
+        since: Optional[int],
+        if_none_match: Optional[str]
+    ) -> Response:
+        """Shared implementation of the device list endpoints.
+        
+        Full listings are served from the response cache.
+        """
+        if since is None and self.response_cache:
+            entry = await self.response_cache.get_or_build(
+                ("devices", device_type, online_only),
+                (DEVICES,),
+                lambda: self._encode_device_list(device_type, online_only, None)
+            )
+            if _etag_matches(if_none_match, entry.etag):
+                return Response(status_code=304, headers={"ETag": entry.etag})
+            return Response(entry.body, media_type="application/json", headers={"ETag": entry.etag})
+        
+        etag = _etag(DEVICES, self.storage.versions.version(DEVICES))
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        body, etag = await self._encode_device_list(device_type, online_only, since)
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+    
+    async def _encode_device_list(
+        self,
+        device_type: Optional[DeviceType],
+        online_only: bool,
+        since: Optional[int]
+    ) -> tuple[bytes, str]:
+        """Build and encode a device list body with its ETag."""
+        version = self.storage.versions.version(DEVICES)
+        devices, removed = await self._select_entities(
+            DEVICES,
+            self.storage.devices.get,
+            lambda d: (not device_type or d.device_type == device_type) and (not online_only or d.is_online),
+            lambda: self.storage.get_all_devices(device_type=device_type, online_only=online_only),
+            since
+        )
+        body = DeviceListResponse(
+            devices=[self._versioned(DEVICES, d) for d in devices],
+            total=len(devices),
+            version=version,
+            removed=removed
         )
+        return _encode_json(body), _etag(DEVICES, version)
+    
+    async def get_devices(
+        self,
+        device_type: Optional[DeviceType] = None,
+        since: Optional[int] = None,
+        if_none_match: Optional[str] = None
+    ) -> Response:
+        """Get all registered devices."""
+        return await self._device_list(device_type, False, since, if_none_match)
+    
+    async def get_online_devices(
+        self,
+        device_type: Optional[DeviceType] = None,
+        since: Optional[int] = None,
+        if_none_match: Optional[str] = None
+    ) -> Response:
+        """Get only online devices."""
+        return await self._device_list(device_type, True, since, if_none_match)
     
-    async def get_documents(self, status: Optional[DocStatus] = None) -> DocumentListResponse:
+    async def get_documents(
+        self,
+        status: Optional[DocStatus] = None,
+        since: Optional[int] = None,
+        if_none_match: Optional[str] = None
+    ) -> Response:
         """Get all documents."""
-        documents = await self.storage.get_all_documents(status=status)
+        etag = _etag(DOCUMENTS, self.storage.versions.version(DOCUMENTS))
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        documents, removed = await self._select_entities(
+            DOCUMENTS,
+            self.storage.documents.get,
+            lambda d: not status or d.status == status,
+            lambda: self.storage.get_all_documents(status=status),
+            since
+        )
         # Exclude binary data from response
         docs_data = []
         for doc in documents:
-            doc_dict = doc.dict()
+            doc_dict = self._versioned(DOCUMENTS, doc)
             doc_dict.pop('pdf_data', None)
             doc_dict.pop('signature_data', None)
             docs_data.append(doc_dict)
         
-        return DocumentListResponse(
+        body = DocumentListResponse(
             documents=docs_data,
-            total=len(documents)
+            total=len(documents),
+            version=self.storage.versions.version(DOCUMENTS),
+            removed=removed
         )
+        return Response(_encode_json(body), media_type="application/json", headers={"ETag": etag})
     
+    async def get_document_strokes(self, doc_id: str) -> dict:
+        """Signature strokes received so far for a document being signed."""
+        if not await self.storage.get_document(doc_id):
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        return {"doc_id": doc_id, **self.ws_manager.strokes.snapshot(doc_id)}
+
+    async def get_document_timeline(self, doc_id: str) -> dict:
+        """Status changes and routing decisions of a document, oldest first."""
+        if not await self.storage.get_document(doc_id):
+            raise HTTPException(status_code=404, detail="Document not found")
+
+        events = self.ws_manager.timeline.document(doc_id)
+        return {"doc_id": doc_id, "events": [event.to_dict() for event in events]}
+
+    def get_timeline(
+        self,
+        start: datetime,
+        end: Optional[datetime],
+        kind: Optional[str],
+        device_id: Optional[str],
+        limit: int
+    ) -> dict:
+        """Timeline events of every document between two times."""
+        end = end or datetime.now()
+        if end <= start:
+            raise HTTPException(status_code=400, detail="end must be after start")
+
+        result = self.ws_manager.timeline.query(start.timestamp(), end.timestamp(), kind, device_id, limit)
+        return {"start": start.isoformat(), "end": end.isoformat(), **result}
+
     async def heartbeat(self, device_id: str) -> dict:
         """Process device heartbeat."""
         success = await self.storage.update_device_heartbeat(device_id)
@@ -192,11 +499,12 @@ class APIRoutes:
         message = {
             "type": "connectionRequest",
             "connection_id": connection_id,
-            "from_device": source_device.dict()
+            "from_device": source_device.to_dict()
         }
         await self.ws_manager.send_to_device(request.target_device_id, message)
         
-        logger.info(f"Connection request from {source_device.name} to {target_device.name}")
+        connection_log.info("Connection request from %s to %s", source_device.name, target_device.name,
+                            extra={"device_id": device_id})
         return {"connection_id": connection_id, "message": "Connection request sent"}
     
     async def get_device_connections(self, device_id: str) -> dict:
@@ -214,8 +522,8 @@ class APIRoutes:
                              else conn.windows_device_id)
             other_device = await self.storage.get_device(other_device_id)
             
-            conn_data = conn.dict()
-            conn_data["other_device"] = other_device.dict() if other_device else None
+            conn_data = conn.to_dict()
+            conn_data["other_device"] = other_device.to_dict() if other_device else None
             connections_data.append(conn_data)
         
         return {"connections": connections_data}
@@ -243,12 +551,32 @@ class APIRoutes:
             message
         )
         
-        logger.info(f"Connection {connection_id} status updated to {request.status.value}")
+        connection_log.info("Connection %s status updated to %s", connection_id, request.status.value)
         return {"message": f"Connection status updated to {request.status.value}"}
     
-    async def get_all_connections(self, status: Optional[ConnectionStatus] = None) -> ConnectionListResponse:
+    async def get_all_connections(
+        self,
+        status: Optional[ConnectionStatus] = None,
+        since: Optional[int] = None,
+        if_none_match: Optional[str] = None
+    ) -> Response:
         """Get all device connections."""
-        connections = await self.storage.get_all_connections(status=status)
+        # Connections embed device details, so device changes also change the ETag
+        etag = _etag(
+            CONNECTIONS,
+            self.storage.versions.version(CONNECTIONS),
+            self.storage.versions.version(DEVICES)
+        )
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        connections, removed = await self._select_entities(
+            CONNECTIONS,
+            self.storage.device_connections.get,
+            lambda c: not status or c.status == status,
+            lambda: self.storage.get_all_connections(status=status),
+            since
+        )
         
         # Enrich with device information
         connections_data = []
@@ -256,15 +584,18 @@ class APIRoutes:
             windows_device = await self.storage.get_device(conn.windows_device_id)
             android_device = await self.storage.get_device(conn.android_device_id)
             
-            conn_data = conn.dict()
-            conn_data["windows_device"] = windows_device.dict() if windows_device else None
-            conn_data["android_device"] = android_device.dict() if android_device else None
+            conn_data = self._versioned(CONNECTIONS, conn)
+            conn_data["windows_device"] = windows_device.to_dict() if windows_device else None
+            conn_data["android_device"] = android_device.to_dict() if android_device else None
             connections_data.append(conn_data)
         
-        return ConnectionListResponse(
+        body = ConnectionListResponse(
             connections=connections_data,
-            total=len(connections)
+            total=len(connections),
+            version=self.storage.versions.version(CONNECTIONS),
+            removed=removed
         )
+        return Response(_encode_json(body), media_type="application/json", headers={"ETag": etag})
     
     async def delete_connection(self, connection_id: str) -> dict:
         """Remove a device connection."""
@@ -288,9 +619,91 @@ class APIRoutes:
         if not success:
             raise HTTPException(status_code=500, detail="Failed to delete connection")
         
-        logger.info(f"Connection {connection_id} removed")
+        connection_log.info("Connection %s removed", connection_id)
         return {"message": "Connection removed successfully"}
     
+    def search(
+        self,
+        q: str,
+        collection: str = DOCUMENTS,
+        status: Optional[DocStatus] = None,
+        device_type: Optional[DeviceType] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> dict:
+        """Documents or devices by name (word prefixes), one page at a time."""
+        if collection == DOCUMENTS:
+            total, records = self.storage.search_documents(q, status, limit, offset)
+            results = []
+            for doc in records:
+                doc_dict = doc.to_dict()
+                doc_dict.pop('pdf_data', None)
+                doc_dict.pop('signature_data', None)
+                results.append(doc_dict)
+        else:
+            total, records = self.storage.search_devices(q, device_type, limit, offset)
+            results = [device.to_dict() for device in records]
+        return {
+            "collection": collection,
+            "query": q,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "results": results
+        }
+    
+    def get_stats(self) -> dict:
+        """Broker statistics, all read from incrementally maintained counters."""
+        stats = self.storage.stats.snapshot()
+        stats["websocket_connections"] = len(self.ws_manager.connections)
+        stats["change_feed"] = {"last_event_id": self.storage.changes.last_seq}
+        if self.response_cache:
+            stats["response_cache"] = self.response_cache.stats()
+        return stats
+    
+    def stream_events(
+        self,
+        device_id: Optional[str] = None,
+        status: Optional[str] = None,
+        collection: Optional[str] = None,
+        last_event_id: Optional[int] = None
+    ) -> StreamingResponse:
+        """Server-Sent Events stream of storage changes."""
+        event_filter = EventFilter(
+            device_id=device_id,
+            status=status,
+            collections=[collection] if collection else None
+        )
+        return StreamingResponse(
+            self._event_stream(event_filter, last_event_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    async def _event_stream(
+        self,
+        event_filter: EventFilter,
+        last_event_id: Optional[int],
+        keepalive_seconds: float = 15.0
+    ) -> AsyncIterator[str]:
+        """Yield SSE frames until the client goes away or falls too far behind."""
+        subscription = self.storage.changes.subscribe(event_filter, last_event_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                batch = await subscription.next_batch(timeout=keepalive_seconds)
+                if subscription.lagged:
+                    # Client must reload its collections and resume from scratch
+                    yield f"event: resync\ndata: {json.dumps({'last_event_id': self.storage.changes.last_seq})}\n\n"
+                    return
+                if not batch:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in batch:
+                    yield f"id: {event.seq}\nevent: {event.type}\ndata: {json.dumps(event.to_public())}\n\n"
+        finally:
+            self.storage.changes.unsubscribe(subscription)
+    
     async def handle_websocket(self, websocket: WebSocket, device_id: str) -> None:
         """Handle WebSocket connection for a device."""
         # Connect
@@ -300,29 +713,48 @@ class APIRoutes:
         # Update device status
         await self.storage.update_device_status(device_id, True)
         
+        throttled = False  # Told the device it is rate limited; not repeated until a frame gets through
         try:
             while True:
                 # Receive message (text or binary)
                 message_data = await websocket.receive()
+                if message_data["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message_data.get("code", 1000))
+                
+                # Binary frames carry the PDFs of a transfer whose text message was admitted:
+                # dropping one would corrupt it without the peer ever knowing, so only text is limited
+                retry_after = self.admission.websocket.check(device_id) if "text" in message_data else 0
+                if retry_after:
+                    if not throttled:
+                        throttled = True
+                        logger.warning("Rate limiting WebSocket frames from %s", device_id, extra={"device_id": device_id})
+                        await self.ws_manager.send_to_device(device_id, {
+                            "type": "rateLimited",
+                            "retry_after": round(retry_after, 3)
+                        })
+                    continue
+                throttled = False
                 
                 if "text" in message_data:
                     # Handle JSON message
                     try:
-                        message = SignikMessage.parse_raw(message_data["text"])
+                        text = message_data["text"]
+                        message = await self.workers.run(parse_message, len(text), text)
                         message.sender_device_id = device_id
                         await self.ws_manager.route_message(message, websocket)
                     except Exception as e:
-                        logger.error(f"Error parsing message from {device_id}: {e}")
+                        logger.error("Error parsing message from %s: %s", device_id, e, extra={"device_id": device_id})
                 
                 elif "bytes" in message_data:
                     # Handle binary data
                     await self.ws_manager.route_binary_data(message_data["bytes"], device_id)
         
         except WebSocketDisconnect:
-            logger.info(f"Device {device_id} disconnected")
+            connection_log.info("Device %s disconnected", device_id, extra={"device_id": device_id})
         except Exception as e:
-            logger.error(f"WebSocket error for device {device_id}: {e}")
+            logger.error("WebSocket error for device %s: %s", device_id, e, extra={"device_id": device_id})
         finally:
             # Cleanup
             self.ws_manager.disconnect(device_id)
-            await self.storage.update_device_status(device_id, False)
\ No newline at end of file
+            await self.storage.update_device_status(device_id, False)
+            await self.ws_manager.reschedule_pending(device_id)
\ No newline at end of file
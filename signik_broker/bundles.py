@@ -0,0 +1,51 @@
+"""Document bundles: several documents signed together in one visit.
+
+A bundle has no record of its own. Its documents carry the ``bundle_id``
+and StorageManager indexes them by it, so bundles survive restarts and
+replicate with the documents. Progress is derived from document statuses.
+"""
+from collections import Counter
+from typing import Any, Dict, List
+
+from models import DocStatus
+
+# Bundle progress
+QUEUED = "queued"
+IN_PROGRESS = "in_progress"
+COMPLETE = "complete"
+
+# Statuses in which a bundle document counts as signed
+SIGNED_STATUSES = (DocStatus.SIGNED, DocStatus.DELIVERED)
+
+
+def is_complete(documents: List[Any]) -> bool:
+    """Whether every document of a bundle is signed."""
+    return bool(documents) and all(doc.status in SIGNED_STATUSES for doc in documents)
+
+
+def bundle_status(documents: List[Any]) -> str:
+    if is_complete(documents):
+        return COMPLETE
+    if all(doc.status == DocStatus.QUEUED for doc in documents):
+        return QUEUED
+    return IN_PROGRESS
+
+
+def manifest(bundle_id: str, documents: List[Any]) -> Dict[str, Any]:
+    """The bundle's documents in order, with their status; ``stream_id`` numbers their PDF frames."""
+    return {
+        "bundle_id": bundle_id,
+        "status": bundle_status(documents),
+        "counts": dict(Counter(doc.status.value for doc in documents)),
+        "documents": [
+            {
+                "doc_id": doc.id,
+                "name": doc.name,
+                "status": doc.status.value,
+                "android_device_id": doc.android_device_id,
+                "bytes": len(doc.pdf_data) if doc.pdf_data else 0,
+                "stream_id": stream_id
+            }
+            for stream_id, doc in enumerate(documents)
+        ]
+    }
@@ -0,0 +1,60 @@
+"""Runtime configuration for Signik Broker."""
+import os
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class BrokerConfig(BaseModel):
+    """Broker settings, each overridable via a SIGNIK_<NAME> environment variable."""
+    routing_strategy: Literal["least_loaded", "round_robin"] = "least_loaded"
+    max_inflight_per_tablet: int = Field(1, ge=1)
+    document_lease_seconds: float = Field(300.0, gt=0)
+    dispatch_mode: Literal["single", "parallel"] = "single"
+    parallel_offers: int = Field(3, ge=2)  # Tablets a document is offered to at once in parallel mode
+    change_history_size: int = Field(10000, ge=1)
+    response_cache_coalesce_seconds: float = Field(0.0, ge=0)
+    response_cache_heartbeat_seconds: float = Field(5.0, ge=0)  # How stale last_heartbeat may be in cached lists
+    wal_dir: Optional[str] = None  # Write-ahead log and snapshots; disabled when unset
+    wal_fsync: Literal["always", "interval", "never"] = "interval"
+    wal_snapshot_every: int = Field(100000, ge=1)
+    wal_segment_bytes: int = Field(64 * 1024 * 1024, ge=4096)
+    role: Literal["primary", "follower"] = "primary"
+    replication_listen: Optional[str] = None  # unix:<path> or tcp:<host>:<port> to serve followers on
+    replication_primary: Optional[str] = None  # Address a follower replicates from
+    replication_secret: Optional[str] = None  # Shared key authenticating replication frames; required over TCP
+    payload_pool: Literal["thread", "process", "inline"] = "thread"
+    payload_workers: int = Field(2, ge=1)
+    payload_offload_bytes: int = Field(256 * 1024, ge=0)  # Smaller payloads are decoded inline
+    loop_lag_interval_seconds: float = Field(0.1, gt=0)
+    loop_lag_threshold_seconds: float = Field(0.25, gt=0)  # Log the loop's stack when blocked this long
+    profile_max_seconds: float = Field(30.0, gt=0)
+    preview_max_per_second: float = Field(15.0, ge=0)  # Per document; 0 forwards as fast as the viewer takes them
+    preview_store_interval_seconds: float = Field(1.0, ge=0)
+    timeline_bucket_seconds: float = Field(60.0, gt=0)
+    timeline_retention_seconds: float = Field(86400.0, gt=0)
+    timeline_max_events: int = Field(200000, ge=1)
+    presence_online_delay_seconds: float = Field(1.0, ge=0)  # Online this long before peers are told
+    presence_offline_delay_seconds: float = Field(5.0, ge=0)  # Offline this long before peers are told
+    rest_rate_per_device: float = Field(0.0, ge=0)  # Requests per second per client; 0 disables the limit
+    rest_burst_per_device: int = Field(20, ge=1)
+    rest_rate_global: float = Field(0.0, ge=0)
+    rest_burst_global: int = Field(200, ge=1)
+    ws_rate_per_device: float = Field(0.0, ge=0)  # Incoming WebSocket text frames per second per device
+    ws_burst_per_device: int = Field(100, ge=1)
+    ws_rate_global: float = Field(0.0, ge=0)
+    ws_burst_global: int = Field(1000, ge=1)
+    max_queued_per_device: int = Field(0, ge=0)  # QUEUED documents per Windows device; 0 is unlimited
+    log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    log_sample_per_second: float = Field(50.0, ge=0)  # Per category of hot-path INFO logs; 0 keeps all
+    log_skip_caller_lookup: bool = True  # Sets logging._srcfile = None when the format has no caller fields
+
+    @classmethod
+    def from_env(cls) -> "BrokerConfig":
+        """Build the configuration from environment variables."""
+        values = {}
+        for name in cls.model_fields:
+            value = os.getenv(f"SIGNIK_{name.upper()}")
+            if value is not None:
+                values[name] = value
+        return cls(**values)
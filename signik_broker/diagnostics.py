@@ -0,0 +1,208 @@
+"""Event-loop lag monitoring and an on-demand sampling profiler.
+
+Both work from outside the code they observe: a task on the loop measures
+how late its timer fires, and a watchdog thread reads the loop thread's
+current frame (``sys._current_frames``) when that task stops ticking. The
+profiler samples frames the same way, so nothing is instrumented and the
+cost is one stack walk per sample.
+"""
+from collections import Counter
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the lag histogram buckets, in milliseconds
+LAG_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 5000)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def collapse_stack(frame) -> str:
+    """A frame and its callers as ``file:function:line`` entries, outermost first."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class LoopLagMonitor:
+    """Measures event-loop scheduling delay and reports what blocked it.
+
+    Every ``interval`` seconds a task records how late its sleep returned.
+    A watchdog thread checks that the task keeps ticking; once it has been
+    silent for ``threshold`` seconds, the loop thread's stack is logged
+    (once per stall), so the blocking call shows up while it is running.
+    The stall in progress is shared by the two threads under ``_stall_lock``.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25):
+        self.interval = interval
+        self.threshold = threshold
+        self._histogram = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self._samples = 0
+        self._total_lag = 0.0
+        self._max_lag = 0.0
+        self._stalls = 0
+        self._last_stall: Optional[Dict[str, Any]] = None
+        self._last_tick = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stalled_since: Optional[float] = None
+        self._stall_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="signik-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_tick = now = time.monotonic()
+            self.record(now - start - self.interval)
+
+    def record(self, lag: float) -> None:
+        """Add one scheduling delay sample (seconds)."""
+        lag = max(lag, 0.0)
+        lag_ms = lag * 1000
+        bucket = 0
+        while bucket < len(LAG_BUCKETS_MS) and lag_ms > LAG_BUCKETS_MS[bucket]:
+            bucket += 1
+        self._histogram[bucket] += 1
+        self._samples += 1
+        self._total_lag += lag
+        self._max_lag = max(self._max_lag, lag)
+        with self._stall_lock:
+            if self._stalled_since is not None:
+                self._last_stall["seconds"] = round(lag, 3)
+                self._stalled_since = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._check()
+
+    def _check(self) -> None:
+        """One watchdog pass: report a stall if the loop has been silent too long."""
+        tick = self._last_tick
+        silent = time.monotonic() - tick - self.interval
+        if silent < self.threshold or self._stalled_since is not None:
+            return
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        # Walking the stack takes a while; the loop may resume meanwhile
+        stack = traceback.format_stack(frame)
+        stall = {"at": time.time(), "seconds": None, "stack": collapse_stack(frame)}
+        with self._stall_lock:
+            if self._last_tick != tick:
+                return  # The loop caught up meanwhile
+            self._last_stall = stall
+            self._stalled_since = tick
+            self._stalls += 1
+        logger.warning("Event loop blocked for over %.0f ms, currently at:\n%s", silent * 1000, "".join(stack))
+
+    def stats(self) -> Dict[str, Any]:
+        labels = [f"le_{bound}ms" for bound in LAG_BUCKETS_MS] + ["inf"]
+        return {
+            "interval_seconds": self.interval,
+            "threshold_seconds": self.threshold,
+            "samples": self._samples,
+            "mean_ms": round(self._total_lag / self._samples * 1000, 3) if self._samples else 0.0,
+            "max_ms": round(self._max_lag * 1000, 3),
+            "histogram": dict(zip(labels, self._histogram)),
+            "stalls": self._stalls,
+            "last_stall": self._last_stall
+        }
+
+
+class SamplingProfiler:
+    """Time-boxed statistical profiler for the running process.
+
+    A background thread snapshots thread stacks every ``interval`` seconds
+    and counts identical stacks. Only one profile runs at a time.
+    """
+
+    def __init__(self, max_seconds: float = 30.0):
+        self.max_seconds = max_seconds
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(
+        self,
+        seconds: float,
+        interval: float = 0.005,
+        all_threads: bool = False,
+        top: int = 50
+    ) -> Dict[str, Any]:
+        """Sample for ``seconds`` (capped at ``max_seconds``) and return the most frequent stacks.
+
+        By default only the event loop thread is sampled.
+        """
+        seconds = min(max(seconds, interval), self.max_seconds)
+        async with self._lock:
+            target = None if all_threads else threading.get_ident()
+            samples = await asyncio.to_thread(self._sample, seconds, interval, target)
+        total = sum(samples.values())
+        return {
+            "seconds": seconds,
+            "interval_seconds": interval,
+            "samples": total,
+            "stacks": [
+                {"stack": stack, "count": count, "percent": round(count * 100 / total, 1)}
+                for stack, count in samples.most_common(top)
+            ]
+        }
+
+    @staticmethod
+    def _sample(seconds: float, interval: float, target: Optional[int]) -> Counter:
+        samples: Counter = Counter()
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own or (target is not None and ident != target):
+                    continue
+                stack = collapse_stack(frame)
+                if target is None:
+                    stack = f"{names.get(ident, ident)};{stack}"
+                samples[stack] += 1
+            del frames
+            time.sleep(interval)
+        return samples
+
+    @staticmethod
+    def collapsed(result: Dict[str, Any]) -> List[str]:
+        """Profile stacks in flamegraph.pl's collapsed format."""
+        return [f"{entry['stack']} {entry['count']}" for entry in result["stacks"]]
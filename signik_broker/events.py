@@ -0,0 +1,219 @@
+"""Storage change events and the in-memory change feed."""
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Collections
+DEVICES = "devices"
+DOCUMENTS = "documents"
+CONNECTIONS = "connections"
+
+# Operations: full entity state, partial field update, removal
+UPSERT = "upsert"
+UPDATE = "update"
+DELETE = "delete"
+
+# Fields never put on the feed (large binary payloads)
+PAYLOAD_FIELDS = ("pdf_data", "signature_data")
+
+
+@dataclass
+class ChangeEvent:
+    """A single mutation applied by StorageManager.
+
+    ``data`` holds the full entity for UPSERT, only the changed fields for
+    UPDATE and nothing for DELETE. Document and connection events always
+    carry the device IDs involved so they can be filtered by device.
+    """
+    seq: int
+    type: str
+    collection: str
+    op: str
+    entity_id: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+    def device_ids(self) -> Iterable[str]:
+        """Devices this event concerns."""
+        if self.collection == DEVICES:
+            return (self.entity_id,)
+        return tuple(
+            device_id for device_id in (
+                self.data.get("windows_device_id"), self.data.get("android_device_id")
+            ) if device_id
+        )
+
+    def to_public(self) -> Dict[str, Any]:
+        """JSON-ready representation without binary payloads."""
+        data = {}
+        for key, value in self.data.items():
+            if key in PAYLOAD_FIELDS:
+                continue
+            if hasattr(value, "isoformat"):
+                value = value.isoformat()
+            elif hasattr(value, "value"):
+                value = value.value
+            data[key] = value
+        return {
+            "id": self.seq,
+            "type": self.type,
+            "collection": self.collection,
+            "op": self.op,
+            "entity_id": self.entity_id,
+            "data": data,
+            "timestamp": self.timestamp
+        }
+
+
+class EventFilter:
+    """Subscriber-side filter on device, status and collection."""
+
+    def __init__(
+        self,
+        device_id: Optional[str] = None,
+        status: Optional[str] = None,
+        collections: Optional[Iterable[str]] = None,
+        include_heartbeats: bool = False
+    ):
+        self.device_id = device_id
+        self.status = status
+        self.collections = set(collections) if collections else None
+        self.include_heartbeats = include_heartbeats
+
+    def matches(self, event: ChangeEvent) -> bool:
+        if event.type == "heartbeat" and not self.include_heartbeats:
+            return False
+        if self.collections and event.collection not in self.collections:
+            return False
+        if self.device_id and self.device_id not in event.device_ids():
+            return False
+        if self.status:
+            status = event.data.get("status")
+            if status is None or getattr(status, "value", status) != self.status:
+                return False
+        return True
+
+
+class Subscription:
+    """A subscriber's pending events.
+
+    A subscriber that falls more than ``max_pending`` events behind is marked
+    lagged and should resume with its last event ID.
+    """
+
+    def __init__(self, event_filter: EventFilter, max_pending: int):
+        self.filter = event_filter
+        self.max_pending = max_pending
+        self.lagged = False
+        self._pending: Deque[ChangeEvent] = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, event: ChangeEvent) -> None:
+        if self.lagged or not self.filter.matches(event):
+            return
+        if len(self._pending) >= self.max_pending:
+            self.mark_lagged()
+        else:
+            self._pending.append(event)
+            self._ready.set()
+
+    def mark_lagged(self) -> None:
+        """Drop pending events and wake the subscriber to resync."""
+        self.lagged = True
+        self._pending.clear()
+        self._ready.set()
+
+    async def next_batch(self, timeout: Optional[float] = None) -> List[ChangeEvent]:
+        """Wait for pending events; returns an empty list on timeout or lag."""
+        if not self._pending and not self.lagged:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._ready.clear()
+        batch = list(self._pending)
+        self._pending.clear()
+        return batch
+
+
+class ChangeFeed:
+    """Fans storage change events out to subscribers with a bounded replay history.
+
+    Heartbeats would crowd the real changes out of the history, so only
+    the latest one per device is kept; it is enough to resume a subscriber
+    that asks for heartbeats (a follower) to the same state.
+    """
+
+    def __init__(self, history_size: int = 10000, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._history: Deque[ChangeEvent] = deque(maxlen=history_size)
+        self._subscriptions: Set[Subscription] = set()
+        self._heartbeats: Dict[str, ChangeEvent] = {}  # Latest heartbeat per device
+        self._last_seq = 0  # Newest event published, kept in history or not
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def reset(self, seq: int) -> None:
+        """Drop the history and restart it after ``seq`` (state restored from a snapshot).
+
+        Current subscribers are marked lagged so they resync.
+        """
+        self._history.clear()
+        self._heartbeats.clear()
+        self._last_seq = seq
+        for subscription in self._subscriptions:
+            subscription.mark_lagged()
+
+    def history(self) -> List[ChangeEvent]:
+        """Events kept for resuming, oldest first."""
+        return list(self._history)
+
+    def pending_events(self) -> List[ChangeEvent]:
+        """Events queued for subscribers that have not collected them yet."""
+        return [event for subscription in self._subscriptions for event in subscription._pending]
+
+    def publish(self, event: ChangeEvent) -> None:
+        """Storage listener: record the event and hand it to subscribers."""
+        self._last_seq = event.seq
+        if event.type == "heartbeat":
+            self._heartbeats[event.entity_id] = event
+        else:
+            self._history.append(event)
+        for subscription in self._subscriptions:
+            subscription.push(event)
+
+    def subscribe(
+        self,
+        event_filter: EventFilter,
+        last_event_id: Optional[int] = None,
+        max_pending: Optional[int] = None
+    ) -> Subscription:
+        """Start a subscription, replaying history after ``last_event_id`` if given.
+
+        If the requested ID has already fallen out of the history the
+        subscription starts out lagged, telling the client to resync.
+        """
+        subscription = Subscription(event_filter, max_pending or self.max_pending)
+        if last_event_id is not None:
+            oldest = self._history[0].seq if self._history else self.last_seq + 1
+            if last_event_id < oldest - 1:
+                subscription.lagged = True
+            else:
+                replay = [event for event in self._history if event.seq > last_event_id]
+                if event_filter.include_heartbeats:
+                    replay += [event for event in self._heartbeats.values() if event.seq > last_event_id]
+                    replay.sort(key=lambda event: event.seq)
+                for event in replay:
+                    subscription.push(event)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
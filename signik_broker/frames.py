@@ -0,0 +1,51 @@
+"""Binary WebSocket frame header for multiplexed document transfers.
+
+Tagged frames start with a fixed 22-byte big-endian header::
+
+    magic     2 bytes   b"SG"
+    version   uint8     FRAME_VERSION
+    flags     uint8     FLAG_* bits
+    stream_id uint16    sender-chosen stream number
+    doc_id    16 bytes  document UUID in binary form
+
+followed by the payload. Frames without the magic prefix are treated as
+legacy untagged data.
+"""
+from typing import NamedTuple, Optional
+import struct
+import uuid
+
+FRAME_MAGIC = b"SG"
+FRAME_VERSION = 1
+
+FLAG_FINAL = 0x01  # Last frame of the stream
+
+_HEADER = struct.Struct(">2sBBH16s")
+HEADER_SIZE = _HEADER.size
+
+
+class FrameHeader(NamedTuple):
+    """Decoded binary frame header."""
+    doc_id: str
+    stream_id: int
+    flags: int
+
+    @property
+    def is_final(self) -> bool:
+        return bool(self.flags & FLAG_FINAL)
+
+
+def pack_frame(doc_id: str, payload: bytes, stream_id: int = 0, flags: int = FLAG_FINAL) -> bytes:
+    """Prefix a payload with a frame header for the given document."""
+    header = _HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, stream_id, uuid.UUID(doc_id).bytes)
+    return header + payload
+
+
+def parse_frame_header(data: bytes) -> Optional[FrameHeader]:
+    """Decode the header of a tagged frame, or return None for untagged data."""
+    if len(data) < HEADER_SIZE or data[:2] != FRAME_MAGIC:
+        return None
+    _, version, flags, stream_id, doc_bytes = _HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        return None
+    return FrameHeader(str(uuid.UUID(bytes=doc_bytes)), stream_id, flags)
@@ -0,0 +1,196 @@
+"""Non-blocking structured logging with per-category sampling.
+
+Log calls on the event loop only create a record and put it on a queue; a
+background thread formats and writes it. Records stay unformatted until
+then (``msg % args`` runs on the writer thread), so hot paths should log
+with %-style arguments rather than f-strings. Structured fields are passed
+as ``extra`` and rendered as ``key=value`` pairs.
+
+High-frequency events are logged through a ``CategoryLogger``. Its INFO and
+DEBUG calls are rate limited per category with a token bucket; the next
+record that gets through reports how many were suppressed. Warnings, errors
+and plain loggers are never sampled.
+"""
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
+import atexit
+import logging
+import queue
+import time
+
+# Structured fields rendered after the message when a record carries them
+FIELDS = ("category", "device_id", "doc_id", "message_type", "bytes", "suppressed")
+
+# Hot-path categories
+ROUTE = "route"            # WebSocket messages routed between devices
+BINARY = "binary"          # Binary frames forwarded
+CONNECTION = "connection"  # WebSocket connects/disconnects and connection changes
+DISPATCH = "dispatch"      # Documents routed or queued for tablets
+
+DEFAULT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class StructuredFormatter(logging.Formatter):
+    """Standard line followed by the record's structured fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = [
+            f"{name}={getattr(record, name)}"
+            for name in FIELDS
+            if getattr(record, name, None) is not None
+        ]
+        return f"{line} [{' '.join(fields)}]" if fields else line
+
+
+class Sampler:
+    """Token bucket per category: ``per_second`` records on average, bursts up to ``burst``."""
+
+    def __init__(self, per_second: float, burst: Optional[float] = None):
+        self.per_second = per_second
+        self.burst = burst if burst is not None else max(per_second, 1.0)
+        self._buckets: Dict[str, List[float]] = {}  # category -> [tokens, last refill]
+        self._dropped: Counter = Counter()  # Suppressed since the last record let through
+        self.suppressed: Counter = Counter()
+
+    def allow(self, category: str) -> Optional[int]:
+        """None if this record should be dropped, else how many were dropped before it."""
+        if self.per_second <= 0:
+            return 0
+        now = time.monotonic()
+        bucket = self._buckets.get(category)
+        if bucket is None:
+            bucket = self._buckets[category] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.per_second)
+            bucket[1] = now
+        if bucket[0] < 1:
+            self._dropped[category] += 1
+            self.suppressed[category] += 1
+            return None
+        bucket[0] -= 1
+        return self._dropped.pop(category, 0)
+
+
+# Sampler of the running pipeline; categories are not sampled without one
+_sampler: Optional[Sampler] = None
+
+
+class CategoryLogger(logging.LoggerAdapter):
+    """Logger for one high-frequency category.
+
+    INFO and DEBUG calls are sampled before a record is created, so a
+    dropped call costs a token-bucket check and nothing else. The category
+    is added to the record's structured fields.
+    """
+
+    def __init__(self, logger: logging.Logger, category: str):
+        super().__init__(logger, {"category": category})
+        self.category = category
+
+    def log(self, level: int, msg: Any, *args: Any, **kwargs: Any) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        extra = {**(kwargs.get("extra") or {}), "category": self.category}
+        sampler = _sampler
+        if sampler is not None and level <= logging.INFO:
+            dropped = sampler.allow(self.category)
+            if dropped is None:
+                return
+            if dropped:
+                extra["suppressed"] = dropped
+        kwargs["extra"] = extra
+        self.logger.log(level, msg, *args, **kwargs)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records without formatting them first.
+
+    ``QueueHandler.prepare`` formats the message on the calling thread;
+    here only a traceback is rendered up front (it must be captured while
+    the exception is alive), the rest is left to the writer thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    """Routes the root logger through a queue to a background writer thread."""
+
+    def __init__(
+        self,
+        level: str = "INFO",
+        sample_per_second: float = 0.0,
+        handler: Optional[logging.Handler] = None,
+        fmt: str = DEFAULT_FORMAT,
+        skip_caller_lookup: bool = True
+    ):
+        self.level = level
+        self.skip_caller_lookup = skip_caller_lookup
+        self.queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.sampler = Sampler(sample_per_second)
+        self.handler = handler or logging.StreamHandler()
+        self.handler.setFormatter(StructuredFormatter(fmt))
+        self._queue_handler = DeferredQueueHandler(self.queue)
+        self._listener = QueueListener(self.queue, self.handler, respect_handler_level=True)
+        self._started = False
+        self._saved_switches: Optional[tuple] = None
+
+    def start(self) -> None:
+        """Replace the root logger's handlers with the queue, start the writer and sampling.
+
+        Record attributes the format does not use are not collected (see
+        "Optimization" in the logging HOWTO); looking up the caller's frame
+        is the most expensive part of creating a record. These are
+        process-wide switches in the ``logging`` module, so every logger in
+        the process is affected; ``stop`` puts the previous values back.
+        Turning off the caller lookup means setting the private
+        ``logging._srcfile``, which ``skip_caller_lookup=False`` leaves alone.
+        """
+        fmt = self.handler.formatter._fmt
+        if self._saved_switches is None:
+            self._saved_switches = (
+                logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing
+            )
+        uses_caller = any(field in fmt for field in ("pathname", "filename", "module", "lineno", "funcName"))
+        if self.skip_caller_lookup and not uses_caller:
+            logging._srcfile = None
+        logging.logThreads = "thread" in fmt
+        logging.logProcesses = "process" in fmt
+        logging.logMultiprocessing = "processName" in fmt
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(self._queue_handler)
+        root.setLevel(self.level)
+        self._listener.start()
+        global _sampler
+        _sampler = self.sampler
+        if not self._started:
+            atexit.register(self.stop)
+        self._started = True
+
+    def stop(self) -> None:
+        """Write out what is queued and stop the writer thread."""
+        global _sampler
+        if _sampler is self.sampler:
+            _sampler = None
+        if self._listener._thread is not None:
+            self._listener.stop()
+        logging.getLogger().removeHandler(self._queue_handler)
+        if self._saved_switches is not None:
+            (logging._srcfile, logging.logThreads, logging.logProcesses,
+             logging.logMultiprocessing) = self._saved_switches
+            self._saved_switches = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "sample_per_second": self.sampler.per_second,
+            "suppressed": dict(self.sampler.suppressed)
+        }
@@ -1,33 +1,106 @@
 """Signik Broker - FastAPI server for device and document management."""
 import asyncio
+import json
 import logging
+import time
 from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Optional
 
-from fastapi import FastAPI, WebSocket, Depends
+from fastapi import FastAPI, WebSocket, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 
 from models import (
     DeviceType, DocStatus, ConnectionStatus,
     RegisterDeviceRequest, EnqueueDocRequest, ConnectDeviceRequest,
-    UpdateConnectionRequest
+    UpdateConnectionRequest, BulkRegisterDevicesRequest, BulkEnqueueDocsRequest, EnqueueBundleRequest
 )
+from config import BrokerConfig
 from storage import StorageManager
+from response_cache import ResponseCache
+from events import DEVICES, DOCUMENTS, CONNECTIONS
 from websocket_manager import WebSocketManager
+from timeline import Timeline
+from wal import WriteAheadLog
+from replication import ReplicationServer, ReplicationClient
+from workers import PayloadWorkers
+from diagnostics import LoopLagMonitor, SamplingProfiler
+from memory import AllocationTracker, memory_report
+from log_pipeline import LogPipeline
+from admission import AdmissionControl, RateLimiter, retry_after_header
 from api_routes import APIRoutes
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+config = BrokerConfig.from_env()
+
+# Configure logging: records are written by a background thread
+log_pipeline = LogPipeline(
+    config.log_level, config.log_sample_per_second, skip_caller_lookup=config.log_skip_caller_lookup
 )
+log_pipeline.start()
 logger = logging.getLogger(__name__)
 
 # Global instances
-storage = StorageManager()
-ws_manager = WebSocketManager(storage)
-api_routes = APIRoutes(storage, ws_manager)
+storage = StorageManager(change_history_size=config.change_history_size)
+payload_workers = PayloadWorkers(
+    config.payload_pool,
+    workers=config.payload_workers,
+    offload_bytes=config.payload_offload_bytes
+)
+ws_manager = WebSocketManager(
+    storage,
+    routing_strategy=config.routing_strategy,
+    max_inflight_per_tablet=config.max_inflight_per_tablet,
+    lease_seconds=config.document_lease_seconds,
+    workers=payload_workers,
+    preview_max_per_second=config.preview_max_per_second,
+    preview_store_interval=config.preview_store_interval_seconds,
+    dispatch_mode=config.dispatch_mode,
+    parallel_offers=config.parallel_offers,
+    timeline=Timeline(
+        config.timeline_bucket_seconds,
+        config.timeline_retention_seconds,
+        config.timeline_max_events
+    ),
+    presence_online_delay=config.presence_online_delay_seconds,
+    presence_offline_delay=config.presence_offline_delay_seconds
+)
+response_cache = ResponseCache(
+    coalesce_seconds=config.response_cache_coalesce_seconds,
+    heartbeat_seconds=config.response_cache_heartbeat_seconds
+)
+storage.add_listener(response_cache.record)
+admission = AdmissionControl(
+    rest=RateLimiter(
+        config.rest_rate_per_device, config.rest_burst_per_device,
+        config.rest_rate_global, config.rest_burst_global
+    ),
+    websocket=RateLimiter(
+        config.ws_rate_per_device, config.ws_burst_per_device,
+        config.ws_rate_global, config.ws_burst_global
+    ),
+    max_queued_per_device=config.max_queued_per_device
+)
+api_routes = APIRoutes(storage, ws_manager, response_cache, admission)
+wal = WriteAheadLog(
+    config.wal_dir,
+    fsync=config.wal_fsync,
+    segment_bytes=config.wal_segment_bytes,
+    snapshot_every=config.wal_snapshot_every
+) if config.wal_dir else None
+if config.role == "follower" and not config.replication_primary:
+    raise ValueError("SIGNIK_REPLICATION_PRIMARY is required when SIGNIK_ROLE is follower")
+replica = ReplicationClient(
+    storage, config.replication_primary, wal=wal, secret=config.replication_secret
+) if config.role == "follower" else None
+replication_server = ReplicationServer(
+    storage, config.replication_listen, secret=config.replication_secret
+) if config.replication_listen else None
+primary_tasks: list[asyncio.Task] = []
+loop_monitor = LoopLagMonitor(config.loop_lag_interval_seconds, config.loop_lag_threshold_seconds)
+profiler = SamplingProfiler(config.profile_max_seconds)
+allocations = AllocationTracker()
 
 
 async def periodic_device_check():
@@ -36,26 +109,85 @@ async def periodic_device_check():
         try:
             await storage.check_device_timeouts(timeout_seconds=30)
         except Exception as e:
-            logger.error(f"Error in device check task: {e}")
+            logger.error("Error in device check task: %s", e)
         await asyncio.sleep(10)
 
 
+async def periodic_lease_check():
+    """Background task to requeue documents whose lease expired."""
+    while True:
+        try:
+            deadline = storage.next_lease_deadline()
+            if deadline is not None and deadline <= time.time():
+                await ws_manager.requeue_expired()
+        except Exception as e:
+            logger.error("Error in lease check task: %s", e)
+        await asyncio.sleep(1)
+
+
+async def periodic_wal_maintenance():
+    """Background task to flush the write-ahead log and snapshot it."""
+    while True:
+        try:
+            wal.sync()
+            if wal.snapshot_due:
+                await wal.snapshot(storage)
+        except Exception as e:
+            logger.error("Error in write-ahead log task: %s", e)
+        await asyncio.sleep(1)
+
+
+def is_read_only() -> bool:
+    """Whether this broker is a follower that has not been promoted."""
+    return replica is not None and replica.read_only
+
+
+async def start_primary():
+    """Start the work only the primary does: timeouts, leases and serving followers."""
+    primary_tasks.extend([
+        asyncio.create_task(periodic_device_check()),
+        asyncio.create_task(periodic_lease_check())
+    ])
+    if replication_server:
+        await replication_server.start()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
     # Startup
     logger.info("Starting Signik Broker...")
-    task = asyncio.create_task(periodic_device_check())
+    loop_monitor.start()
+    tasks = []
+    if wal:
+        await wal.recover(storage)
+        storage.add_listener(wal.record)
+        tasks.append(asyncio.create_task(periodic_wal_maintenance()))
+    if replica:
+        replica.start()
+    else:
+        await start_primary()
     
     yield
     
     # Shutdown
     logger.info("Shutting down Signik Broker...")
-    task.cancel()
-    try:
-        await task
-    except asyncio.CancelledError:
-        pass
+    if replica:
+        await replica.stop()
+    if replication_server:
+        await replication_server.stop()
+    tasks.extend(primary_tasks)
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    if wal:
+        wal.close()
+    payload_workers.close()
+    await loop_monitor.stop()
 
 
 # Create FastAPI app
@@ -76,6 +208,37 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def reject_writes_on_follower(request: Request, call_next):
+    """A follower serves reads only until it is promoted."""
+    if is_read_only() and request.method not in ("GET", "HEAD", "OPTIONS") and request.url.path != "/admin/promote":
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Read-only follower; send writes to the primary"},
+            headers={"Retry-After": "1"}
+        )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    """Token-bucket limits per client address and overall.
+
+    Keyed on the connection's address, not on anything the client sends,
+    so a caller cannot spread its requests over buckets of its own making.
+    """
+    if admission.rest.enabled:
+        client = request.client.host if request.client else ""
+        retry_after = admission.rest.check(client)
+        if retry_after:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": retry_after_header(retry_after)}
+            )
+    return await call_next(request)
+
+
 # Device Management Endpoints
 @app.post("/register_device", response_model=dict)
 async def register_device(request: RegisterDeviceRequest):
@@ -84,16 +247,31 @@ async def register_device(request: RegisterDeviceRequest):
     return response.dict()
 
 
+@app.post("/register_devices", response_model=dict)
+async def register_devices_bulk(request: BulkRegisterDevicesRequest):
+    """Register or update many devices in one request."""
+    response = await api_routes.register_devices_bulk(request)
+    return response.dict()
+
+
 @app.get("/devices")
-async def get_devices(device_type: Optional[DeviceType] = None):
+async def get_devices(
+    device_type: Optional[DeviceType] = None,
+    since: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """Get all registered devices."""
-    return await api_routes.get_devices(device_type)
+    return await api_routes.get_devices(device_type, since, if_none_match)
 
 
 @app.get("/devices/online")
-async def get_online_devices(device_type: Optional[DeviceType] = None):
+async def get_online_devices(
+    device_type: Optional[DeviceType] = None,
+    since: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """Get only online devices."""
-    return await api_routes.get_online_devices(device_type)
+    return await api_routes.get_online_devices(device_type, since, if_none_match)
 
 
 @app.post("/heartbeat/{device_id}")
@@ -110,10 +288,58 @@ async def enqueue_document(request: EnqueueDocRequest):
     return response.dict()
 
 
+@app.post("/enqueue_docs", response_model=dict)
+async def enqueue_documents_bulk(request: BulkEnqueueDocsRequest):
+    """Add many documents to the signing queue in one request."""
+    response = await api_routes.enqueue_documents_bulk(request)
+    return response.dict()
+
+
+@app.post("/enqueue_bundle", response_model=dict)
+async def enqueue_bundle(request: EnqueueBundleRequest):
+    """Add a bundle of documents, signed together in one visit, to the queue."""
+    response = await api_routes.enqueue_bundle(request)
+    return response.dict()
+
+
+@app.get("/bundles/{bundle_id}")
+async def get_bundle(bundle_id: str):
+    """Get a bundle's manifest and the status of each of its documents."""
+    return await api_routes.get_bundle(bundle_id)
+
+
 @app.get("/documents")
-async def get_documents(status: Optional[DocStatus] = None):
+async def get_documents(
+    status: Optional[DocStatus] = None,
+    since: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """Get all documents."""
-    return await api_routes.get_documents(status)
+    return await api_routes.get_documents(status, since, if_none_match)
+
+
+@app.get("/documents/{doc_id}/strokes")
+async def get_document_strokes(doc_id: str):
+    """Get the signature strokes received so far for a document."""
+    return await api_routes.get_document_strokes(doc_id)
+
+
+@app.get("/documents/{doc_id}/timeline")
+async def get_document_timeline(doc_id: str):
+    """Get a document's status changes and routing decisions."""
+    return await api_routes.get_document_timeline(doc_id)
+
+
+@app.get("/timeline")
+async def get_timeline(
+    start: datetime,
+    end: Optional[datetime] = None,
+    kind: Optional[str] = None,
+    device_id: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    """Get the status changes and routing decisions of all documents between two times."""
+    return api_routes.get_timeline(start, end, kind, device_id, limit)
 
 
 # Connection Management Endpoints
@@ -136,9 +362,13 @@ async def update_connection(connection_id: str, request: UpdateConnectionRequest
 
 
 @app.get("/connections")
-async def get_all_connections(status: Optional[ConnectionStatus] = None):
+async def get_all_connections(
+    status: Optional[ConnectionStatus] = None,
+    since: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """Get all device connections."""
-    return await api_routes.get_all_connections(status)
+    return await api_routes.get_all_connections(status, since, if_none_match)
 
 
 @app.delete("/connections/{connection_id}")
@@ -147,29 +377,162 @@ async def delete_connection(connection_id: str):
     return await api_routes.delete_connection(connection_id)
 
 
+# Change Feed
+@app.get("/events")
+async def stream_events(
+    device_id: str,
+    status: Optional[str] = None,
+    collection: Optional[str] = None,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID")
+):
+    """Stream one device's document, device and connection changes as Server-Sent Events."""
+    resume_from = last_event_id if last_event_id is not None else last_event_id_header
+    return api_routes.stream_events(device_id, status, collection, resume_from)
+
+
+@app.get("/admin/events")
+async def stream_all_events(
+    device_id: Optional[str] = None,
+    status: Optional[str] = None,
+    collection: Optional[str] = None,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID")
+):
+    """Stream every device's changes as Server-Sent Events (operators only)."""
+    resume_from = last_event_id if last_event_id is not None else last_event_id_header
+    return api_routes.stream_events(device_id, status, collection, resume_from)
+
+
 # WebSocket Endpoint
 @app.websocket("/ws/{device_id}")
 async def websocket_endpoint(websocket: WebSocket, device_id: str):
     """WebSocket endpoint for real-time communication."""
+    if is_read_only():
+        await websocket.close(code=1013)  # Try again later: devices connect to the primary
+        return
     await api_routes.handle_websocket(websocket, device_id)
 
 
 # Health Check
+async def build_health() -> tuple[bytes, None]:
+    """Encode the health check body."""
+    return json.dumps({
+        "status": "healthy",
+        "devices": {
+            "total": storage.stats.device_total,
+            "online": storage.stats.online_total
+        },
+        "documents": storage.stats.document_total,
+        "connections": storage.stats.connection_total
+    }).encode(), None
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    device_count = len(storage.devices)
-    online_count = sum(1 for d in storage.devices.values() if d.is_online)
+    entry = await response_cache.get_or_build(
+        "health", (DEVICES, DOCUMENTS, CONNECTIONS), build_health
+    )
+    return Response(entry.body, media_type="application/json")
+
+
+@app.get("/stats")
+async def get_stats():
+    """Broker counters: devices, documents, connections, throughput, cache."""
+    stats = api_routes.get_stats()
+    stats["payload_workers"] = payload_workers.stats()
+    stats["event_loop"] = loop_monitor.stats()
+    stats["logging"] = log_pipeline.stats()
+    stats["signature_previews"] = ws_manager.previews.stats()
+    stats["signature_strokes"] = ws_manager.strokes.stats()
+    stats["timeline"] = ws_manager.timeline.stats()
+    stats["presence"] = {**ws_manager.presence.stats(), "subscribers": len(ws_manager.presence_subscribers)}
+    stats["admission"] = admission.stats()
+    if wal:
+        stats["write_ahead_log"] = wal.stats()
+    if replica or replication_server:
+        stats["replication"] = replication_status()
+    return stats
+
+
+# Replication
+def replication_status() -> dict:
+    """Role, replication lag and connected followers."""
+    status = replica.status() if replica else {"role": "primary"}
+    if replication_server:
+        status["server"] = replication_server.status()
+    return status
+
+
+@app.get("/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    collection: str = Query("documents", pattern="^(documents|devices)$"),
+    status: Optional[DocStatus] = None,
+    device_type: Optional[DeviceType] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0)
+):
+    """Search documents or devices by name."""
+    return api_routes.search(q, collection, status, device_type, limit, offset)
+
+
+@app.get("/replication")
+async def get_replication_status():
+    """Replication role and lag."""
+    return replication_status()
+
+
+@app.post("/admin/promote")
+async def promote():
+    """Promote a follower to primary."""
+    if is_read_only():
+        await replica.promote()
+        await start_primary()
+    return replication_status()
+
+
+@app.get("/admin/profile")
+async def profile(
+    seconds: float = Query(5.0, gt=0),
+    interval: float = Query(0.005, ge=0.001, le=1.0),
+    all_threads: bool = False,
+    top: int = Query(50, ge=1),
+    collapsed: bool = False
+):
+    """Sample the running process for a few seconds and return the hottest stacks."""
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    result = await profiler.profile(seconds, interval, all_threads, top)
+    if collapsed:
+        return PlainTextResponse("\n".join(SamplingProfiler.collapsed(result)) + "\n")
+    return result
+
+
+@app.get("/admin/memory")
+async def memory(
+    tracemalloc: Optional[str] = Query(None, pattern="^(diff|stop)$"),
+    top: int = Query(25, ge=1)
+):
+    """Estimated memory per collection, payload type and buffer.
     
-    return {
-        "status": "healthy",
-        "devices": {
-            "total": device_count,
-            "online": online_count
-        },
-        "documents": len(storage.documents),
-        "connections": len(storage.device_connections)
-    }
+    ``tracemalloc=diff`` starts allocation tracing (first call) or reports
+    the growth since the previous diff; ``tracemalloc=stop`` ends tracing.
+    """
+    report = memory_report(storage, ws_manager, response_cache)
+    if tracemalloc == "diff":
+        report["tracemalloc"] = allocations.diff(top)
+    elif tracemalloc == "stop":
+        allocations.stop()
+    report["tracing"] = allocations.tracing
+    return report
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Response cache hit/miss counters."""
+    return response_cache.stats()
 
 
 if __name__ == "__main__":
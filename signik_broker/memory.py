@@ -0,0 +1,200 @@
+"""Memory accounting: where broker memory goes, by collection and payload type.
+
+Document payload bytes (``pdf_data``, ``signature_data``) per status are
+maintained incrementally from change events. Record, index and buffer
+sizes are estimated when a report is requested: record sizes from a small
+sample, container sizes with ``sys.getsizeof``. Neither needs a heap walk.
+For allocation-level detail, ``AllocationTracker`` diffs tracemalloc
+snapshots between two calls; tracing is off until it is asked for.
+"""
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Iterable, Optional, Tuple
+import json
+import sys
+import tracemalloc
+
+from events import ChangeEvent, DOCUMENTS
+from models import DocStatus
+
+# Records sampled to estimate the average record size of a collection
+SAMPLE_SIZE = 64
+
+
+def payload_size(value: Any) -> int:
+    """Bytes held by a payload field (its encoded length for structured previews)."""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+def _status(value: Any) -> Optional[str]:
+    return getattr(value, "value", value)
+
+
+class MemoryAccounting:
+    """Storage listener counting document payload bytes per status.
+
+    Only documents that carry a payload are tracked individually, so the
+    bookkeeping costs nothing for metadata-only documents.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._documents: Dict[str, Tuple[str, int, int]] = {}
+        self.pdf_bytes: Counter = Counter()
+        self.signature_bytes: Counter = Counter()
+
+    def record(self, event: ChangeEvent) -> None:
+        if event.collection != DOCUMENTS:
+            return
+        data = event.data
+        previous = self._documents.get(event.entity_id)
+        status, pdf, signature = previous or (None, 0, 0)
+        if "pdf_data" not in data and "signature_data" not in data:
+            if previous is None or "status" not in data:
+                return
+        if previous:
+            self.pdf_bytes[status] -= pdf
+            self.signature_bytes[status] -= signature
+        status = _status(data.get("status")) or status
+        if "pdf_data" in data:
+            pdf = payload_size(data["pdf_data"])
+        if "signature_data" in data:
+            signature = payload_size(data["signature_data"])
+        if pdf or signature:
+            self.pdf_bytes[status] += pdf
+            self.signature_bytes[status] += signature
+            self._documents[event.entity_id] = (status, pdf, signature)
+        else:
+            self._documents.pop(event.entity_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        by_status = {
+            status.value: {
+                "pdf_bytes": self.pdf_bytes[status.value],
+                "signature_bytes": self.signature_bytes[status.value]
+            }
+            for status in DocStatus
+        }
+        return {
+            "pdf_bytes": sum(self.pdf_bytes.values()),
+            "signature_bytes": sum(self.signature_bytes.values()),
+            "documents_with_payload": len(self._documents),
+            "by_status": by_status
+        }
+
+
+def _record_size(record: Any, skip: Iterable[str] = ()) -> int:
+    """Shallow record size plus the strings it holds on its own (IDs are interned and shared)."""
+    size = sys.getsizeof(record)
+    for slot in type(record).__slots__:
+        if slot in skip or slot.endswith("id"):
+            continue
+        value = getattr(record, slot, None)
+        if isinstance(value, str):
+            size += sys.getsizeof(value)
+    return size
+
+
+def estimate_collection(records: Dict[str, Any], *indexes: Any, skip: Iterable[str] = ()) -> Dict[str, int]:
+    """Estimated bytes for a collection: its records (sampled) and the dicts indexing them."""
+    count = len(records)
+    sample = list(islice(records.values(), SAMPLE_SIZE))
+    per_record = sum(_record_size(record, skip) for record in sample) / len(sample) if sample else 0
+    return {
+        "count": count,
+        "record_bytes": round(per_record * count),
+        "index_bytes": sys.getsizeof(records) + sum(sys.getsizeof(index) for index in indexes)
+    }
+
+
+def _event_bytes(events: Iterable[ChangeEvent]) -> Tuple[int, int]:
+    """Event count and estimated bytes (event and data dict, without the shared values)."""
+    events = list(events)
+    sample = events[-SAMPLE_SIZE:]
+    if not sample:
+        return 0, 0
+    per_event = sum(sys.getsizeof(event) + sys.getsizeof(event.data) for event in sample) / len(sample)
+    return len(events), round(per_event * len(events))
+
+
+def _timeline_bytes(timeline) -> int:
+    """Estimated bytes of the timeline events, each referenced from its bucket and its document."""
+    sample = timeline.recent(SAMPLE_SIZE)
+    if not sample:
+        return 0
+    per_event = sum(_record_size(event) for event in sample) / len(sample) + 2 * 8
+    return round(per_event * len(timeline))
+
+
+def memory_report(storage, ws_manager, response_cache=None) -> Dict[str, Any]:
+    """Estimated memory by collection, payload and buffer."""
+    report = {"collections": storage.memory_usage(), "payloads": storage.memory.snapshot()}
+    history, history_bytes = _event_bytes(storage.changes.history())
+    pending, pending_bytes = _event_bytes(storage.changes.pending_events())
+    queued = ws_manager.scheduler.queued_messages()
+    buffers = {
+        "change_history": {"events": history, "bytes": history_bytes},
+        "subscriber_queues": {"events": pending, "bytes": pending_bytes},
+        "dispatch_queues": {
+            "messages": len(queued),
+            "bytes": sum(sys.getsizeof(message) + payload_size(message.data) for message in queued)
+        },
+        "timeline": {"events": len(ws_manager.timeline), "bytes": _timeline_bytes(ws_manager.timeline)},
+        "websockets": {"connections": len(ws_manager.connections)}
+    }
+    if response_cache is not None:
+        entries, body_bytes = response_cache.size()
+        buffers["response_cache"] = {"entries": entries, "bytes": body_bytes}
+    report["buffers"] = buffers
+    return report
+
+
+class AllocationTracker:
+    """Opt-in tracemalloc diffs between successive calls.
+
+    Tracing slows allocation down, so it starts only on the first
+    ``diff()`` and runs until ``stop()``.
+    """
+
+    def __init__(self, frames: int = 1):
+        self.frames = frames
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def diff(self, top: int = 25) -> Dict[str, Any]:
+        """Allocation growth since the previous call, by source line (empty on the first call)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._baseline = None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        result: Dict[str, Any] = {"traced_bytes": current, "peak_bytes": peak, "top": []}
+        if self._baseline is not None:
+            result["top"] = [
+                {
+                    "location": str(stat.traceback[0]),
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff
+                }
+                for stat in snapshot.compare_to(self._baseline, "lineno")[:top]
+            ]
+        self._baseline = snapshot
+        return result
+
+    def stop(self) -> None:
+        self._baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
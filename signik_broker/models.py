@@ -61,6 +61,9 @@ class Document(BaseModel):
     android_device_id: Optional[str] = None
     pdf_data: Optional[bytes] = None
     signature_data: Optional[bytes] = None
+    lease_expires_at: Optional[datetime] = None
+    delivery_attempts: int = 0
+    bundle_id: Optional[str] = None
 
 
 class SignikMessage(BaseModel):
@@ -71,6 +74,7 @@ class SignikMessage(BaseModel):
     doc_id: Optional[str] = None
     device_id: Optional[str] = None
     sender_device_id: Optional[str] = None
+    bundle_id: Optional[str] = None
 
 
 # API Request/Response Models
@@ -101,6 +105,55 @@ class EnqueueDocResponse(BaseModel):
     message: str
 
 
+class BundleItem(BaseModel):
+    """One document of a bundle."""
+    name: str = Field(..., min_length=1)
+    pdf_data: Optional[str] = None  # Base64 encoded
+
+
+class EnqueueBundleRequest(BaseModel):
+    """Bundle enqueue request: documents signed together in one visit."""
+    windows_device_id: str
+    documents: list[BundleItem] = Field(..., min_length=1, max_length=100)
+
+
+class EnqueueBundleResponse(BaseModel):
+    """Bundle enqueue response."""
+    bundle_id: str
+    doc_ids: list[str]
+    message: str
+
+
+class BulkRegisterDevicesRequest(BaseModel):
+    """Bulk device registration request.
+
+    Items are validated one by one so a bad entry fails on its own
+    instead of rejecting the whole batch.
+    """
+    devices: list[dict] = Field(..., min_length=1, max_length=1000)
+
+
+class BulkEnqueueDocsRequest(BaseModel):
+    """Bulk document enqueue request (items validated individually)."""
+    documents: list[dict] = Field(..., min_length=1, max_length=1000)
+
+
+class BulkItemResult(BaseModel):
+    """Outcome of a single item in a bulk request."""
+    index: int
+    success: bool
+    id: Optional[str] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkOperationResponse(BaseModel):
+    """Bulk request response with per-item results."""
+    results: list[BulkItemResult]
+    succeeded: int
+    failed: int
+
+
 class ConnectDeviceRequest(BaseModel):
     """Device connection request."""
     target_device_id: str
@@ -115,15 +168,21 @@ class DeviceListResponse(BaseModel):
     """Device list response."""
     devices: list[dict]
     total: int
+    version: int = 0
+    removed: Optional[list[str]] = None  # Only set for ?since= delta responses
 
 
 class DocumentListResponse(BaseModel):
     """Document list response."""
     documents: list[dict]
     total: int
+    version: int = 0
+    removed: Optional[list[str]] = None  # Only set for ?since= delta responses
 
 
 class ConnectionListResponse(BaseModel):
     """Connection list response."""
     connections: list[dict]
-    total: int
\ No newline at end of file
+    total: int
+    version: int = 0
+    removed: Optional[list[str]] = None  # Only set for ?since= delta responses
\ No newline at end of file
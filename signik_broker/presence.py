@@ -0,0 +1,103 @@
+"""Debounced device presence, pushed to paired devices."""
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import time
+
+from events import ChangeEvent, DEVICES
+
+# Device events that carry an is_online flag worth tracking (heartbeats do not change it)
+PRESENCE_EVENTS = ("device_registered", "device_updated", "device_online", "device_offline")
+
+
+class _Presence:
+    """Presence of one device: what peers were told and what storage says now."""
+    __slots__ = ("published", "observed", "since", "timer")
+
+    def __init__(self, online: bool, since: float):
+        self.published = online
+        self.observed = online
+        self.since = since
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class PresenceTracker:
+    """Turns a device's online/offline flips into settled presence changes.
+
+    A change is published only once the device has stayed in its new state
+    for ``online_delay`` (coming online) or ``offline_delay`` (going
+    offline) seconds. A flip back before then cancels it, so a tablet
+    flapping on bad Wi-Fi produces one change when it settles, or none if
+    it settles where it started. Register ``record`` as a storage listener;
+    ``publish(device_id, online, since)`` is called for each settled change.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, bool, float], None],
+        online_delay: float = 1.0,
+        offline_delay: float = 5.0
+    ):
+        self._publish = publish
+        self.online_delay = online_delay
+        self.offline_delay = offline_delay
+        self._devices: Dict[str, _Presence] = {}
+        self.flips = 0
+        self.published = 0
+        self.suppressed = 0  # Flips undone within the delay
+
+    def record(self, event: ChangeEvent) -> None:
+        """Storage listener: follow the online flag of every device."""
+        if event.collection != DEVICES or event.type not in PRESENCE_EVENTS:
+            return
+        self.observe(event.entity_id, event.data.get("is_online", True))
+
+    def observe(self, device_id: str, online: bool) -> None:
+        state = self._devices.get(device_id)
+        if state is None:
+            # First sight (registration or recovery): nobody was told anything else
+            self._devices[device_id] = _Presence(online, time.time())
+            return
+        if online == state.observed:
+            return
+        state.observed = online
+        self.flips += 1
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+            self.suppressed += 1
+        if online == state.published:
+            return
+        delay = self.online_delay if online else self.offline_delay
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None  # Replaying the log at startup: no one is connected to tell
+        if delay > 0 and loop is not None:
+            state.timer = loop.call_later(delay, self._settle, device_id, state)
+        else:
+            self._settle(device_id, state)
+
+    def _settle(self, device_id: str, state: _Presence) -> None:
+        state.timer = None
+        if state.observed == state.published:
+            return
+        state.published = state.observed
+        state.since = time.time()
+        self.published += 1
+        self._publish(device_id, state.published, state.since)
+
+    def state(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """The published presence of a device, as peers last heard it."""
+        state = self._devices.get(device_id)
+        if state is None:
+            return None
+        return {"device_id": device_id, "is_online": state.published, "since": state.since}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "devices": len(self._devices),
+            "pending": sum(1 for state in self._devices.values() if state.timer is not None),
+            "flips": self.flips,
+            "published": self.published,
+            "suppressed": self.suppressed
+        }
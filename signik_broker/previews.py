@@ -0,0 +1,122 @@
+"""Latest-wins coalescing of signature previews per document."""
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import time
+
+from models import SignikMessage
+
+logger = logging.getLogger(__name__)
+
+
+class _Slot:
+    """Preview state of one document."""
+    __slots__ = ("pending", "latest", "stored", "stored_at", "task")
+
+    def __init__(self):
+        self.pending: Optional[SignikMessage] = None  # Newest preview not yet sent
+        self.latest: Optional[SignikMessage] = None  # Newest preview received
+        self.stored = True
+        self.stored_at = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class PreviewCoalescer:
+    """Forwards signature previews at a bounded rate, newest first.
+
+    Each document has one slot holding the newest preview not yet sent. A
+    preview that arrives while an older one is still waiting replaces it,
+    so a slow viewer gets the current signature instead of a backlog.
+    Sends for a document are at least ``1 / max_per_second`` apart. The
+    newest preview is stored at most every ``store_interval`` seconds while
+    the signer draws, and once more when the burst ends.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[SignikMessage], Awaitable[bool]],
+        store: Callable[[SignikMessage], Awaitable[None]],
+        max_per_second: float = 15.0,
+        store_interval: float = 1.0
+    ):
+        self._deliver = deliver
+        self._store = store
+        self.min_interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self.store_interval = store_interval
+        self._slots: Dict[str, _Slot] = {}
+        self.received = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.stored = 0
+
+    def submit(self, message: SignikMessage) -> None:
+        """Queue a preview for delivery, replacing the document's unsent one."""
+        slot = self._slots.get(message.doc_id)
+        if slot is None:
+            slot = self._slots[message.doc_id] = _Slot()
+        self.received += 1
+        if slot.pending is not None:
+            self.coalesced += 1
+        slot.pending = slot.latest = message
+        slot.stored = False
+        if slot.task is None:
+            slot.task = asyncio.create_task(self._drain(message.doc_id, slot))
+
+    async def finish(self, doc_id: str) -> None:
+        """Stop forwarding a document's previews and store the newest one now.
+
+        Called when the signature is reviewed: previews still waiting are
+        not sent any more.
+        """
+        slot = self._slots.pop(doc_id, None)
+        if slot is None:
+            return
+        if slot.pending is not None:
+            self.coalesced += 1
+        if slot.task is not None:
+            slot.task.cancel()
+        if not slot.stored:
+            await self._flush(slot)
+
+    async def _flush(self, slot: _Slot) -> None:
+        slot.stored = True
+        slot.stored_at = time.monotonic()
+        self.stored += 1
+        await self._store(slot.latest)
+
+    async def _drain(self, doc_id: str, slot: _Slot) -> None:
+        try:
+            while True:
+                if slot.pending is None:
+                    if slot.stored:
+                        break
+                    await self._flush(slot)
+                    continue
+                message, slot.pending = slot.pending, None
+                sent_at = time.monotonic()
+                if await self._deliver(message):
+                    self.delivered += 1
+                if not slot.stored and time.monotonic() - slot.stored_at >= self.store_interval:
+                    await self._flush(slot)
+                await asyncio.sleep(max(0.0, self.min_interval - (time.monotonic() - sent_at)))
+        except Exception as e:
+            logger.error("Forwarding previews of %s failed: %s", doc_id, e, extra={"doc_id": doc_id})
+            # The slot is dropped below and finish() will not find it: keep the newest preview now
+            if not slot.stored:
+                try:
+                    await self._flush(slot)
+                except Exception as e:
+                    logger.error("Storing the preview of %s failed: %s", doc_id, e, extra={"doc_id": doc_id})
+        finally:
+            slot.task = None
+            if self._slots.get(doc_id) is slot:
+                del self._slots[doc_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "stored": self.stored,
+            "active_documents": len(self._slots)
+        }
@@ -0,0 +1,177 @@
+"""Compact in-memory records for devices, connections and documents.
+
+StorageManager keeps these instead of the pydantic models in models.py:
+slotted objects with interned IDs, enum members and timestamps stored as
+integer epoch milliseconds. Datetime attributes are still readable and
+assignable, so code that reads records works unchanged; pydantic models
+are only built at the API edge with ``to_model()``.
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import sys
+
+from models import Device, DeviceConnection, Document
+
+
+def to_ms(value: Optional[datetime]) -> Optional[int]:
+    """Naive local datetime to epoch milliseconds."""
+    return None if value is None else round(value.timestamp() * 1000)
+
+
+def from_ms(value: Optional[int]) -> Optional[datetime]:
+    """Epoch milliseconds to a naive local datetime."""
+    return None if value is None else datetime.fromtimestamp(value / 1000)
+
+
+def intern_id(value: Optional[str]) -> Optional[str]:
+    """Share one string object per ID across records, indexes and dict keys."""
+    return None if value is None else sys.intern(value)
+
+
+class EpochMillis:
+    """Datetime attribute stored in a ``_<name>`` slot as epoch milliseconds."""
+
+    def __set_name__(self, owner, name):
+        self.slot = f"_{name}"
+
+    def __get__(self, record, owner=None):
+        if record is None:
+            return self
+        return from_ms(getattr(record, self.slot))
+
+    def __set__(self, record, value):
+        setattr(record, self.slot, value if value is None or isinstance(value, int) else to_ms(value))
+
+
+class InternedId:
+    """ID attribute that is interned whenever it is assigned."""
+
+    def __set_name__(self, owner, name):
+        self.slot = f"_{name}"
+
+    def __get__(self, record, owner=None):
+        if record is None:
+            return self
+        return getattr(record, self.slot)
+
+    def __set__(self, record, value):
+        setattr(record, self.slot, intern_id(value))
+
+
+class Record:
+    """Base for slotted storage records mirroring a pydantic model."""
+    __slots__ = ()
+    MODEL: type
+    FIELDS: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_model(cls, model) -> "Record":
+        return cls(**{name: getattr(model, name) for name in cls.FIELDS})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The model's fields as a plain dict (what ``model.dict()`` returned)."""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def to_model(self):
+        """Build the pydantic model (values were validated on the way in)."""
+        return self.MODEL.model_construct(**self.to_dict())
+
+    def to_row(self) -> tuple:
+        """Raw slot values, for snapshots."""
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "Record":
+        """Rebuild a record; slots added after the row was written (trailing) are None."""
+        record = cls.__new__(cls)
+        for slot, value in zip(cls.__slots__, row):
+            object.__setattr__(record, slot, value)
+        for slot in cls.__slots__[len(row):]:
+            object.__setattr__(record, slot, None)
+        return record
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.to_row() == other.to_row()
+
+    # Records are mutable and kept in sets and dict keys by identity: hash by identity, not by value
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class DeviceRecord(Record):
+    __slots__ = ("id", "name", "device_type", "ip_address", "_last_heartbeat", "is_online")
+    MODEL = Device
+    FIELDS = ("id", "name", "device_type", "ip_address", "last_heartbeat", "is_online")
+
+    last_heartbeat = EpochMillis()
+
+    def __init__(self, id, name, device_type, ip_address, last_heartbeat, is_online=True):
+        self.id = intern_id(id)
+        self.name = name
+        self.device_type = device_type
+        self.ip_address = ip_address
+        self.last_heartbeat = last_heartbeat
+        self.is_online = is_online
+
+
+class ConnectionRecord(Record):
+    __slots__ = (
+        "id", "windows_device_id", "android_device_id", "status",
+        "_created_at", "_updated_at", "initiated_by"
+    )
+    MODEL = DeviceConnection
+    FIELDS = (
+        "id", "windows_device_id", "android_device_id", "status",
+        "created_at", "updated_at", "initiated_by"
+    )
+
+    created_at = EpochMillis()
+    updated_at = EpochMillis()
+
+    def __init__(self, id, windows_device_id, android_device_id, status, created_at, updated_at, initiated_by):
+        self.id = intern_id(id)
+        self.windows_device_id = intern_id(windows_device_id)
+        self.android_device_id = intern_id(android_device_id)
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.initiated_by = intern_id(initiated_by)
+
+
+class DocumentRecord(Record):
+    __slots__ = (
+        "id", "name", "status", "_created_at", "_updated_at", "windows_device_id",
+        "_android_device_id", "pdf_data", "signature_data", "_lease_expires_at", "delivery_attempts",
+        "bundle_id"
+    )
+    MODEL = Document
+    FIELDS = (
+        "id", "name", "status", "created_at", "updated_at", "windows_device_id",
+        "android_device_id", "pdf_data", "signature_data", "lease_expires_at", "delivery_attempts",
+        "bundle_id"
+    )
+
+    created_at = EpochMillis()
+    updated_at = EpochMillis()
+    lease_expires_at = EpochMillis()
+    android_device_id = InternedId()
+
+    def __init__(
+        self, id, name, status, created_at, updated_at, windows_device_id=None,
+        android_device_id=None, pdf_data=None, signature_data=None, lease_expires_at=None,
+        delivery_attempts=0, bundle_id=None
+    ):
+        self.id = intern_id(id)
+        self.name = name
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.windows_device_id = intern_id(windows_device_id)
+        self.android_device_id = android_device_id
+        self.pdf_data = pdf_data
+        self.signature_data = signature_data
+        self.lease_expires_at = lease_expires_at
+        self.delivery_attempts = delivery_attempts
+        self.bundle_id = intern_id(bundle_id)
@@ -0,0 +1,340 @@
+"""Log shipping from a primary broker to warm-standby followers."""
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import pickle
+import struct
+import time
+
+from events import ChangeEvent, EventFilter, Subscription
+from wal import encode_record, decode_records
+
+logger = logging.getLogger(__name__)
+
+# Frame: kind, payload length, the payload, then its HMAC-SHA256 when a secret is set
+FRAME_HEADER = struct.Struct(">BI")
+FRAME_POSITION = struct.Struct(">QB")  # Frame number on the connection and kind, covered by the MAC
+MAC_SIZE = 32
+HELLO = 1       # follower -> primary: HELLO_PAYLOAD
+SNAPSHOT = 2    # primary -> follower: pickled StorageManager.export_state()
+EVENTS = 3      # primary -> follower: concatenated write-ahead log records
+HEARTBEAT = 4   # primary -> follower: HEARTBEAT_PAYLOAD
+HELLO_PAYLOAD = struct.Struct(">16sQ")  # connection nonce, last change applied
+HEARTBEAT_PAYLOAD = struct.Struct(">Qd")  # primary's last change, primary wall clock
+
+# Events a follower may be behind before the primary falls back to a snapshot
+MAX_PENDING_EVENTS = 100000
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """Parse ``unix:/path/to.sock`` or ``tcp:host:port``."""
+    scheme, _, rest = address.partition(":")
+    if scheme == "unix" and rest:
+        return "unix", rest
+    if scheme == "tcp":
+        host, _, port = rest.rpartition(":")
+        if host and port.isdigit():
+            return "tcp", (host, int(port))
+    raise ValueError(f"Replication address must be unix:<path> or tcp:<host>:<port>, got {address!r}")
+
+
+def check_secret(address: str, secret: Optional[str]) -> None:
+    """Refuse TCP replication without a shared secret: its snapshots and records are pickled."""
+    if parse_address(address)[0] == "tcp" and not secret:
+        raise ValueError(f"Replication over TCP ({address}) requires SIGNIK_REPLICATION_SECRET")
+
+
+class FrameRejected(Exception):
+    """A frame that failed authentication or is not allowed at this point."""
+
+
+class FrameChannel:
+    """Frames over one replication connection.
+
+    With a secret, every frame carries an HMAC-SHA256 over the connection
+    nonce, the frame's number on the connection, its kind and its payload,
+    and it is checked before the payload is decoded. Without the secret a
+    peer can neither forge a frame nor replay one from another connection
+    or out of order. The follower picks the nonce and sends it in HELLO;
+    every later frame is bound to it.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, secret: Optional[str]):
+        self.reader = reader
+        self.writer = writer
+        self.secret = secret.encode() if secret else None
+        self.nonce = b""
+        self._sent = 0
+        self._received = 0
+
+    def _mac(self, number: int, kind: int, payload: bytes) -> bytes:
+        message = self.nonce + FRAME_POSITION.pack(number, kind) + payload
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    async def write(self, kind: int, payload: bytes) -> None:
+        mac = self._mac(self._sent, kind, payload) if self.secret else b""
+        self._sent += 1
+        self.writer.write(FRAME_HEADER.pack(kind, len(payload)) + payload + mac)
+        await self.writer.drain()
+
+    async def read(self, max_length: Optional[int] = None) -> Tuple[int, bytes]:
+        kind, length = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+        if max_length is not None and length > max_length:
+            raise FrameRejected(f"frame of {length} bytes where at most {max_length} are allowed")
+        payload = await self.reader.readexactly(length)
+        if self.secret:
+            mac = await self.reader.readexactly(MAC_SIZE)
+            if not hmac.compare_digest(mac, self._mac(self._received, kind, payload)):
+                raise FrameRejected("frame authentication failed")
+        self._received += 1
+        return kind, payload
+
+
+class ReplicationServer:
+    """Primary side: streams the storage change feed to connected followers.
+
+    A follower says which change it has applied last. If the change feed
+    history still holds everything after it, those events are replayed;
+    otherwise (or if the follower falls too far behind) it gets a full
+    snapshot first. Snapshots and records are pickled, so only
+    authenticated frames are decoded: TCP requires a shared ``secret``, and
+    a Unix socket is created readable by this user only.
+    """
+
+    def __init__(self, storage, address: str, heartbeat_seconds: float = 1.0, secret: Optional[str] = None):
+        check_secret(address, secret)
+        self.storage = storage
+        self.address = address
+        self.secret = secret
+        self.heartbeat_seconds = heartbeat_seconds
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._followers: Dict[str, Dict[str, Any]] = {}
+        self._handlers: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            self._server = await asyncio.start_unix_server(self._serve, path=target)
+            os.chmod(target, 0o600)
+        else:
+            self._server = await asyncio.start_server(self._serve, *target)
+        logger.info("Replication listening on %s", self.address)
+
+    async def stop(self) -> None:
+        """Stop listening and drop connected followers."""
+        if self._server:
+            self._server.close()
+            self._server = None
+        for handler in list(self._handlers):
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    def _subscribe(self, last_seq: int) -> Tuple[Subscription, Optional[Dict[str, Any]]]:
+        """Subscription resuming after ``last_seq``, plus a snapshot if history cannot cover it."""
+        feed = self.storage.changes
+        event_filter = EventFilter(include_heartbeats=True)
+        if last_seq <= self.storage.last_seq:
+            subscription = feed.subscribe(event_filter, last_seq, max_pending=MAX_PENDING_EVENTS)
+            if not subscription.lagged:
+                return subscription, None
+            feed.unsubscribe(subscription)
+        # Export and subscribe in the same step so no change falls in between
+        state = self.storage.export_state()
+        return feed.subscribe(event_filter, state["seq"], max_pending=MAX_PENDING_EVENTS), state
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = str(writer.get_extra_info("peername") or id(writer))
+        subscription = None
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        channel = FrameChannel(reader, writer, self.secret)
+        try:
+            kind, payload = await channel.read(max_length=HELLO_PAYLOAD.size)
+            if kind != HELLO or len(payload) != HELLO_PAYLOAD.size:
+                raise FrameRejected("expected HELLO")
+            channel.nonce, last_seq = HELLO_PAYLOAD.unpack(payload)
+            follower = self._followers[peer] = {"sent_seq": last_seq, "snapshots": 0, "since": time.time()}
+            logger.info("Follower %s connected at change %d", peer, last_seq)
+
+            while True:
+                if subscription is None or subscription.lagged:
+                    if subscription:
+                        self.storage.changes.unsubscribe(subscription)
+                    subscription, state = self._subscribe(follower["sent_seq"])
+                    if state is not None:
+                        payload = await asyncio.to_thread(pickle.dumps, state, pickle.HIGHEST_PROTOCOL)
+                        await channel.write(SNAPSHOT, payload)
+                        follower["sent_seq"] = state["seq"]
+                        follower["snapshots"] += 1
+                batch = await subscription.next_batch(timeout=self.heartbeat_seconds)
+                if batch:
+                    await channel.write(EVENTS, b"".join(encode_record(event) for event in batch))
+                    follower["sent_seq"] = batch[-1].seq
+                await channel.write(HEARTBEAT, HEARTBEAT_PAYLOAD.pack(self.storage.last_seq, time.time()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except FrameRejected as e:
+            logger.warning("Rejected replication peer %s: %s", peer, e)
+        except Exception as e:
+            logger.error("Replication to %s failed: %s", peer, e)
+        finally:
+            if subscription:
+                self.storage.changes.unsubscribe(subscription)
+            self._followers.pop(peer, None)
+            self._handlers.discard(handler)
+            writer.close()
+            logger.info("Follower %s disconnected", peer)
+
+    def status(self) -> Dict[str, Any]:
+        last_seq = self.storage.last_seq
+        return {
+            "listen": self.address,
+            "followers": [
+                {"peer": peer, "sent_seq": f["sent_seq"], "lag_events": last_seq - f["sent_seq"],
+                 "snapshots_sent": f["snapshots"], "connected_since": f["since"]}
+                for peer, f in self._followers.items()
+            ]
+        }
+
+
+class ReplicationClient:
+    """Follower side: keeps a hot copy of the primary's storage.
+
+    Changes are applied through ``StorageManager.apply_events`` with their
+    original sequence numbers, so versions, ETags and change feed IDs match
+    the primary's. The store stays read-only until ``promote()``. With a
+    local write-ahead log, a snapshot from the primary restarts that log.
+    Frames are decoded only once authenticated with ``secret`` (required
+    over TCP).
+    """
+
+    def __init__(
+        self,
+        storage,
+        primary_address: str,
+        reconnect_seconds: float = 1.0,
+        wal=None,
+        secret: Optional[str] = None
+    ):
+        check_secret(primary_address, secret)
+        self.storage = storage
+        self.secret = secret
+        self.wal = wal
+        self.primary_address = primary_address
+        self.reconnect_seconds = reconnect_seconds
+        self.read_only = True
+        self.connected = False
+        self.primary_seq = 0
+        self.primary_time: Optional[float] = None
+        self.last_applied_at: Optional[float] = None
+        self._behind_since: Optional[float] = None
+        self.snapshots_loaded = 0
+        self.reconnects = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected = False
+
+    async def promote(self) -> None:
+        """Stop following and accept writes. Already applied state is kept as is."""
+        await self.stop()
+        self.read_only = False
+        logger.info("Promoted to primary at change %d", self.storage.last_seq)
+
+    async def _run(self) -> None:
+        delay = self.reconnect_seconds
+        while True:
+            try:
+                await self._follow()
+                delay = self.reconnect_seconds
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logger.warning("Replication from %s interrupted: %s", self.primary_address, e)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Replication from %s failed: %s", self.primary_address, e)
+            self.connected = False
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def _follow(self) -> None:
+        kind, target = parse_address(self.primary_address)
+        if kind == "unix":
+            reader, writer = await asyncio.open_unix_connection(target)
+        else:
+            reader, writer = await asyncio.open_connection(*target)
+        channel = FrameChannel(reader, writer, self.secret)
+        try:
+            nonce = os.urandom(16)
+            await channel.write(HELLO, HELLO_PAYLOAD.pack(nonce, self.storage.last_seq))
+            channel.nonce = nonce
+            self.connected = True
+            logger.info("Following %s from change %d", self.primary_address, self.storage.last_seq)
+            while True:
+                kind, payload = await channel.read()
+                if kind == SNAPSHOT:
+                    state = await asyncio.to_thread(pickle.loads, payload)
+                    if self.wal:
+                        await self.wal.rebase(self.storage, state)
+                    else:
+                        await self.storage.restore_state(state)
+                    self.snapshots_loaded += 1
+                    self._applied()
+                elif kind == EVENTS:
+                    events: List[ChangeEvent] = [event for _, event in decode_records(payload)]
+                    await self.storage.apply_events(events)
+                    self._applied()
+                elif kind == HEARTBEAT:
+                    self.primary_seq, self.primary_time = HEARTBEAT_PAYLOAD.unpack(payload)
+                    self._track_lag()
+        finally:
+            writer.close()
+
+    def _applied(self) -> None:
+        self.last_applied_at = time.time()
+        self.primary_seq = max(self.primary_seq, self.storage.last_seq)
+        self._track_lag()
+
+    def _track_lag(self) -> None:
+        if self.storage.last_seq >= self.primary_seq:
+            self._behind_since = None
+        elif self._behind_since is None:
+            self._behind_since = time.time()
+
+    @property
+    def lag_events(self) -> int:
+        """Changes the primary has reported that are not applied here yet."""
+        return max(0, self.primary_seq - self.storage.last_seq)
+
+    @property
+    def lag_seconds(self) -> float:
+        """How long this follower has been behind the primary (0 when caught up)."""
+        return time.time() - self._behind_since if self._behind_since else 0.0
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "role": "follower" if self.read_only else "primary",
+            "primary": self.primary_address,
+            "connected": self.connected,
+            "applied_seq": self.storage.last_seq,
+            "primary_seq": self.primary_seq,
+            "lag_events": self.lag_events,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "last_applied_at": self.last_applied_at,
+            "snapshots_loaded": self.snapshots_loaded,
+            "reconnects": self.reconnects
+        }
@@ -0,0 +1,106 @@
+"""Cache of encoded responses for hot list endpoints."""
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+import time
+
+from events import ChangeEvent
+
+
+@dataclass
+class CachedResponse:
+    """An encoded response body and its ETag."""
+    body: bytes
+    etag: Optional[str] = None
+    stale_until: Optional[float] = None  # Monotonic time after which a stale entry is rebuilt
+
+
+class ResponseCache:
+    """Encoded response bytes keyed by (endpoint, filters), invalidated by storage changes.
+
+    Each entry declares the collections it is built from; any change to one
+    of them invalidates it. With a coalescing window, an invalidated entry is
+    still served for up to ``coalesce_seconds`` before being rebuilt.
+    Heartbeats only move ``last_heartbeat``, so they get a window of their
+    own, ``heartbeat_seconds``: steady heartbeat traffic costs one rebuild
+    per window instead of one per heartbeat.
+    """
+
+    def __init__(self, coalesce_seconds: float = 0.0, heartbeat_seconds: float = 5.0):
+        self.coalesce_seconds = coalesce_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._entries: Dict[Hashable, CachedResponse] = {}
+        self._keys_by_collection: Dict[str, Set[Hashable]] = {}
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def record(self, event: ChangeEvent) -> None:
+        """Storage listener: invalidate entries built from the changed collection."""
+        self._generations[event.collection] = self._generations.get(event.collection, 0) + 1
+        keys = self._keys_by_collection.get(event.collection)
+        if not keys:
+            return
+        window = self.heartbeat_seconds if event.type == "heartbeat" else self.coalesce_seconds
+        if window <= 0:
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += len(keys)
+            keys.clear()
+            return
+        deadline = time.monotonic() + window
+        for key in keys:
+            entry = self._entries.get(key)
+            if not entry:
+                continue
+            if entry.stale_until is None:
+                self.invalidations += 1
+            if entry.stale_until is None or deadline < entry.stale_until:
+                entry.stale_until = deadline
+
+    async def get_or_build(
+        self,
+        key: Hashable,
+        collections: Iterable[str],
+        build: Callable[[], Awaitable[Tuple[bytes, Optional[str]]]]
+    ) -> CachedResponse:
+        """Return the cached response for ``key``, building it on a miss."""
+        entry = self._entries.get(key)
+        if entry:
+            if entry.stale_until is None:
+                self.hits += 1
+                return entry
+            if time.monotonic() < entry.stale_until:
+                self.coalesced += 1
+                return entry
+
+        self.misses += 1
+        collections = tuple(collections)
+        generations = [self._generations.get(c, 0) for c in collections]
+        body, etag = await build()
+        entry = CachedResponse(body, etag)
+        if generations != [self._generations.get(c, 0) for c in collections]:
+            return entry  # Changed while building: serve it but do not cache it
+        self._entries[key] = entry
+        for collection in collections:
+            self._keys_by_collection.setdefault(collection, set()).add(key)
+        return entry
+
+    def size(self) -> Tuple[int, int]:
+        """Number of cached entries and their total body bytes."""
+        return len(self._entries), sum(len(entry.body) for entry in self._entries.values())
+
+    def stats(self) -> dict:
+        """Hit/miss counters."""
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "coalesced_hits": self.coalesced,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "coalesce_seconds": self.coalesce_seconds,
+            "heartbeat_seconds": self.heartbeat_seconds
+        }
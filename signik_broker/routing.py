@@ -0,0 +1,96 @@
+"""Target tablet selection for documents sent by Windows devices."""
+from typing import Callable, Dict, Iterable, List, Optional
+import itertools
+import logging
+
+from models import DeviceType
+from storage import StorageManager
+
+logger = logging.getLogger(__name__)
+
+LEAST_LOADED = "least_loaded"
+ROUND_ROBIN = "round_robin"
+
+
+class TargetSelector:
+    """Chooses which Android device receives a Windows device's next document.
+
+    Candidates are the online tablets CONNECTED to the sender in
+    ``device_connections``. Senders without any connection fall back to all
+    online tablets so unpaired setups keep working. Routing state (the last
+    target used by each sender) is kept per sender.
+    """
+
+    def __init__(
+        self,
+        storage: StorageManager,
+        strategy: str = LEAST_LOADED,
+        backlog: Callable[[str], int] = lambda device_id: 0,
+    ):
+        if strategy not in (LEAST_LOADED, ROUND_ROBIN):
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.storage = storage
+        self.strategy = strategy
+        self.backlog = backlog
+        self.last_target: Dict[str, str] = {}
+        self._ticks = itertools.count()
+        self._last_assigned: Dict[str, int] = {}
+
+    def candidates(self, sender_device_id: str) -> Iterable[str]:
+        """Online tablets the sender may route to."""
+        if self.storage.has_connected_tablets(sender_device_id):
+            return self.storage.get_eligible_tablets(sender_device_id)
+        return self.storage.get_online_tablets()
+
+    async def select(
+        self,
+        sender_device_id: str,
+        requested_device_id: Optional[str] = None,
+        is_reachable: Callable[[str], bool] = lambda device_id: True,
+    ) -> Optional[str]:
+        """Pick a target tablet for the sender, or None if none is available."""
+        target_device_id = None
+
+        if requested_device_id:
+            device = await self.storage.get_device(requested_device_id)
+            if (device and device.device_type == DeviceType.ANDROID
+                    and device.is_online and is_reachable(requested_device_id)):
+                target_device_id = requested_device_id
+
+        if not target_device_id:
+            reachable = [d for d in self.candidates(sender_device_id) if is_reachable(d)]
+            if reachable:
+                target_device_id = min(reachable, key=self._rank)
+
+        if target_device_id:
+            self._last_assigned[target_device_id] = next(self._ticks)
+            self.last_target[sender_device_id] = target_device_id
+        return target_device_id
+
+    def select_many(
+        self,
+        sender_device_id: str,
+        count: int,
+        is_reachable: Callable[[str], bool] = lambda device_id: True,
+    ) -> List[str]:
+        """Up to ``count`` target tablets for the sender, best first."""
+        reachable = [d for d in self.candidates(sender_device_id) if is_reachable(d)]
+        targets = sorted(reachable, key=self._rank)[:count]
+        for target_device_id in targets:
+            self._last_assigned[target_device_id] = next(self._ticks)
+        if targets:
+            self.last_target[sender_device_id] = targets[0]
+        return targets
+
+    def forget_device(self, device_id: str) -> None:
+        """Drop per-device routing state once a device goes away."""
+        self.last_target.pop(device_id, None)
+        self._last_assigned.pop(device_id, None)
+
+    def _rank(self, device_id: str) -> tuple:
+        """Sort key: fewest in-flight and waiting documents first, then least recently used."""
+        recency = self._last_assigned.get(device_id, -1)
+        if self.strategy == ROUND_ROBIN:
+            return (recency,)
+        load = self.storage.get_inflight_count(device_id) + self.backlog(device_id)
+        return (load, recency)
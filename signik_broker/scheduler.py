@@ -0,0 +1,112 @@
+"""Per-tablet dispatch scheduling for documents sent to Android devices."""
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import logging
+import time
+
+from models import SignikMessage
+from storage import StorageManager
+
+logger = logging.getLogger(__name__)
+
+# Dispatch modes: one tablet per document, or an offer to several where the first signer wins
+SINGLE = "single"
+PARALLEL = "parallel"
+
+# Assumed time a tablet needs per document until real samples are available
+DEFAULT_SERVICE_SECONDS = 60.0
+# Weight of the newest sample in the service time moving average
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class DispatchScheduler:
+    """Limits documents in flight per tablet and queues the rest.
+
+    A tablet may hold up to ``max_inflight_per_tablet`` SENT documents.
+    Further ``sendStart`` messages wait in that tablet's FIFO queue until a
+    document it holds is signed, declined or delivered.
+    """
+
+    def __init__(self, storage: StorageManager, max_inflight_per_tablet: int = 1):
+        if max_inflight_per_tablet < 1:
+            raise ValueError("max_inflight_per_tablet must be at least 1")
+        self.storage = storage
+        self.max_inflight_per_tablet = max_inflight_per_tablet
+        self._pending: Dict[str, Deque[SignikMessage]] = {}
+        self._pending_docs: Dict[str, str] = {}
+        self._service_seconds: Dict[str, float] = {}
+        self._sent_at: Dict[str, Tuple[str, float]] = {}
+
+    def has_capacity(self, device_id: str) -> bool:
+        """Whether a tablet can take another document right now."""
+        return self.storage.get_inflight_count(device_id) < self.max_inflight_per_tablet
+
+    def pending_count(self, device_id: str) -> int:
+        """Number of documents waiting for a tablet."""
+        queue = self._pending.get(device_id)
+        return len(queue) if queue else 0
+
+    def queued_messages(self) -> List[SignikMessage]:
+        """Every sendStart waiting in some tablet's queue."""
+        return [message for queue in self._pending.values() for message in queue]
+
+    def is_pending(self, doc_id: str) -> bool:
+        """Whether a document is waiting in some tablet's queue."""
+        return doc_id in self._pending_docs
+
+    def enqueue(self, device_id: str, message: SignikMessage) -> int:
+        """Queue a sendStart for a tablet and return its 1-based position."""
+        queue = self._pending.setdefault(device_id, deque())
+        queue.append(message)
+        self._pending_docs[message.doc_id] = device_id
+        return len(queue)
+
+    def pop_next(self, device_id: str) -> Optional[SignikMessage]:
+        """Take the next waiting sendStart for a tablet, if any."""
+        queue = self._pending.get(device_id)
+        if not queue:
+            return None
+        message = queue.popleft()
+        if not queue:
+            del self._pending[device_id]
+        self._pending_docs.pop(message.doc_id, None)
+        return message
+
+    def take_all(self, device_id: str) -> List[SignikMessage]:
+        """Remove and return every sendStart waiting for a tablet."""
+        messages = list(self._pending.pop(device_id, ()))
+        for message in messages:
+            self._pending_docs.pop(message.doc_id, None)
+        return messages
+
+    def positions(self, device_id: str) -> List[Tuple[SignikMessage, int]]:
+        """Waiting sendStart messages for a tablet with their 1-based positions."""
+        return [(message, index) for index, message in enumerate(self._pending.get(device_id, ()), 1)]
+
+    def estimated_wait(self, device_id: str, position: int) -> float:
+        """Estimated seconds until the document at ``position`` is dispatched."""
+        service = self._service_seconds.get(device_id, DEFAULT_SERVICE_SECONDS)
+        rounds = (position - 1) // self.max_inflight_per_tablet + 1
+        return round(rounds * service, 1)
+
+    def record_sent(self, doc_id: str, device_id: str) -> None:
+        """Note that a document has been pushed to a tablet."""
+        self._sent_at[doc_id] = (device_id, time.monotonic())
+
+    def forget(self, doc_id: str) -> None:
+        """Drop tracking for a document taken back from its tablet (no service time sample)."""
+        self._sent_at.pop(doc_id, None)
+
+    def record_finished(self, doc_id: str) -> Optional[str]:
+        """Note that a tablet is done with a document; returns that tablet's ID."""
+        sent = self._sent_at.pop(doc_id, None)
+        if not sent:
+            return None
+        device_id, sent_at = sent
+        sample = time.monotonic() - sent_at
+        previous = self._service_seconds.get(device_id)
+        self._service_seconds[device_id] = (
+            sample if previous is None
+            else previous + SERVICE_TIME_SMOOTHING * (sample - previous)
+        )
+        return device_id
@@ -0,0 +1,151 @@
+"""Name search for documents and devices.
+
+Names are split into lowercase word tokens (runs of letters or digits, so
+``Invoice2024-03.pdf`` gives ``invoice``, ``2024``, ``03`` and ``pdf``). A
+query matches a name when every query token is a prefix of some token of
+the name. Each index maps tokens to entity IDs and keeps the tokens sorted
+in buckets by their first two characters, so a prefix lookup is a bisect
+in one small list. Indexes are kept up to date from change events.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, Iterator, List, Set
+import re
+
+from events import ChangeEvent, DELETE, DEVICES, DOCUMENTS
+
+_TOKEN = re.compile(r"[^\W\d_]+|\d+")
+
+# Candidate sets at most this large are narrowed by checking names instead of more postings
+VERIFY_BELOW = 1024
+
+
+def tokenize(text: str) -> List[str]:
+    """Distinct lowercase word tokens of a name, in order."""
+    return list(dict.fromkeys(_TOKEN.findall(text.lower())))
+
+
+class PrefixIndex:
+    """Word-prefix index over the names of one collection."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._postings: Dict[str, Set[str]] = {}
+        self._buckets: Dict[str, List[str]] = {}  # First two characters -> sorted tokens
+        self._names: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, entity_id: str, name: str) -> None:
+        """Index an entity's name, replacing the name indexed before (rename)."""
+        previous = self._names.get(entity_id)
+        if previous == name:
+            return
+        if previous is not None:
+            self.remove(entity_id)
+        self._names[entity_id] = name
+        for token in tokenize(name):
+            ids = self._postings.get(token)
+            if ids is None:
+                ids = self._postings[token] = set()
+                insort(self._buckets.setdefault(token[:2], []), token)
+            ids.add(entity_id)
+
+    def remove(self, entity_id: str) -> None:
+        name = self._names.pop(entity_id, None)
+        if name is None:
+            return
+        for token in tokenize(name):
+            ids = self._postings[token]
+            ids.discard(entity_id)
+            if not ids:
+                del self._postings[token]
+                bucket = self._buckets[token[:2]]
+                del bucket[bisect_left(bucket, token)]
+                if not bucket:
+                    del self._buckets[token[:2]]
+
+    def _expand(self, prefix: str) -> Iterator[str]:
+        """Indexed tokens starting with ``prefix``."""
+        if len(prefix) == 1:
+            for key, bucket in self._buckets.items():
+                if key[0] == prefix:
+                    yield from bucket
+            return
+        bucket = self._buckets.get(prefix[:2], ())
+        for i in range(bisect_left(bucket, prefix), len(bucket)):
+            if not bucket[i].startswith(prefix):
+                break
+            yield bucket[i]
+
+    def _count(self, prefix: str, limit: float) -> float:
+        """IDs under the tokens starting with ``prefix``, or infinity once past ``limit``."""
+        total = 0
+        for token in self._expand(prefix):
+            total += len(self._postings[token])
+            if total > limit:
+                return float("inf")
+        return total
+
+    def _lookup(self, prefix: str) -> Set[str]:
+        postings = [self._postings[token] for token in self._expand(prefix)]
+        if len(postings) == 1:
+            return postings[0]
+        return set().union(*postings)
+
+    def match(self, query: str) -> Set[str]:
+        """IDs of the entities whose name matches every token of the query.
+
+        The query token with the fewest IDs is looked up first; the others
+        narrow it down, by checking names once few candidates are left. The
+        result may be an index posting set itself: treat it as read-only.
+        """
+        prefixes = tokenize(query)
+        if not prefixes:
+            return set()
+        best, best_count = prefixes[0], float("inf")
+        for prefix in prefixes:
+            count = self._count(prefix, best_count)
+            if count < best_count:
+                best, best_count = prefix, count
+        if not best_count:
+            return set()
+
+        result = self._lookup(best)
+        for prefix in prefixes:
+            if prefix == best or not result:
+                continue
+            if len(result) <= VERIFY_BELOW:
+                result = {
+                    entity_id for entity_id in result
+                    if any(token.startswith(prefix) for token in tokenize(self._names[entity_id]))
+                }
+            else:
+                result = result & self._lookup(prefix)
+        return result
+
+
+class SearchIndex:
+    """Storage listener maintaining the document and device name indexes."""
+
+    def __init__(self):
+        self.documents = PrefixIndex()
+        self.devices = PrefixIndex()
+
+    def reset(self) -> None:
+        self.documents.reset()
+        self.devices.reset()
+
+    def record(self, event: ChangeEvent) -> None:
+        if event.collection == DOCUMENTS:
+            index = self.documents
+        elif event.collection == DEVICES:
+            index = self.devices
+        else:
+            return
+        if event.op == DELETE:
+            index.remove(event.entity_id)
+        elif "name" in event.data:
+            index.add(event.entity_id, event.data["name"])
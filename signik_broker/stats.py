@@ -0,0 +1,199 @@
+"""Incrementally maintained broker statistics."""
+from collections import Counter
+from typing import Dict, Optional, Tuple
+import time
+
+from events import ChangeEvent, DELETE, DEVICES, DOCUMENTS, CONNECTIONS
+from models import DocStatus
+
+
+def _value(field):
+    """Plain value of an enum member (or the value itself)."""
+    return getattr(field, "value", field)
+
+
+class RollingCounter:
+    """Event count over a sliding window kept in a fixed-size ring of buckets."""
+
+    def __init__(self, bucket_seconds: float, bucket_count: int):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self._buckets = [0] * bucket_count
+        self._current = 0  # Absolute index of the newest bucket
+        self._total = 0
+
+    @property
+    def window_seconds(self) -> float:
+        return self.bucket_seconds * self.bucket_count
+
+    def _advance(self, now: float) -> None:
+        index = int(now // self.bucket_seconds)
+        if index <= self._current:
+            return
+        # Clear the buckets that fell out of the window (at most a full ring)
+        for absolute in range(max(self._current + 1, index - self.bucket_count + 1), index + 1):
+            slot = absolute % self.bucket_count
+            self._total -= self._buckets[slot]
+            self._buckets[slot] = 0
+        self._current = index
+
+    def add(self, amount: int = 1, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self._advance(now)
+        index = int(now // self.bucket_seconds)
+        if index <= self._current - self.bucket_count:
+            return  # Older than the window (e.g. replayed from the write-ahead log)
+        self._buckets[index % self.bucket_count] += amount
+        self._total += amount
+
+    def total(self, now: Optional[float] = None) -> int:
+        self._advance(time.time() if now is None else now)
+        return self._total
+
+
+class BrokerStats:
+    """Storage listener keeping O(1) counters for dashboards and /stats.
+
+    It tracks just enough per-entity state (device type and online flag,
+    document status and owner, connection status) to turn each change event
+    into counter deltas, independently of how the storage objects are mutated.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Zero every counter (the store is being reloaded)."""
+        self._devices: Dict[str, Tuple[str, bool]] = {}
+        self._documents: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._connections: Dict[str, str] = {}
+
+        self.devices_by_type: Counter = Counter()
+        self.online_by_type: Counter = Counter()
+        self.documents_by_status: Counter = Counter()
+        self.queue_depth: Counter = Counter()  # QUEUED documents per Windows device
+        self.connections_by_status: Counter = Counter()
+
+        self.signed = {
+            "1m": RollingCounter(1, 60),
+            "5m": RollingCounter(5, 60),
+            "1h": RollingCounter(60, 60),
+        }
+        self.signed_total = 0
+
+    # Listener
+
+    def record(self, event: ChangeEvent) -> None:
+        if event.collection == DEVICES:
+            self._record_device(event)
+        elif event.collection == DOCUMENTS:
+            self._record_document(event)
+        elif event.collection == CONNECTIONS:
+            self._record_connection(event)
+
+    def _record_device(self, event: ChangeEvent) -> None:
+        previous = self._devices.get(event.entity_id)
+        if previous:
+            device_type, online = previous
+        else:
+            device_type = _value(event.data.get("device_type"))
+            online = False
+            if device_type is None:
+                return
+            self.devices_by_type[device_type] += 1
+
+        is_online = event.data.get("is_online", online)
+        if is_online != online:
+            self.online_by_type[device_type] += 1 if is_online else -1
+        self._devices[event.entity_id] = (device_type, is_online)
+
+    def _record_document(self, event: ChangeEvent) -> None:
+        previous = self._documents.get(event.entity_id)
+        status = _value(event.data.get("status")) or (previous[0] if previous else None)
+        owner = event.data.get("windows_device_id", previous[1] if previous else None)
+        if status is None:
+            return
+
+        if previous:
+            old_status, old_owner = previous
+            if old_status == status:
+                return
+            self.documents_by_status[old_status] -= 1
+            if old_status == DocStatus.QUEUED.value and old_owner:
+                self.queue_depth[old_owner] -= 1
+                if not self.queue_depth[old_owner]:
+                    del self.queue_depth[old_owner]
+
+        self.documents_by_status[status] += 1
+        if status == DocStatus.QUEUED.value and owner:
+            self.queue_depth[owner] += 1
+        if status == DocStatus.SIGNED.value:
+            self.signed_total += 1
+            for counter in self.signed.values():
+                counter.add(now=event.timestamp)
+        self._documents[event.entity_id] = (status, owner)
+
+    def _record_connection(self, event: ChangeEvent) -> None:
+        previous = self._connections.pop(event.entity_id, None)
+        if previous:
+            self.connections_by_status[previous] -= 1
+        if event.op == DELETE:
+            return
+        status = _value(event.data.get("status")) or previous
+        self.connections_by_status[status] += 1
+        self._connections[event.entity_id] = status
+
+    # Queries
+
+    @property
+    def device_total(self) -> int:
+        return len(self._devices)
+
+    @property
+    def online_total(self) -> int:
+        return sum(self.online_by_type.values())
+
+    @property
+    def document_total(self) -> int:
+        return len(self._documents)
+
+    @property
+    def connection_total(self) -> int:
+        return len(self._connections)
+
+    def queued_for(self, windows_device_id: str) -> int:
+        """QUEUED documents owned by a Windows device."""
+        return self.queue_depth.get(windows_device_id, 0)
+
+    def snapshot(self) -> dict:
+        """All counters as a JSON-ready dict."""
+        now = time.time()
+        return {
+            "devices": {
+                "total": self.device_total,
+                "online": self.online_total,
+                "by_type": {
+                    device_type: {"total": total, "online": self.online_by_type[device_type]}
+                    for device_type, total in self.devices_by_type.items()
+                }
+            },
+            "documents": {
+                "total": self.document_total,
+                "by_status": {status.value: self.documents_by_status[status.value] for status in DocStatus},
+                "queue_depth_by_windows_device": dict(self.queue_depth)
+            },
+            "connections": {
+                "total": self.connection_total,
+                "by_status": {status: count for status, count in self.connections_by_status.items() if count}
+            },
+            "signing_throughput": {
+                "total": self.signed_total,
+                **{
+                    window: {
+                        "signed": counter.total(now),
+                        "per_minute": round(counter.total(now) * 60 / counter.window_seconds, 2)
+                    }
+                    for window, counter in self.signed.items()
+                }
+            }
+        }
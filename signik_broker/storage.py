@@ -1,43 +1,181 @@
 """In-memory storage manager for Signik Broker."""
-from typing import Dict, Optional, List
+from typing import Any, Callable, Dict, Iterable, Optional, List, Set, Tuple, Union
+from collections import defaultdict
 from datetime import datetime
 import asyncio
+import heapq
+import itertools
 import logging
+import time
 
 from models import (
     Device, Document, DeviceConnection, DeviceType, 
     DocStatus, ConnectionStatus
 )
+from records import DeviceRecord, DocumentRecord, ConnectionRecord
+from versions import VersionTracker
+from stats import BrokerStats
+from memory import MemoryAccounting, estimate_collection
+from search_index import SearchIndex
+from events import (
+    ChangeEvent, ChangeFeed, DEVICES, DOCUMENTS, CONNECTIONS, UPSERT, UPDATE, DELETE
+)
 
 logger = logging.getLogger(__name__)
 
+# Document fields a status change may set alongside the status (updated_at only when replaying the log)
+DOCUMENT_UPDATE_FIELDS = frozenset((
+    "updated_at", "windows_device_id", "android_device_id", "signature_data", "lease_expires_at",
+    "delivery_attempts"
+))
+
+
+def _page(matches: List[Any], limit: int, offset: int) -> Tuple[int, List[Any]]:
+    """Total and the requested page of records sorted by name, then ID."""
+    page = heapq.nsmallest(offset + limit, matches, key=lambda record: (record.name.lower(), record.id))
+    return len(matches), page[offset:]
+
 
 class StorageManager:
     """Manages in-memory storage for devices, documents, and connections."""
     
-    def __init__(self):
-        self.devices: Dict[str, Device] = {}
-        self.documents: Dict[str, Document] = {}
-        self.device_connections: Dict[str, DeviceConnection] = {}
+    def __init__(self, change_history_size: int = 10000):
+        # Entities are kept as compact records (records.py); pydantic models are accepted on the way in
+        self.devices: Dict[str, DeviceRecord] = {}
+        self.documents: Dict[str, DocumentRecord] = {}
+        self.device_connections: Dict[str, ConnectionRecord] = {}
+        self._device_name_index: Dict[Tuple[str, DeviceType], str] = {}
+        # Routing indexes: online tablets, CONNECTED pairs and documents in flight per tablet
+        self._online_tablets: Set[str] = set()
+        self._tablet_peers: Dict[str, Set[str]] = {}
+        self._windows_peers: Dict[str, Set[str]] = {}
+        self._eligible_tablets: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, int] = {}
+        # Documents offered to several tablets at once and not claimed yet (in flight on each of them)
+        self._offers: Dict[str, Set[str]] = {}
+        # Documents of each bundle in enqueue order
+        self._bundles: Dict[str, Dict[str, DocumentRecord]] = {}
+        # Documents per status and lease deadlines as a min-heap of (deadline, token, doc_id)
+        self._docs_by_status: Dict[DocStatus, Dict[str, DocumentRecord]] = defaultdict(dict)
+        self._lease_heap: List[Tuple[float, int, str]] = []
+        self._lease_tokens: Dict[str, int] = {}
+        self._lease_counter = itertools.count()
+        # Change notification: sequence number of the last mutation and its listeners
+        self._seq = 0
+        self._replaying: Optional[Tuple[int, float]] = None  # (seq, timestamp) while re-applying a logged change
+        self._listeners: List[Callable[[ChangeEvent], None]] = []
+        self._reset_hooks: List[Callable[[], None]] = []
+        self.changes = ChangeFeed(history_size=change_history_size)
+        self.add_listener(self.changes.publish)
+        self.versions = VersionTracker()
+        self.add_listener(self.versions.record)
+        self.stats = BrokerStats()
+        self.add_listener(self.stats.record)
+        self.memory = MemoryAccounting()
+        self.add_listener(self.memory.record)
+        self.search = SearchIndex()
+        self.add_listener(self.search.record)
         self._lock = asyncio.Lock()
     
-    async def add_device(self, device: Device) -> None:
+    def add_listener(
+        self,
+        listener: Callable[[ChangeEvent], None],
+        on_reset: Optional[Callable[[], None]] = None
+    ) -> None:
+        """Register a callback run synchronously after every mutation.
+        
+        Listeners run while the lock is held and must not block or await.
+        ``on_reset`` is called when the store is emptied to restore a
+        snapshot, for listeners that keep history of their own.
+        """
+        self._listeners.append(listener)
+        if on_reset is not None:
+            self._reset_hooks.append(on_reset)
+    
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the latest mutation."""
+        return self._seq
+    
+    def _emit(self, event_type: str, collection: str, op: str, entity_id: str, data: Dict[str, Any]) -> None:
+        """Number a mutation and notify listeners. Caller holds the lock."""
+        if self._replaying:
+            seq, timestamp = self._replaying
+            self._seq = max(self._seq, seq)
+            event = ChangeEvent(seq, event_type, collection, op, entity_id, data, timestamp)
+        else:
+            self._seq += 1
+            event = ChangeEvent(self._seq, event_type, collection, op, entity_id, data)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error("Change listener failed on %s %s: %s", event_type, entity_id, e)
+    
+    def _put_device(self, device: Union[Device, DeviceRecord]) -> None:
+        """Store a device and keep the name index in sync. Caller holds the lock."""
+        if not isinstance(device, DeviceRecord):
+            device = DeviceRecord.from_model(device)
+        previous = self.devices.get(device.id)
+        if previous and (previous.name, previous.device_type) != (device.name, device.device_type):
+            self._device_name_index.pop((previous.name, previous.device_type), None)
+        self.devices[device.id] = device
+        self._device_name_index[(device.name, device.device_type)] = device.id
+        self._sync_presence(device)
+        self._emit(
+            "device_updated" if previous else "device_registered",
+            DEVICES, UPSERT, device.id, device.to_dict()
+        )
+    
+    def _sync_presence(self, device: DeviceRecord) -> None:
+        """Reflect a tablet's online flag in the routing indexes."""
+        if device.device_type != DeviceType.ANDROID:
+            return
+        peers = self._tablet_peers.get(device.id, ())
+        if device.is_online:
+            self._online_tablets.add(device.id)
+            for windows_id in peers:
+                self._eligible_tablets.setdefault(windows_id, set()).add(device.id)
+        else:
+            self._online_tablets.discard(device.id)
+            for windows_id in peers:
+                self._eligible_tablets.get(windows_id, set()).discard(device.id)
+    
+    def _sync_connection(self, connection: ConnectionRecord, connected: bool) -> None:
+        """Reflect a connection's CONNECTED state in the routing indexes."""
+        windows_id = connection.windows_device_id
+        android_id = connection.android_device_id
+        if connected:
+            self._tablet_peers.setdefault(android_id, set()).add(windows_id)
+            self._windows_peers.setdefault(windows_id, set()).add(android_id)
+            if android_id in self._online_tablets:
+                self._eligible_tablets.setdefault(windows_id, set()).add(android_id)
+        else:
+            self._tablet_peers.get(android_id, set()).discard(windows_id)
+            self._windows_peers.get(windows_id, set()).discard(android_id)
+            self._eligible_tablets.get(windows_id, set()).discard(android_id)
+    
+    async def add_device(self, device: Union[Device, DeviceRecord]) -> None:
         """Add or update a device."""
         async with self._lock:
-            self.devices[device.id] = device
+            self._put_device(device)
+    
+    async def add_devices(self, devices: List[Union[Device, DeviceRecord]]) -> None:
+        """Add or update several devices under a single lock acquisition."""
+        async with self._lock:
+            for device in devices:
+                self._put_device(device)
     
-    async def get_device(self, device_id: str) -> Optional[Device]:
+    async def get_device(self, device_id: str) -> Optional[DeviceRecord]:
         """Get a device by ID."""
         return self.devices.get(device_id)
     
-    async def find_device_by_name_and_type(self, name: str, device_type: DeviceType) -> Optional[Device]:
+    async def find_device_by_name_and_type(self, name: str, device_type: DeviceType) -> Optional[DeviceRecord]:
         """Find a device by name and type (for deduplication)."""
-        for device in self.devices.values():
-            if device.name == name and device.device_type == device_type:
-                return device
-        return None
+        device_id = self._device_name_index.get((name, device_type))
+        return self.devices.get(device_id) if device_id else None
     
-    async def get_all_devices(self, device_type: Optional[DeviceType] = None, online_only: bool = False) -> List[Device]:
+    async def get_all_devices(self, device_type: Optional[DeviceType] = None, online_only: bool = False) -> List[DeviceRecord]:
         """Get all devices with optional filtering."""
         devices = list(self.devices.values())
         
@@ -53,8 +191,17 @@ class StorageManager:
         """Update device heartbeat timestamp."""
         async with self._lock:
             if device_id in self.devices:
-                self.devices[device_id].last_heartbeat = datetime.now()
-                self.devices[device_id].is_online = True
+                device = self.devices[device_id]
+                device.last_heartbeat = datetime.now()
+                came_online = not device.is_online
+                if came_online:
+                    device.is_online = True
+                    self._sync_presence(device)
+                self._emit(
+                    "device_online" if came_online else "heartbeat",
+                    DEVICES, UPDATE, device_id,
+                    {"last_heartbeat": device.last_heartbeat, "is_online": True}
+                )
                 return True
             return False
     
@@ -62,52 +209,391 @@ class StorageManager:
         """Update device online status."""
         async with self._lock:
             if device_id in self.devices:
-                self.devices[device_id].is_online = is_online
+                device = self.devices[device_id]
+                if device.is_online == is_online:
+                    return
+                device.is_online = is_online
+                self._sync_presence(device)
+                self._emit(
+                    "device_online" if is_online else "device_offline",
+                    DEVICES, UPDATE, device_id, {"is_online": is_online}
+                )
+    
+    def get_online_tablets(self) -> Set[str]:
+        """Live view of the IDs of online Android devices. Do not mutate."""
+        return self._online_tablets
+    
+    def get_eligible_tablets(self, windows_device_id: str) -> Set[str]:
+        """Live view of online tablets CONNECTED to a Windows device. Do not mutate."""
+        return self._eligible_tablets.get(windows_device_id, set())
+    
+    def get_connected_peers(self, device_id: str) -> Set[str]:
+        """IDs of the devices CONNECTED to this one, from either side of the pairing."""
+        return self._tablet_peers.get(device_id, set()) | self._windows_peers.get(device_id, set())
+    
+    def has_connected_tablets(self, windows_device_id: str) -> bool:
+        """Whether a Windows device has any CONNECTED tablet, online or not."""
+        return bool(self._windows_peers.get(windows_device_id))
+    
+    def get_inflight_count(self, android_device_id: str) -> int:
+        """Number of documents currently SENT to a tablet."""
+        return self._inflight.get(android_device_id, 0)
+    
+    def _put_document(self, document: Union[Document, DocumentRecord]) -> None:
+        """Store a document and index it by status. Caller holds the lock."""
+        if not isinstance(document, DocumentRecord):
+            document = DocumentRecord.from_model(document)
+        previous = self.documents.get(document.id)
+        if previous:
+            self._docs_by_status[previous.status].pop(previous.id, None)
+            if previous.status == DocStatus.SENT and previous.android_device_id:
+                self._inflight[previous.android_device_id] = self._inflight.get(previous.android_device_id, 1) - 1
+            self._lease_tokens.pop(previous.id, None)
+            self._drop_offer(previous.id)
+        self.documents[document.id] = document
+        self._docs_by_status[document.status][document.id] = document
+        if document.bundle_id:
+            self._bundles.setdefault(document.bundle_id, {})[document.id] = document
+        if document.status == DocStatus.SENT and document.android_device_id:
+            self._inflight[document.android_device_id] = self._inflight.get(document.android_device_id, 0) + 1
+        if document.status == DocStatus.SENT and document.lease_expires_at:
+            self._track_lease(document.id, document.lease_expires_at.timestamp())  # Held or on offer
+        self._emit(
+            "document_updated" if previous else "document_added",
+            DOCUMENTS, UPSERT, document.id, document.to_dict()
+        )
     
-    async def add_document(self, document: Document) -> None:
+    def _set_document_status(self, doc: DocumentRecord, status: DocStatus, **kwargs) -> None:
+        """Apply a status transition and keep the status, in-flight and lease indexes in sync."""
+        unknown = kwargs.keys() - DOCUMENT_UPDATE_FIELDS
+        if unknown:
+            raise AttributeError(f"Document fields {sorted(unknown)} cannot be set by a status change")
+        previous_status = doc.status
+        previous_target = doc.android_device_id if previous_status == DocStatus.SENT else None
+        doc.status = status
+        doc.updated_at = datetime.now()
+        changes = {"status": status, "updated_at": doc.updated_at}
+        
+        # Update any additional fields
+        for key, value in kwargs.items():
+            setattr(doc, key, value)
+            changes[key] = value
+        
+        if previous_status != status:
+            self._docs_by_status[previous_status].pop(doc.id, None)
+            self._docs_by_status[status][doc.id] = doc
+        
+        current_target = doc.android_device_id if status == DocStatus.SENT else None
+        if previous_target != current_target:
+            if previous_target:
+                self._inflight[previous_target] = self._inflight.get(previous_target, 1) - 1
+            if current_target:
+                self._inflight[current_target] = self._inflight.get(current_target, 0) + 1
+        
+        if status != DocStatus.SENT or doc.android_device_id:
+            self._drop_offer(doc.id)  # Requeued, finished or claimed: the offer is over
+        if status != DocStatus.SENT and doc.id in self._lease_tokens:
+            del self._lease_tokens[doc.id]
+            doc.lease_expires_at = None
+            changes["lease_expires_at"] = None
+        
+        changes.setdefault("windows_device_id", doc.windows_device_id)
+        changes.setdefault("android_device_id", doc.android_device_id)
+        self._emit(
+            "document_status" if previous_status != status else "document_updated",
+            DOCUMENTS, UPDATE, doc.id, changes
+        )
+    
+    def _open_offer(self, doc: DocumentRecord, android_device_ids: Iterable[str]) -> None:
+        """Offer a SENT document to tablets, replacing any earlier offer. Caller holds the lock."""
+        self._drop_offer(doc.id)
+        offered = set(android_device_ids)
+        self._offers[doc.id] = offered
+        for device_id in offered:
+            self._inflight[device_id] = self._inflight.get(device_id, 0) + 1
+        self._emit("document_offer", DOCUMENTS, UPDATE, doc.id, {
+            "offered_to": sorted(offered),
+            "windows_device_id": doc.windows_device_id,
+            "android_device_id": None
+        })
+    
+    def _drop_offer(self, doc_id: str) -> Set[str]:
+        """Withdraw a document's open offer, freeing its tablets. Caller holds the lock."""
+        offered = self._offers.pop(doc_id, set())
+        for device_id in offered:
+            self._inflight[device_id] = self._inflight.get(device_id, 1) - 1
+        return offered
+    
+    def _track_lease(self, doc_id: str, deadline: float) -> None:
+        """Push a lease deadline, superseding any earlier one for the document."""
+        token = next(self._lease_counter)
+        self._lease_tokens[doc_id] = token
+        heapq.heappush(self._lease_heap, (deadline, token, doc_id))
+    
+    def _grant_lease(self, doc: DocumentRecord, lease_seconds: float) -> None:
+        """Give a SENT document a fresh lease deadline. Caller holds the lock."""
+        self._set_lease(doc, time.time() + lease_seconds)
+    
+    def _set_lease(self, doc: DocumentRecord, deadline: float) -> None:
+        """Set a SENT document's lease deadline (epoch seconds). Caller holds the lock."""
+        self._track_lease(doc.id, deadline)
+        doc.lease_expires_at = datetime.fromtimestamp(deadline)
+        self._emit("document_lease", DOCUMENTS, UPDATE, doc.id, {
+            "lease_expires_at": doc.lease_expires_at,
+            "windows_device_id": doc.windows_device_id,
+            "android_device_id": doc.android_device_id
+        })
+    
+    async def add_document(self, document: Union[Document, DocumentRecord]) -> None:
         """Add a document to the queue."""
         async with self._lock:
-            self.documents[document.id] = document
+            self._put_document(document)
+    
+    async def add_documents(self, documents: List[Union[Document, DocumentRecord]]) -> None:
+        """Add several documents under a single lock acquisition."""
+        async with self._lock:
+            for document in documents:
+                self._put_document(document)
     
-    async def get_document(self, doc_id: str) -> Optional[Document]:
+    async def get_bundle(self, bundle_id: str) -> List[DocumentRecord]:
+        """Documents of a bundle in enqueue order (empty if unknown)."""
+        return list(self._bundles.get(bundle_id, {}).values())
+    
+    async def get_document(self, doc_id: str) -> Optional[DocumentRecord]:
         """Get a document by ID."""
         return self.documents.get(doc_id)
     
-    async def get_all_documents(self, status: Optional[DocStatus] = None) -> List[Document]:
+    async def get_all_documents(self, status: Optional[DocStatus] = None) -> List[DocumentRecord]:
         """Get all documents with optional status filter."""
-        documents = list(self.documents.values())
-        
         if status:
-            documents = [d for d in documents if d.status == status]
-        
-        return documents
+            return list(self._docs_by_status[status].values())
+        return list(self.documents.values())
+    
+    def search_documents(
+        self,
+        query: str,
+        status: Optional[DocStatus] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> Tuple[int, List[DocumentRecord]]:
+        """Documents whose name matches the query: (total matches, one page ordered by name)."""
+        ids = self.search.documents.match(query)
+        pool = self._docs_by_status.get(status, {}) if status else self.documents
+        if len(ids) <= len(pool):
+            matches = [pool[doc_id] for doc_id in ids if doc_id in pool]
+        else:
+            matches = [doc for doc_id, doc in pool.items() if doc_id in ids]
+        return _page(matches, limit, offset)
+    
+    def search_devices(
+        self,
+        query: str,
+        device_type: Optional[DeviceType] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> Tuple[int, List[DeviceRecord]]:
+        """Devices whose name matches the query: (total matches, one page ordered by name)."""
+        matches = [
+            self.devices[device_id] for device_id in self.search.devices.match(query)
+            if not device_type or self.devices[device_id].device_type == device_type
+        ]
+        return _page(matches, limit, offset)
     
     async def update_document_status(self, doc_id: str, status: DocStatus, **kwargs) -> bool:
         """Update document status and optional fields."""
         async with self._lock:
             if doc_id in self.documents:
-                doc = self.documents[doc_id]
-                doc.status = status
-                doc.updated_at = datetime.now()
-                
-                # Update any additional fields
-                for key, value in kwargs.items():
-                    if hasattr(doc, key):
-                        setattr(doc, key, value)
-                
+                self._set_document_status(self.documents[doc_id], status, **kwargs)
                 return True
             return False
     
-    async def add_connection(self, connection: DeviceConnection) -> None:
+    async def lease_document(self, doc_id: str, android_device_id: str, lease_seconds: float) -> bool:
+        """Mark a document SENT to a tablet, holding a lease that expires without a signature."""
+        async with self._lock:
+            doc = self.documents.get(doc_id)
+            if not doc or doc.status == DocStatus.SENT:
+                return False
+            self._set_document_status(
+                doc,
+                DocStatus.SENT,
+                android_device_id=android_device_id,
+                delivery_attempts=doc.delivery_attempts + 1
+            )
+            self._grant_lease(doc, lease_seconds)
+            return True
+    
+    async def lease_documents(self, doc_ids: List[str], android_device_id: str, lease_seconds: float) -> List[str]:
+        """Lease several documents to one tablet at once; returns the IDs leased (already SENT ones are skipped)."""
+        leased = []
+        async with self._lock:
+            for doc_id in doc_ids:
+                doc = self.documents.get(doc_id)
+                if not doc or doc.status == DocStatus.SENT:
+                    continue
+                self._set_document_status(
+                    doc,
+                    DocStatus.SENT,
+                    android_device_id=android_device_id,
+                    delivery_attempts=doc.delivery_attempts + 1
+                )
+                self._grant_lease(doc, lease_seconds)
+                leased.append(doc_id)
+        return leased
+    
+    async def offer_document(self, doc_id: str, android_device_ids: List[str], lease_seconds: float) -> bool:
+        """Mark a document SENT to several tablets at once until one of them claims it.
+        
+        The document has no ``android_device_id`` while the offer is open and
+        counts as in flight on every offered tablet. The lease covers the
+        offer: if nobody claims it in time, it expires like any other.
+        """
+        async with self._lock:
+            doc = self.documents.get(doc_id)
+            if not doc or doc.status == DocStatus.SENT:
+                return False
+            self._set_document_status(
+                doc,
+                DocStatus.SENT,
+                android_device_id=None,
+                delivery_attempts=doc.delivery_attempts + 1
+            )
+            self._open_offer(doc, android_device_ids)
+            self._grant_lease(doc, lease_seconds)
+            return True
+    
+    async def withdraw_offer(self, doc_id: str, android_device_id: str) -> Optional[Set[str]]:
+        """Take one tablet off a document's open offer.
+        
+        Returns the tablets still offered the document, or None if the offer
+        is gone or never included this tablet. When nobody is left the
+        document goes back to QUEUED.
+        """
+        async with self._lock:
+            offered = self._offers.get(doc_id)
+            if not offered or android_device_id not in offered:
+                return None
+            doc = self.documents[doc_id]
+            remaining = offered - {android_device_id}
+            if remaining:
+                self._open_offer(doc, remaining)
+            else:
+                self._set_document_status(doc, DocStatus.QUEUED, android_device_id=None)
+            return remaining
+    
+    def is_offered(self, doc_id: str) -> bool:
+        """Whether a document is offered to several tablets and not claimed yet."""
+        return doc_id in self._offers
+    
+    async def claim_document(self, doc_id: str, android_device_id: str, lease_seconds: float) -> Optional[Set[str]]:
+        """Hand an offered document to the first tablet that claims it.
+        
+        Returns the other tablets it was offered to, or None if the claim
+        lost (already claimed, withdrawn, or never offered to this tablet).
+        """
+        async with self._lock:
+            offered = self._offers.get(doc_id)
+            if not offered or android_device_id not in offered:
+                return None
+            self._drop_offer(doc_id)
+            doc = self.documents[doc_id]
+            self._set_document_status(doc, DocStatus.SENT, android_device_id=android_device_id)
+            self._grant_lease(doc, lease_seconds)
+            return offered - {android_device_id}
+    
+    async def renew_lease(self, doc_id: str, lease_seconds: float) -> bool:
+        """Push back the lease deadline of a SENT document.
+        
+        Renewals while more than half the lease remains are skipped so that
+        frequent activity does not flood the deadline heap.
+        """
+        async with self._lock:
+            doc = self.documents.get(doc_id)
+            if not doc or doc.id not in self._lease_tokens:
+                return False
+            self._renew_lease(doc, lease_seconds)
+            return True
+    
+    def _renew_lease(self, doc: DocumentRecord, lease_seconds: float) -> None:
+        """Push back a leased document's deadline unless more than half remains. Caller holds the lock."""
+        if doc.lease_expires_at.timestamp() - time.time() < lease_seconds / 2:
+            self._grant_lease(doc, lease_seconds)
+    
+    async def store_signature(
+        self,
+        doc_id: str,
+        android_device_id: str,
+        signature_data: Any,
+        lease_seconds: float
+    ) -> bool:
+        """Save a signature preview from the tablet signing a document, renewing its lease.
+        
+        Only stored while the document is still SENT to that tablet; False if
+        it was reviewed, requeued or handed to another tablet meanwhile. The
+        status is left alone. The change event carries only the preview's
+        size, keeping in-progress previews out of the write-ahead log and the
+        replication stream; the review that ends signing logs the final one.
+        """
+        async with self._lock:
+            doc = self.documents.get(doc_id)
+            if not doc or doc.status != DocStatus.SENT or doc.android_device_id != android_device_id:
+                return False
+            doc.signature_data = signature_data
+            doc.updated_at = datetime.now()
+            self._emit("document_signature", DOCUMENTS, UPDATE, doc.id, {
+                "updated_at": doc.updated_at,
+                "signature_size": len(signature_data) if signature_data else 0,
+                "windows_device_id": doc.windows_device_id,
+                "android_device_id": doc.android_device_id
+            })
+            if doc.id in self._lease_tokens:
+                self._renew_lease(doc, lease_seconds)
+            return True
+    
+    def next_lease_deadline(self) -> Optional[float]:
+        """Epoch seconds of the earliest pending lease deadline, if any (may be stale)."""
+        return self._lease_heap[0][0] if self._lease_heap else None
+    
+    async def expire_leases(self, now: Optional[float] = None) -> List[Tuple[DocumentRecord, List[str]]]:
+        """Return SENT documents whose lease has run out to QUEUED.
+        
+        Returns (document, tablets that held it) pairs: the holder, or every
+        tablet of an unclaimed offer. Superseded heap entries from renewed or
+        released leases are discarded on the way.
+        """
+        now = time.time() if now is None else now
+        expired = []
+        async with self._lock:
+            while self._lease_heap and self._lease_heap[0][0] <= now:
+                _, token, doc_id = heapq.heappop(self._lease_heap)
+                if self._lease_tokens.get(doc_id) != token:
+                    continue
+                doc = self.documents[doc_id]
+                holders = sorted(self._drop_offer(doc_id)) if doc.android_device_id is None else [doc.android_device_id]
+                self._set_document_status(doc, DocStatus.QUEUED, android_device_id=None)
+                expired.append((doc, holders))
+        return expired
+    
+    def _put_connection(self, connection: Union[DeviceConnection, ConnectionRecord]) -> None:
+        """Store a connection and index it for routing. Caller holds the lock."""
+        if not isinstance(connection, ConnectionRecord):
+            connection = ConnectionRecord.from_model(connection)
+        previous = self.device_connections.get(connection.id)
+        if previous:
+            self._sync_connection(previous, False)
+        self.device_connections[connection.id] = connection
+        self._sync_connection(connection, connection.status == ConnectionStatus.CONNECTED)
+        self._emit("connection_added", CONNECTIONS, UPSERT, connection.id, connection.to_dict())
+    
+    async def add_connection(self, connection: Union[DeviceConnection, ConnectionRecord]) -> None:
         """Add a device connection."""
         async with self._lock:
-            self.device_connections[connection.id] = connection
+            self._put_connection(connection)
     
-    async def get_connection(self, connection_id: str) -> Optional[DeviceConnection]:
+    async def get_connection(self, connection_id: str) -> Optional[ConnectionRecord]:
         """Get a connection by ID."""
         return self.device_connections.get(connection_id)
     
-    async def get_device_connections(self, device_id: str) -> List[DeviceConnection]:
+    async def get_device_connections(self, device_id: str) -> List[ConnectionRecord]:
         """Get all connections for a specific device."""
         connections = []
         for conn in self.device_connections.values():
@@ -130,6 +616,13 @@ class StorageManager:
                 conn = self.device_connections[connection_id]
                 conn.status = status
                 conn.updated_at = datetime.now()
+                self._sync_connection(conn, status == ConnectionStatus.CONNECTED)
+                self._emit("connection_status", CONNECTIONS, UPDATE, connection_id, {
+                    "status": status,
+                    "updated_at": conn.updated_at,
+                    "windows_device_id": conn.windows_device_id,
+                    "android_device_id": conn.android_device_id
+                })
                 return True
             return False
     
@@ -137,11 +630,16 @@ class StorageManager:
         """Delete a connection."""
         async with self._lock:
             if connection_id in self.device_connections:
-                del self.device_connections[connection_id]
+                conn = self.device_connections.pop(connection_id)
+                self._sync_connection(conn, False)
+                self._emit("connection_removed", CONNECTIONS, DELETE, connection_id, {
+                    "windows_device_id": conn.windows_device_id,
+                    "android_device_id": conn.android_device_id
+                })
                 return True
             return False
     
-    async def get_all_connections(self, status: Optional[ConnectionStatus] = None) -> List[DeviceConnection]:
+    async def get_all_connections(self, status: Optional[ConnectionStatus] = None) -> List[ConnectionRecord]:
         """Get all connections with optional status filter."""
         connections = list(self.device_connections.values())
         
@@ -153,8 +651,151 @@ class StorageManager:
     async def check_device_timeouts(self, timeout_seconds: int = 30) -> None:
         """Check and update device online status based on heartbeat timeout."""
         now = datetime.now()
-        for device in self.devices.values():
+        for device in list(self.devices.values()):
             time_diff = (now - device.last_heartbeat).total_seconds()
             if time_diff > timeout_seconds and device.is_online:
                 await self.update_device_status(device.id, False)
-                logger.info(f"Device {device.name} ({device.id}) marked offline - no heartbeat for {time_diff:.0f}s")
\ No newline at end of file
+                logger.info("Device %s (%s) marked offline - no heartbeat for %.0fs", device.name, device.id, time_diff,
+                            extra={"device_id": device.id})
+    
+    def memory_usage(self) -> Dict[str, Any]:
+        """Estimated bytes per collection: records and the indexes over them (payload bytes excluded)."""
+        documents = estimate_collection(
+            self.documents, *self._docs_by_status.values(), self._lease_tokens, self._lease_heap, self._offers, self._bundles,
+            skip=("pdf_data", "signature_data")
+        )
+        documents["by_status"] = {
+            status.value: self.stats.documents_by_status[status.value] for status in DocStatus
+        }
+        return {
+            "devices": estimate_collection(
+                self.devices, self._device_name_index, self._online_tablets
+            ),
+            "documents": documents,
+            "connections": estimate_collection(
+                self.device_connections, self._tablet_peers, self._windows_peers, self._eligible_tablets
+            )
+        }
+    
+    # Recovery and replication
+    
+    def export_state(self) -> Dict[str, Any]:
+        """Plain-data copy of every entity as record rows, tagged with the sequence number it reflects."""
+        return {
+            "seq": self._seq,
+            "devices": [device.to_row() for device in self.devices.values()],
+            "documents": [doc.to_row() for doc in self.documents.values()],
+            "connections": [conn.to_row() for conn in self.device_connections.values()],
+            "offers": {doc_id: sorted(offered) for doc_id, offered in self._offers.items()}
+        }
+    
+    def _clear(self) -> None:
+        """Drop every entity and index. Caller holds the lock."""
+        self.devices.clear()
+        self.documents.clear()
+        self.device_connections.clear()
+        self._device_name_index.clear()
+        self._online_tablets.clear()
+        self._tablet_peers.clear()
+        self._windows_peers.clear()
+        self._eligible_tablets.clear()
+        self._inflight.clear()
+        self._offers.clear()
+        self._bundles.clear()
+        self._docs_by_status.clear()
+        self._lease_heap.clear()
+        self._lease_tokens.clear()
+        self.stats.reset()
+        self.memory.reset()
+        self.search.reset()
+        for reset in self._reset_hooks:
+            reset()
+    
+    async def restore_state(self, state: Dict[str, Any]) -> None:
+        """Replace the store's contents with an exported state.
+        
+        Listeners see one upsert per entity, all numbered with the state's
+        sequence number, so deltas and feed resumes from before it resync.
+        """
+        seq = state["seq"]
+        async with self._lock:
+            self._clear()
+            self._replaying = (seq, 0.0)
+            try:
+                for row in state["devices"]:
+                    self._put_device(DeviceRecord.from_row(row))
+                for row in state["documents"]:
+                    self._put_document(DocumentRecord.from_row(row))
+                for row in state["connections"]:
+                    self._put_connection(ConnectionRecord.from_row(row))
+                for doc_id, offered in state.get("offers", {}).items():
+                    self._open_offer(self.documents[doc_id], offered)
+            finally:
+                self._replaying = None
+            self._seq = seq
+            self.versions.reset(seq)
+            self.changes.reset(seq)
+    
+    async def apply_events(self, events: Iterable[ChangeEvent]) -> int:
+        """Re-apply logged changes in order, keeping their sequence numbers and timestamps.
+        
+        Events at or below the current sequence number are skipped, so
+        overlapping batches are harmless. Returns the number applied.
+        """
+        applied = 0
+        async with self._lock:
+            for event in events:
+                if event.seq <= self._seq:
+                    continue
+                self._replaying = (event.seq, event.timestamp)
+                try:
+                    self._apply_event(event)
+                    applied += 1
+                except (KeyError, AttributeError) as e:
+                    logger.warning("Skipping change %d (%s %s): %r", event.seq, event.type, event.entity_id, e)
+                finally:
+                    self._replaying = None
+                    self._seq = max(self._seq, event.seq)
+        return applied
+    
+    def _apply_event(self, event: ChangeEvent) -> None:
+        """Re-apply one change through the same index-maintaining paths as the original."""
+        data = event.data
+        if event.collection == DEVICES:
+            if event.op == UPSERT:
+                self._put_device(DeviceRecord(**data))
+                return
+            device = self.devices[event.entity_id]
+            for key, value in data.items():
+                setattr(device, key, value)
+            self._sync_presence(device)
+            self._emit(event.type, DEVICES, UPDATE, device.id, data)
+        elif event.collection == DOCUMENTS:
+            if event.op == UPSERT:
+                self._put_document(DocumentRecord(**data))
+                return
+            doc = self.documents[event.entity_id]
+            if "status" in data:
+                fields = dict(data)
+                self._set_document_status(doc, fields.pop("status"), **fields)
+            elif "offered_to" in data:
+                self._open_offer(doc, data["offered_to"])
+            elif "signature_size" in data:
+                # A signature preview: the data itself arrives with the review
+                doc.updated_at = data["updated_at"]
+                self._emit(event.type, DOCUMENTS, UPDATE, doc.id, data)
+            else:
+                self._set_lease(doc, data["lease_expires_at"].timestamp())
+        elif event.collection == CONNECTIONS:
+            if event.op == UPSERT:
+                self._put_connection(ConnectionRecord(**data))
+            elif event.op == UPDATE:
+                conn = self.device_connections[event.entity_id]
+                for key, value in data.items():
+                    setattr(conn, key, value)
+                self._sync_connection(conn, conn.status == ConnectionStatus.CONNECTED)
+                self._emit(event.type, CONNECTIONS, UPDATE, conn.id, data)
+            else:
+                conn = self.device_connections.pop(event.entity_id)
+                self._sync_connection(conn, False)
+                self._emit(event.type, CONNECTIONS, DELETE, conn.id, data)
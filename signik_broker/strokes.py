@@ -0,0 +1,138 @@
+"""Incremental signature strokes, accumulated per document.
+
+A ``signatureStroke`` message carries only the points drawn since the
+previous one, numbered from 1:
+
+    {"seq": 7, "segments": [{"stroke": 2, "points": [[x, y], ...]}, ...]}
+
+``stroke`` is the index of the stroke the points belong to: an existing
+stroke is extended, the next index starts a new one. The broker keeps the
+strokes of each document being signed, so a viewer that joins late or
+reconnects fetches one snapshot (``{"seq": 7, "strokes": [[[x, y], ...], ...]}``)
+instead of the whole stream, and the accepted signature is stored from it.
+"""
+from typing import Any, Dict, List, Optional
+import time
+
+# Outcomes of StrokeAccumulator.apply
+APPLIED = "applied"
+DUPLICATE = "duplicate"  # Already applied (resent after a reconnect)
+GAP = "gap"              # Earlier messages are missing; the sender should resend from snapshot seq + 1
+
+
+class StrokeError(ValueError):
+    """A stroke message that cannot be applied."""
+
+
+class StrokeSet:
+    """Strokes of one document and the last sequence number applied."""
+    __slots__ = ("seq", "strokes", "points", "renewed_at")
+
+    def __init__(self):
+        self.seq = 0
+        self.strokes: List[List[Any]] = []
+        self.points = 0
+        self.renewed_at = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "strokes": self.strokes}
+
+
+def _parse(data: Any) -> tuple:
+    if not isinstance(data, dict):
+        raise StrokeError("data must be an object")
+    seq, segments = data.get("seq"), data.get("segments")
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 1:
+        raise StrokeError("seq must be a positive integer")
+    if not isinstance(segments, list):
+        raise StrokeError("segments must be a list")
+    for segment in segments:
+        if not isinstance(segment, dict) or not isinstance(segment.get("points"), list):
+            raise StrokeError("each segment needs a points list")
+        stroke = segment.get("stroke")
+        if not isinstance(stroke, int) or isinstance(stroke, bool) or stroke < 0:
+            raise StrokeError("stroke must be a non-negative integer")
+    return seq, segments
+
+
+class StrokeAccumulator:
+    """Stroke sets of the documents currently being signed."""
+
+    def __init__(self, max_points: int = 100_000):
+        self.max_points = max_points
+        self._sets: Dict[str, StrokeSet] = {}
+        self.applied = 0
+        self.duplicates = 0
+        self.gaps = 0
+        self.rejected = 0
+
+    def apply(self, doc_id: str, data: Any) -> str:
+        """Apply one stroke message; raises ``StrokeError`` if it is malformed."""
+        try:
+            seq, segments = _parse(data)
+            strokes = self._sets.get(doc_id)
+            last = strokes.seq if strokes else 0
+            if seq <= last:
+                self.duplicates += 1
+                return DUPLICATE
+            if seq > last + 1:
+                self.gaps += 1
+                return GAP
+            strokes = strokes or StrokeSet()
+            added = sum(len(segment["points"]) for segment in segments)
+            if strokes.points + added > self.max_points:
+                raise StrokeError(f"signature exceeds {self.max_points} points")
+            count = len(strokes.strokes)
+            for segment in segments:
+                if segment["stroke"] > count:
+                    raise StrokeError(f"stroke {segment['stroke']} skips ahead of {count} strokes")
+                if segment["stroke"] == count:
+                    count += 1
+        except StrokeError:
+            self.rejected += 1
+            raise
+        # Validated as a whole first, so a bad segment leaves the set unchanged
+        for segment in segments:
+            if segment["stroke"] == len(strokes.strokes):
+                strokes.strokes.append([])
+            strokes.strokes[segment["stroke"]].extend(segment["points"])
+        strokes.points += added
+        strokes.seq = seq
+        self._sets[doc_id] = strokes
+        self.applied += 1
+        return APPLIED
+
+    def snapshot(self, doc_id: str) -> Dict[str, Any]:
+        """All strokes received so far (``seq`` 0 and no strokes if none)."""
+        strokes = self._sets.get(doc_id)
+        return strokes.snapshot() if strokes else {"seq": 0, "strokes": []}
+
+    def last_seq(self, doc_id: str) -> int:
+        strokes = self._sets.get(doc_id)
+        return strokes.seq if strokes else 0
+
+    def renew_due(self, doc_id: str, interval: float) -> bool:
+        """Whether the signer's lease should be renewed now (at most every ``interval`` seconds)."""
+        strokes = self._sets.get(doc_id)
+        if strokes is None:
+            return False
+        now = time.monotonic()
+        if now - strokes.renewed_at < interval:
+            return False
+        strokes.renewed_at = now
+        return True
+
+    def discard(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Forget a document's strokes, returning them if there were any."""
+        strokes = self._sets.pop(doc_id, None)
+        return strokes.snapshot() if strokes else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._sets),
+            "points": sum(strokes.points for strokes in self._sets.values()),
+            "applied": self.applied,
+            "duplicates": self.duplicates,
+            "gaps": self.gaps,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,217 @@
+"""Per-document timeline of status changes and routing decisions.
+
+An append-only, in-memory log for auditing and debugging slow signatures.
+Events are filed in fixed-width time buckets, so a time range query reads
+only the buckets it overlaps, and retention drops the oldest events first.
+Each document also keeps its own events in order. Status changes arrive
+as change events, routing decisions are recorded by WebSocketManager.
+Storage listeners run under the storage lock, so a change event is only
+queued there; it is filed with the next routing decision or read, after
+the lock is released.
+"""
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List, Optional
+import time
+
+from events import ChangeEvent, DOCUMENTS
+
+# Event kinds: a status transition, then the routing decisions
+STATUS = "status"
+DISPATCHED = "dispatched"        # Sent to one tablet
+OFFERED = "offered"              # Offered to a tablet alongside others (parallel dispatch)
+CLAIMED = "claimed"              # Kept by the first tablet of an offer to start signing
+QUEUED = "queued"                # Waiting for a busy tablet; detail is the queue position
+UNROUTABLE = "unroutable"        # No tablet available
+LEASE_EXPIRED = "lease_expired"  # Taken back from a tablet that never signed
+
+# Change event types that carry a new status
+_STATUS_EVENTS = ("document_added", "document_status")
+
+# Most events evicted by one append, so no single mutation pays for a backlog
+EXPIRE_PER_APPEND = 64
+
+
+class TimelineEvent:
+    """One entry of a document's timeline."""
+    __slots__ = ("timestamp", "doc_id", "kind", "status", "device_id", "detail")
+
+    def __init__(
+        self,
+        timestamp: float,
+        doc_id: str,
+        kind: str,
+        status: Optional[str] = None,
+        device_id: Optional[str] = None,
+        detail: Optional[str] = None
+    ):
+        self.timestamp = timestamp
+        self.doc_id = doc_id
+        self.kind = kind
+        self.status = status
+        self.device_id = device_id
+        self.detail = detail
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
+            "doc_id": self.doc_id,
+            "kind": self.kind,
+            "status": self.status,
+            "device_id": self.device_id,
+            "detail": self.detail
+        }
+
+
+class Timeline:
+    """Storage listener and routing log keeping the timelines of all documents.
+
+    Buckets are ``bucket_seconds`` wide and created as events arrive. An
+    event stamped before the newest bucket (a clock step back) is filed in
+    that bucket rather than reordering older ones. Buckets older than
+    ``retention_seconds``, and the oldest events past ``max_events``, are
+    evicted oldest first, at most ``EXPIRE_PER_APPEND`` per append, so a
+    large backlog is worked off over the following appends instead of
+    stalling one of them. ``record`` only queues the change event (at most
+    ``max_events`` of them, the oldest dropped first).
+    """
+
+    def __init__(self, bucket_seconds: float = 60.0, retention_seconds: float = 86400.0, max_events: int = 200_000):
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+        self.max_events = max_events
+        self._starts: Deque[float] = deque()  # Bucket start times, ascending
+        self._buckets: Deque[Deque[TimelineEvent]] = deque()
+        self._documents: Dict[str, Deque[TimelineEvent]] = {}
+        self._incoming: Deque[ChangeEvent] = deque(maxlen=max_events)  # Status changes not filed yet
+        self._size = 0
+        self.appended = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        self._absorb()
+        return self._size
+
+    def record(self, event: ChangeEvent) -> None:
+        """Storage listener: queue document status transitions to be filed outside the lock."""
+        if event.collection != DOCUMENTS or event.type not in _STATUS_EVENTS:
+            return
+        if len(self._incoming) == self._incoming.maxlen:
+            self.evicted += 1  # Past max_events before it was even filed
+        self._incoming.append(event)
+
+    def _absorb(self) -> None:
+        """File the queued status changes, oldest first."""
+        while self._incoming:
+            event = self._incoming.popleft()
+            data = event.data
+            self.append(TimelineEvent(
+                event.timestamp,
+                event.entity_id,
+                STATUS,
+                getattr(data.get("status"), "value", data.get("status")),
+                data.get("android_device_id") or data.get("windows_device_id")
+            ))
+
+    def route(self, doc_id: str, kind: str, device_id: Optional[str] = None, detail: Any = None) -> None:
+        """Log a routing decision taken now."""
+        self._absorb()
+        self.append(TimelineEvent(
+            time.time(), doc_id, kind, device_id=device_id, detail=None if detail is None else str(detail)
+        ))
+
+    def append(self, event: TimelineEvent) -> None:
+        start = event.timestamp - event.timestamp % self.bucket_seconds
+        if not self._starts or start > self._starts[-1]:
+            self._starts.append(start)
+            self._buckets.append(deque())
+        self._buckets[-1].append(event)
+        timeline = self._documents.get(event.doc_id)
+        if timeline is None:
+            timeline = self._documents[event.doc_id] = deque()
+        timeline.append(event)
+        self._size += 1
+        self.appended += 1
+        self._expire(event.timestamp)
+
+    def _expire(self, now: float) -> None:
+        horizon = now - self.retention_seconds
+        for _ in range(EXPIRE_PER_APPEND):
+            expired = len(self._starts) > 1 and self._starts[0] + self.bucket_seconds <= horizon
+            if not expired and self._size <= self.max_events:
+                return
+            oldest = self._buckets[0]
+            self._forget(oldest.popleft())
+            if not oldest:
+                self._starts.popleft()
+                self._buckets.popleft()
+
+    def reset(self) -> None:
+        """Forget every event (the store was replaced by a snapshot)."""
+        self._starts.clear()
+        self._buckets.clear()
+        self._documents.clear()
+        self._incoming.clear()
+        self._size = 0
+
+    def _forget(self, event: TimelineEvent) -> None:
+        """Drop an evicted event from its document (where it is the oldest)."""
+        timeline = self._documents[event.doc_id]
+        timeline.popleft()
+        if not timeline:
+            del self._documents[event.doc_id]
+        self._size -= 1
+        self.evicted += 1
+
+    def document(self, doc_id: str) -> List[TimelineEvent]:
+        """A document's retained events, oldest first."""
+        self._absorb()
+        return list(self._documents.get(doc_id, ()))
+
+    def recent(self, count: int) -> List[TimelineEvent]:
+        """Up to ``count`` of the newest events, newest bucket only."""
+        self._absorb()
+        return list(islice(reversed(self._buckets[-1]), count)) if self._buckets else []
+
+    def between(self, start: float, end: float) -> Iterator[TimelineEvent]:
+        """Events stamped in [start, end), oldest bucket first."""
+        self._absorb()
+        first = max(0, bisect_right(self._starts, start) - 1)
+        last = bisect_left(self._starts, end)
+        for index in range(first, last):
+            for event in self._buckets[index]:
+                if start <= event.timestamp < end:
+                    yield event
+
+    def query(
+        self,
+        start: float,
+        end: float,
+        kind: Optional[str] = None,
+        device_id: Optional[str] = None,
+        limit: int = 1000
+    ) -> Dict[str, Any]:
+        """Events in [start, end), optionally of one kind or device, up to ``limit``."""
+        events = []
+        truncated = False
+        for event in self.between(start, end):
+            if (kind and event.kind != kind) or (device_id and event.device_id != device_id):
+                continue
+            if len(events) == limit:
+                truncated = True
+                break
+            events.append(event.to_dict())
+        return {"events": events, "truncated": truncated}
+
+    def stats(self) -> Dict[str, Any]:
+        self._absorb()
+        return {
+            "events": self._size,
+            "documents": len(self._documents),
+            "buckets": len(self._buckets),
+            "oldest": datetime.fromtimestamp(self._starts[0]).isoformat() if self._starts else None,
+            "appended": self.appended,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,94 @@
+"""Per-collection and per-entity version tracking for delta sync."""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from events import ChangeEvent, DELETE, DEVICES, DOCUMENTS, CONNECTIONS
+
+
+class CollectionVersions:
+    """Versions of one collection, ordered by last change.
+
+    Entities are kept in an OrderedDict moved to the end on every change,
+    so "what changed since version N" walks backwards from the newest entry
+    and stops at the first one that is not newer than N.
+    """
+
+    def __init__(self, max_tombstones: int):
+        self.version = 0
+        self.floor = 0  # Oldest version a delta can still be computed from
+        self.max_tombstones = max_tombstones
+        self._entries: "OrderedDict[str, Tuple[int, bool]]" = OrderedDict()
+        self._tombstones = 0
+
+    def record(self, entity_id: str, version: int, deleted: bool) -> None:
+        previous = self._entries.pop(entity_id, None)
+        if previous and previous[1]:
+            self._tombstones -= 1
+        self._entries[entity_id] = (version, deleted)
+        self.version = version
+        if deleted:
+            self._tombstones += 1
+            if self._tombstones > self.max_tombstones:
+                self._prune_tombstones()
+
+    def entity_version(self, entity_id: str) -> int:
+        entry = self._entries.get(entity_id)
+        return entry[0] if entry and not entry[1] else 0
+
+    def changed_since(self, since: int) -> Optional[Tuple[List[str], List[str]]]:
+        """(changed IDs, deleted IDs) newer than ``since``, or None if too old to tell."""
+        if since < self.floor or since > self.version:
+            return None  # Too old, or from before a restart
+        changed, deleted = [], []
+        for entity_id, (version, is_deleted) in reversed(self._entries.items()):
+            if version <= since:
+                break
+            (deleted if is_deleted else changed).append(entity_id)
+        return changed, deleted
+
+    def reset(self, version: int) -> None:
+        """Start over from ``version`` with every current entity at that version."""
+        self.version = max(self.version, version)
+        self.floor = max(self.floor, version)
+
+    def _prune_tombstones(self) -> None:
+        """Forget the oldest half of the tombstones and raise the delta floor."""
+        to_drop = self._tombstones - self.max_tombstones // 2
+        for entity_id, (version, is_deleted) in list(self._entries.items()):
+            if to_drop <= 0:
+                break
+            if is_deleted:
+                del self._entries[entity_id]
+                self._tombstones -= 1
+                self.floor = version
+                to_drop -= 1
+
+
+class VersionTracker:
+    """Storage listener maintaining monotonic versions per collection and entity.
+
+    Versions are StorageManager change sequence numbers, so they also line
+    up with change feed event IDs.
+    """
+
+    def __init__(self, max_tombstones: int = 10000):
+        self.collections: Dict[str, CollectionVersions] = {
+            name: CollectionVersions(max_tombstones) for name in (DEVICES, DOCUMENTS, CONNECTIONS)
+        }
+
+    def record(self, event: ChangeEvent) -> None:
+        self.collections[event.collection].record(event.entity_id, event.seq, event.op == DELETE)
+
+    def reset(self, version: int) -> None:
+        """Raise every collection to a restored state's version; older deltas are refused."""
+        for collection in self.collections.values():
+            collection.reset(version)
+
+    def version(self, collection: str) -> int:
+        return self.collections[collection].version
+
+    def entity_version(self, collection: str, entity_id: str) -> int:
+        return self.collections[collection].entity_version(entity_id)
+
+    def changed_since(self, collection: str, since: int) -> Optional[Tuple[List[str], List[str]]]:
+        return self.collections[collection].changed_since(since)
@@ -1,23 +1,72 @@
 """WebSocket connection and message routing manager."""
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
+import asyncio
 import json
 import logging
 from datetime import datetime
 
-from models import SignikMessage, DocStatus, DeviceType
+from models import SignikMessage, DocStatus
 from storage import StorageManager
+from records import DocumentRecord
+from routing import TargetSelector, LEAST_LOADED
+from scheduler import DispatchScheduler, PARALLEL, SINGLE
+from frames import FrameHeader, pack_frame, parse_frame_header
+from events import EventFilter, Subscription
+from workers import PayloadWorkers, INLINE, encode_message
+from previews import PreviewCoalescer
+from bundles import SIGNED_STATUSES, is_complete, manifest
+from strokes import APPLIED, GAP, StrokeAccumulator, StrokeError
+from presence import PresenceTracker
+from timeline import Timeline, CLAIMED, DISPATCHED, LEASE_EXPIRED, OFFERED, QUEUED, UNROUTABLE
+from log_pipeline import CategoryLogger, BINARY, CONNECTION, DISPATCH, ROUTE
 
 logger = logging.getLogger(__name__)
+route_log = CategoryLogger(logger, ROUTE)
+binary_log = CategoryLogger(logger, BINARY)
+connection_log = CategoryLogger(logger, CONNECTION)
+dispatch_log = CategoryLogger(logger, DISPATCH)
 
 
 class WebSocketManager:
     """Manages WebSocket connections and message routing."""
     
-    def __init__(self, storage: StorageManager):
+    def __init__(
+        self,
+        storage: StorageManager,
+        routing_strategy: str = LEAST_LOADED,
+        max_inflight_per_tablet: int = 1,
+        lease_seconds: float = 300.0,
+        workers: Optional[PayloadWorkers] = None,
+        preview_max_per_second: float = 15.0,
+        preview_store_interval: float = 1.0,
+        dispatch_mode: str = SINGLE,
+        parallel_offers: int = 3,
+        timeline: Optional[Timeline] = None,
+        presence_online_delay: float = 1.0,
+        presence_offline_delay: float = 5.0
+    ):
+        if dispatch_mode not in (SINGLE, PARALLEL):
+            raise ValueError(f"Unknown dispatch mode: {dispatch_mode}")
         self.connections: Dict[str, WebSocket] = {}
+        self.feed_tasks: Dict[str, asyncio.Task] = {}
         self.storage = storage
-        self.last_target_device: Optional[str] = None
+        self.lease_seconds = lease_seconds
+        self.dispatch_mode = dispatch_mode
+        self.parallel_offers = parallel_offers
+        self.workers = workers or PayloadWorkers(INLINE)
+        self.scheduler = DispatchScheduler(storage, max_inflight_per_tablet)
+        self.selector = TargetSelector(storage, routing_strategy, backlog=self.scheduler.pending_count)
+        self.previews = PreviewCoalescer(
+            self._deliver_preview, self._store_preview, preview_max_per_second, preview_store_interval
+        )
+        self.strokes = StrokeAccumulator()
+        self.timeline = timeline or Timeline()
+        storage.add_listener(self.timeline.record, on_reset=self.timeline.reset)
+        self.presence = PresenceTracker(self._publish_presence, presence_online_delay, presence_offline_delay)
+        self.presence_subscribers: Set[str] = set()
+        self._presence_tasks: Set[asyncio.Task] = set()  # Broadcasts in flight, held so they are not collected
+        storage.add_listener(self.presence.record)
     
     async def connect(self, device_id: str, websocket: WebSocket) -> bool:
         """Connect a device WebSocket."""
@@ -28,40 +77,44 @@ class WebSocketManager:
         
         await websocket.accept()
         self.connections[device_id] = websocket
-        logger.info(f"Device {device.name} ({device_id}) connected via WebSocket")
+        connection_log.info("Device %s (%s) connected via WebSocket", device.name, device_id,
+                            extra={"device_id": device_id})
         return True
     
     def disconnect(self, device_id: str) -> None:
         """Disconnect a device WebSocket."""
         if device_id in self.connections:
             del self.connections[device_id]
-            logger.info(f"Device {device_id} disconnected from WebSocket")
+            self.selector.forget_device(device_id)
+            self._stop_feed(device_id)
+            self.presence_subscribers.discard(device_id)
+            connection_log.info("Device %s disconnected from WebSocket", device_id, extra={"device_id": device_id})
     
     async def send_to_device(self, device_id: str, message: dict) -> bool:
         """Send a JSON message to a specific device."""
         if device_id not in self.connections:
-            logger.warning(f"Cannot send message to {device_id} - not connected")
+            logger.warning("Cannot send message to %s - not connected", device_id, extra={"device_id": device_id})
             return False
         
         try:
             await self.connections[device_id].send_text(json.dumps(message))
             return True
         except Exception as e:
-            logger.error(f"Error sending message to {device_id}: {e}")
+            logger.error("Error sending message to %s: %s", device_id, e, extra={"device_id": device_id})
             self.disconnect(device_id)
             return False
     
     async def send_bytes_to_device(self, device_id: str, data: bytes) -> bool:
         """Send binary data to a specific device."""
         if device_id not in self.connections:
-            logger.warning(f"Cannot send binary data to {device_id} - not connected")
+            logger.warning("Cannot send binary data to %s - not connected", device_id, extra={"device_id": device_id})
             return False
         
         try:
             await self.connections[device_id].send_bytes(data)
             return True
         except Exception as e:
-            logger.error(f"Error sending binary data to {device_id}: {e}")
+            logger.error("Error sending binary data to %s: %s", device_id, e, extra={"device_id": device_id})
             self.disconnect(device_id)
             return False
     
@@ -72,58 +125,203 @@ class WebSocketManager:
     
     async def route_binary_data(self, binary_data: bytes, sender_device_id: str) -> bool:
         """Route binary PDF data to the appropriate device."""
-        logger.info(f"Routing {len(binary_data)} bytes from {sender_device_id}")
+        binary_log.info("Routing %d bytes from %s", len(binary_data), sender_device_id,
+                        extra={"device_id": sender_device_id, "bytes": len(binary_data)})
+        
+        header = parse_frame_header(binary_data)
+        if header:
+            return await self._route_tagged_frame(header, binary_data, sender_device_id)
         
-        # Use last target device if available
-        if self.last_target_device and self.last_target_device in self.connections:
-            device = await self.storage.get_device(self.last_target_device)
+        # Use this sender's last target device if still reachable
+        target_device_id = self.selector.last_target.get(sender_device_id)
+        if target_device_id and target_device_id in self.connections:
+            device = await self.storage.get_device(target_device_id)
             if device and device.is_online:
-                success = await self.send_bytes_to_device(self.last_target_device, binary_data)
+                success = await self.send_bytes_to_device(target_device_id, binary_data)
                 if success:
-                    logger.info(f"Binary data sent to target device {device.name}")
+                    binary_log.info("Binary data sent to target device %s", device.name,
+                                    extra={"device_id": target_device_id})
                     return True
         
-        # Fallback: send to first available Android device
-        android_devices = await self.storage.get_all_devices(
-            device_type=DeviceType.ANDROID, 
-            online_only=True
+        # Fallback: pick a tablet connected to the sender
+        target_device_id = await self.selector.select(
+            sender_device_id,
+            is_reachable=self.connections.__contains__
         )
+        if target_device_id:
+            success = await self.send_bytes_to_device(target_device_id, binary_data)
+            if success:
+                binary_log.info("Binary data sent to fallback device %s", target_device_id,
+                                extra={"device_id": target_device_id})
+                return True
         
-        for device in android_devices:
-            if device.id in self.connections:
-                success = await self.send_bytes_to_device(device.id, binary_data)
-                if success:
-                    logger.info(f"Binary data sent to fallback device {device.name}")
-                    return True
+        logger.warning("No available Android devices for binary routing", extra={"device_id": sender_device_id})
+        return False
+    
+    async def _route_tagged_frame(self, header: FrameHeader, frame: bytes, sender_device_id: str) -> bool:
+        """Forward a frame tagged with a document ID to that document's peer device."""
+        doc = await self.storage.get_document(header.doc_id)
         
-        logger.warning("No available Android devices for binary routing")
+        target_device_id = None
+        reason = None
+        if not doc:
+            reason = "unknown_document"
+        elif sender_device_id == doc.windows_device_id:
+            # The PC feeds the tablet holding the document, only while it is out for signing
+            if doc.status != DocStatus.SENT:
+                reason = "document_not_sent"
+            elif not doc.android_device_id:
+                reason = "document_not_assigned"
+            else:
+                target_device_id = doc.android_device_id
+        elif sender_device_id == doc.android_device_id:
+            # The holder may still send the signed PDF once its signature is accepted
+            if doc.status in (DocStatus.SENT, DocStatus.SIGNED):
+                target_device_id = doc.windows_device_id
+            else:
+                reason = "document_not_sent"
+        else:
+            reason = "not_a_party"
+        
+        if target_device_id and await self.send_bytes_to_device(target_device_id, frame):
+            return True
+        
+        reason = reason or "target_unavailable"
+        logger.warning(
+            "Cannot route frame for document %s (stream %s): %s", header.doc_id, header.stream_id, reason,
+            extra={"device_id": sender_device_id, "doc_id": header.doc_id}
+        )
+        await self.send_to_device(sender_device_id, {
+            "type": "binaryRouteFailed",
+            "doc_id": header.doc_id,
+            "stream_id": header.stream_id,
+            "reason": reason
+        })
         return False
     
     async def route_message(self, message: SignikMessage, sender_ws: WebSocket) -> None:
         """Route messages between devices based on message type and document state."""
-        logger.info(f"Routing message type '{message.type}' from device {message.sender_device_id}")
+        route_log.info("Routing message type '%s' from device %s", message.type, message.sender_device_id, extra={
+            "device_id": message.sender_device_id, "doc_id": message.doc_id, "message_type": message.type
+        })
         
         if message.type == "sendStart":
             await self._handle_send_start(message)
         
+        elif message.type == "bundleStart":
+            await self._handle_bundle_start(message)
+        
         elif message.type == "signaturePreview":
             await self._handle_signature_preview(message)
         
+        elif message.type == "signatureStroke":
+            await self._handle_signature_stroke(message)
+        
+        elif message.type == "strokeSnapshotRequest":
+            await self._handle_stroke_snapshot_request(message)
+        
         elif message.type in ["signatureAccepted", "signatureDeclined"]:
             await self._handle_signature_review(message)
         
         elif message.type == "signedComplete":
             await self._handle_signed_complete(message)
         
+        elif message.type == "subscribe":
+            await self._handle_subscribe(message)
+        
+        elif message.type == "unsubscribe":
+            options = message.data if isinstance(message.data, dict) else {}
+            if options.get("topic") == "presence":
+                self.presence_subscribers.discard(message.sender_device_id)
+            else:
+                self._stop_feed(message.sender_device_id)
+        
         elif message.type == "connectionRequest":
             # Handle connection request forwarding
             if message.device_id and message.device_id in self.connections:
                 await self.send_to_device(message.device_id, message.dict())
         
         else:
-            logger.warning(f"Unknown message type: {message.type}")
+            logger.warning("Unknown message type: %s", message.type, extra={"device_id": message.sender_device_id})
     
-    async def _handle_send_start(self, message: SignikMessage) -> None:
+    async def _handle_subscribe(self, message: SignikMessage) -> None:
+        """Start streaming storage changes (topic "changes") or peer presence (topic "presence") to the sender.
+        
+        A "changes" feed only carries events concerning the sender: its own
+        device record, its connections and the documents it sent or holds.
+        ``data`` may carry ``status``, ``collections`` and ``last_event_id``
+        with the same meaning as on ``GET /events``.
+        """
+        options = message.data if isinstance(message.data, dict) else {}
+        device_id = message.sender_device_id
+        topic = options.get("topic", "changes")
+        if topic == "presence":
+            self.presence_subscribers.add(device_id)
+            await self._send_presence_snapshot(device_id)
+            return
+        if topic != "changes":
+            logger.warning("Unknown subscription topic: %s", topic)
+            return
+        
+        self._stop_feed(device_id)
+        event_filter = EventFilter(
+            device_id=device_id,
+            status=options.get("status"),
+            collections=options.get("collections")
+        )
+        subscription = self.storage.changes.subscribe(event_filter, options.get("last_event_id"))
+        self.feed_tasks[device_id] = asyncio.create_task(self._forward_changes(device_id, subscription))
+    
+    async def _forward_changes(self, device_id: str, subscription: Subscription) -> None:
+        """Push subscribed change events to a device until it unsubscribes or lags."""
+        try:
+            while device_id in self.connections:
+                batch = await subscription.next_batch()
+                if subscription.lagged:
+                    await self.send_to_device(device_id, {
+                        "type": "changeFeedResync",
+                        "last_event_id": self.storage.changes.last_seq
+                    })
+                    return
+                for event in batch:
+                    if not await self.send_to_device(device_id, {"type": "change", "event": event.to_public()}):
+                        return
+        finally:
+            self.storage.changes.unsubscribe(subscription)
+            if self.feed_tasks.get(device_id) is asyncio.current_task():
+                del self.feed_tasks[device_id]
+    
+    def _stop_feed(self, device_id: str) -> None:
+        """Cancel a device's change feed subscription, if any."""
+        task = self.feed_tasks.pop(device_id, None)
+        if task:
+            task.cancel()
+    
+    async def _send_presence_snapshot(self, device_id: str) -> None:
+        """Tell a new presence subscriber where each of its peers stands; changes follow as "presence"."""
+        peers = [self.presence.state(peer) for peer in sorted(self.storage.get_connected_peers(device_id))]
+        await self.send_to_device(device_id, {
+            "type": "presenceSnapshot",
+            "devices": [peer for peer in peers if peer is not None]
+        })
+    
+    def _publish_presence(self, device_id: str, online: bool, since: float) -> None:
+        """Push a settled presence change to the subscribed peers of the device."""
+        targets = [peer for peer in self.storage.get_connected_peers(device_id) if peer in self.presence_subscribers]
+        if not targets:
+            return
+        connection_log.info("Device %s is %s, telling %d peers", device_id, "online" if online else "offline",
+                            len(targets), extra={"device_id": device_id})
+        task = asyncio.create_task(self.broadcast_to_devices(targets, {
+            "type": "presence",
+            "device_id": device_id,
+            "is_online": online,
+            "since": since
+        }))
+        self._presence_tasks.add(task)
+        task.add_done_callback(self._presence_tasks.discard)
+    
+    async def _handle_send_start(self, message: SignikMessage, exclude_device_id: Optional[str] = None) -> None:
         """Handle PDF send start message from Windows to Android."""
         if not message.doc_id:
             logger.warning("sendStart message missing doc_id")
@@ -131,75 +329,428 @@ class WebSocketManager:
         
         doc = await self.storage.get_document(message.doc_id)
         if not doc:
-            logger.warning(f"Document {message.doc_id} not found")
+            logger.warning("Document %s not found", message.doc_id, extra={"doc_id": message.doc_id})
             return
         
-        # Update document status
-        await self.storage.update_document_status(
-            message.doc_id, 
-            DocStatus.SENT
+        if doc.status == DocStatus.SENT or self.scheduler.is_pending(message.doc_id):
+            logger.warning("Document %s is already sent or waiting for a tablet", message.doc_id,
+                           extra={"doc_id": message.doc_id})
+            return
+        
+        if self.dispatch_mode == PARALLEL and not message.device_id:
+            # Offer the document to every free tablet (up to parallel_offers); the first signer wins
+            targets = self.selector.select_many(
+                message.sender_device_id,
+                self.parallel_offers,
+                is_reachable=lambda device_id: (
+                    device_id in self.connections and device_id != exclude_device_id
+                    and self.scheduler.has_capacity(device_id)
+                )
+            )
+            if len(targets) > 1:
+                await self._offer(message, targets)
+                return
+        
+        # Determine target device among the tablets connected to the sender
+        target_device_id = await self.selector.select(
+            message.sender_device_id,
+            requested_device_id=message.device_id,
+            is_reachable=lambda device_id: device_id in self.connections and device_id != exclude_device_id
         )
+        if not target_device_id and exclude_device_id:
+            # No other tablet available: give the excluded one another chance
+            target_device_id = await self.selector.select(
+                message.sender_device_id,
+                is_reachable=self.connections.__contains__
+            )
         
-        # Determine target device
-        target_device_id = None
+        if not target_device_id:
+            logger.error("No available target device for document %s", message.doc_id, extra={"doc_id": message.doc_id})
+            self.timeline.route(message.doc_id, UNROUTABLE)
+            return
         
-        if message.device_id:
-            # Use specified target device
-            device = await self.storage.get_device(message.device_id)
-            if device and device.is_online:
-                target_device_id = message.device_id
-                self.last_target_device = target_device_id
-                logger.info(f"Using specified target device: {device.name}")
+        if self.scheduler.has_capacity(target_device_id):
+            await self._dispatch(message, target_device_id)
+            return
         
+        # Tablet is busy: wait in its queue and tell the sender where it stands
+        position = self.scheduler.enqueue(target_device_id, message)
+        self.timeline.route(message.doc_id, QUEUED, target_device_id, position)
+        dispatch_log.info(
+            "Document %s queued for device %s at position %d", message.doc_id, target_device_id, position,
+            extra={"device_id": target_device_id, "doc_id": message.doc_id}
+        )
+        await self._send_queue_update(message, target_device_id, position)
+    
+    async def _dispatch(self, message: SignikMessage, target_device_id: str) -> None:
+        """Push a document to a tablet and mark it SENT."""
+        doc = await self.storage.get_document(message.doc_id)
+        if not doc:
+            return
+        
+        dispatch_log.info("Routing document %s to device %s", message.doc_id, target_device_id,
+                          extra={"device_id": target_device_id, "doc_id": message.doc_id})
+        
+        # Mark SENT to the target under a lease that requeues it if never signed
+        if not await self.storage.lease_document(message.doc_id, target_device_id, self.lease_seconds):
+            logger.warning("Document %s was already sent", message.doc_id, extra={"doc_id": message.doc_id})
+            return
+        self.scheduler.record_sent(message.doc_id, target_device_id)
+        self.timeline.route(message.doc_id, DISPATCHED, target_device_id)
+        self.strokes.discard(message.doc_id)  # A new signer starts from a blank signature
+        if not await self._send_document(message, doc, target_device_id):
+            # The tablet may have part of it: take the document back rather than leave it leased
+            self.scheduler.forget(message.doc_id)
+            await self.storage.update_document_status(message.doc_id, DocStatus.QUEUED, android_device_id=None)
+            if doc.windows_device_id:
+                await self.send_to_device(doc.windows_device_id, {
+                    "type": "documentRequeued",
+                    "doc_id": message.doc_id,
+                    "previous_device_id": target_device_id
+                })
+    
+    async def _handle_bundle_start(self, message: SignikMessage) -> None:
+        """Send every unsigned document of a bundle to one tablet in a single pipelined transfer.
+        
+        The tablet gets one ``bundleStart`` with the manifest, followed by
+        each PDF as a tagged binary frame (stream ID = manifest position),
+        without a ``sendStart`` per document. A bundle is one visit, so it
+        goes to the tablet as a whole even past ``max_inflight_per_tablet``.
+        """
+        documents = await self.storage.get_bundle(message.bundle_id) if message.bundle_id else []
+        if not documents:
+            logger.warning("Bundle %s not found", message.bundle_id)
+            return
+        
+        target_device_id = await self.selector.select(
+            message.sender_device_id,
+            requested_device_id=message.device_id,
+            is_reachable=self.connections.__contains__
+        )
         if not target_device_id:
-            # Fallback: find first available Android device
-            android_devices = await self.storage.get_all_devices(
-                device_type=DeviceType.ANDROID,
-                online_only=True
-            )
+            logger.error("No available target device for bundle %s", message.bundle_id)
+            await self.send_to_device(message.sender_device_id, {
+                "type": "bundleFailed",
+                "bundle_id": message.bundle_id,
+                "reason": "no_tablet"
+            })
+            return
+        
+        unsigned = [doc.id for doc in documents if doc.status in (DocStatus.QUEUED, DocStatus.DECLINED)]
+        leased = await self.storage.lease_documents(unsigned, target_device_id, self.lease_seconds)
+        if not leased:
+            logger.warning("Bundle %s has no document left to send", message.bundle_id)
+            await self.send_to_device(message.sender_device_id, {
+                "type": "bundleFailed",
+                "bundle_id": message.bundle_id,
+                "reason": "nothing_to_send"
+            })
+            return
+        for doc_id in leased:
+            self.scheduler.record_sent(doc_id, target_device_id)
+            self.timeline.route(doc_id, DISPATCHED, target_device_id, f"bundle {message.bundle_id}")
+            self.strokes.discard(doc_id)
+        dispatch_log.info("Routing bundle %s (%d documents) to device %s", message.bundle_id, len(leased),
+                          target_device_id, extra={"device_id": target_device_id})
+        
+        bundle = manifest(message.bundle_id, documents)
+        sent = [(entry, doc) for entry, doc in zip(bundle["documents"], documents) if doc.id in leased]
+        bundle["documents"] = [entry for entry, _ in sent]
+        try:
+            socket = self.connections[target_device_id]
+            await socket.send_text(SignikMessage(
+                type="bundleStart",
+                bundle_id=message.bundle_id,
+                sender_device_id=message.sender_device_id,
+                device_id=target_device_id,
+                data=bundle
+            ).json())
+            for entry, doc in sent:
+                if doc.pdf_data:
+                    await socket.send_bytes(pack_frame(doc.id, doc.pdf_data, stream_id=entry["stream_id"]))
+        except Exception as e:
+            # The tablet may have part of the bundle: take it all back rather than leave it leased
+            logger.error("Error sending bundle %s to %s: %s", message.bundle_id, target_device_id, e,
+                         extra={"device_id": target_device_id})
+            self.disconnect(target_device_id)
+            for doc_id in leased:
+                self.scheduler.forget(doc_id)
+                await self.storage.update_document_status(doc_id, DocStatus.QUEUED, android_device_id=None)
+            await self.send_to_device(message.sender_device_id, {
+                "type": "bundleFailed",
+                "bundle_id": message.bundle_id,
+                "reason": "send_failed"
+            })
+            return
+        
+        await self.send_to_device(message.sender_device_id, {
+            "type": "bundleSent",
+            "bundle_id": message.bundle_id,
+            "device_id": target_device_id,
+            "doc_ids": leased
+        })
+    
+    async def _check_bundle_complete(self, bundle_id: str) -> None:
+        """Report a bundle once, when its last document has been signed."""
+        documents = await self.storage.get_bundle(bundle_id)
+        if not is_complete(documents):
+            return
+        report = {"type": "bundleComplete", "bundle_id": bundle_id, "data": manifest(bundle_id, documents)}
+        recipients = {documents[0].windows_device_id} | {doc.android_device_id for doc in documents}
+        for device_id in recipients:
+            if device_id and device_id in self.connections:
+                await self.send_to_device(device_id, report)
+    
+    async def _offer(self, message: SignikMessage, target_device_ids: List[str]) -> None:
+        """Push a document to several tablets at once; the first to start signing keeps it."""
+        doc = await self.storage.get_document(message.doc_id)
+        if not doc:
+            return
+        
+        dispatch_log.info("Offering document %s to %d devices", message.doc_id, len(target_device_ids),
+                          extra={"doc_id": message.doc_id})
+        
+        if not await self.storage.offer_document(message.doc_id, target_device_ids, self.lease_seconds):
+            logger.warning("Document %s was already sent", message.doc_id, extra={"doc_id": message.doc_id})
+            return
+        self.strokes.discard(message.doc_id)
+        for target_device_id in target_device_ids:
+            self.timeline.route(message.doc_id, OFFERED, target_device_id)
+            if await self._send_document(message, doc, target_device_id):
+                continue
+            # Nobody can act on an offer the tablet never got: take it off, or take the document back
+            remaining = await self.storage.withdraw_offer(message.doc_id, target_device_id)
+            if remaining == set():
+                logger.warning("Document %s reached none of its tablets; requeueing", message.doc_id,
+                               extra={"doc_id": message.doc_id})
+                if doc.windows_device_id:
+                    await self.send_to_device(doc.windows_device_id, {
+                        "type": "documentRequeued",
+                        "doc_id": message.doc_id,
+                        "previous_device_id": None
+                    })
+    
+    async def _send_document(self, message: SignikMessage, doc: DocumentRecord, target_device_id: str) -> bool:
+        """Send the sendStart message and the PDF to a tablet; False (and disconnected) if the socket failed."""
+        socket = self.connections.get(target_device_id)
+        if socket is None:
+            return False
+        try:
+            await socket.send_text(message.json())
             
-            if android_devices:
-                target_device_id = android_devices[0].id
-                self.last_target_device = target_device_id
-                logger.info(f"Using fallback device: {android_devices[0].name}")
+            # Send PDF data if available
+            if doc.pdf_data:
+                await socket.send_bytes(doc.pdf_data)
+                dispatch_log.info("Sent PDF data (%d bytes) to device", len(doc.pdf_data), extra={
+                    "device_id": target_device_id, "doc_id": doc.id, "bytes": len(doc.pdf_data)
+                })
+        except Exception as e:
+            logger.error("Error sending document %s to %s: %s", doc.id, target_device_id, e,
+                         extra={"device_id": target_device_id, "doc_id": doc.id})
+            self.disconnect(target_device_id)
+            return False
+        return True
+    
+    async def _claim(self, doc: DocumentRecord, device_id: str) -> bool:
+        """Whether a tablet may sign the document, claiming it first if it is on offer.
         
-        if target_device_id and target_device_id in self.connections:
-            # Update document with target device
-            await self.storage.update_document_status(
-                message.doc_id,
-                DocStatus.SENT,
-                android_device_id=target_device_id
+        The first tablet to send a preview or stroke for an offered document
+        gets it; the others are told to drop it.
+        """
+        if not self.storage.is_offered(doc.id):
+            return doc.status == DocStatus.SENT and doc.android_device_id == device_id
+        
+        others = await self.storage.claim_document(doc.id, device_id, self.lease_seconds)
+        if others is None:
+            return False
+        dispatch_log.info("Document %s claimed by device %s", doc.id, device_id,
+                          extra={"device_id": device_id, "doc_id": doc.id})
+        self.scheduler.record_sent(doc.id, device_id)
+        self.timeline.route(doc.id, CLAIMED, device_id)
+        for other_device_id in others:
+            if other_device_id in self.connections:
+                await self.send_to_device(other_device_id, {
+                    "type": "sendCancel",
+                    "doc_id": doc.id,
+                    "reason": "claimed"
+                })
+        if doc.windows_device_id:
+            await self.send_to_device(doc.windows_device_id, {
+                "type": "documentClaimed",
+                "doc_id": doc.id,
+                "device_id": device_id
+            })
+        for other_device_id in others:
+            await self._drain_queue(other_device_id)
+        return True
+    
+    async def _send_queue_update(self, message: SignikMessage, target_device_id: str, position: int) -> None:
+        """Tell the originating Windows device where its document stands in a tablet queue."""
+        if not message.sender_device_id:
+            return
+        await self.send_to_device(message.sender_device_id, {
+            "type": "queueUpdate",
+            "doc_id": message.doc_id,
+            "device_id": target_device_id,
+            "position": position,
+            "estimated_wait_seconds": (
+                self.scheduler.estimated_wait(target_device_id, position) if position else 0
             )
+        })
+    
+    async def _on_document_finished(self, doc_id: str) -> None:
+        """Free the tablet's slot for a finished document and dispatch queued work."""
+        device_id = self.scheduler.record_finished(doc_id)
+        if device_id:
+            await self._drain_queue(device_id)
+    
+    async def _drain_queue(self, device_id: str) -> None:
+        """Dispatch waiting documents while the tablet has capacity."""
+        dispatched = False
+        while self.scheduler.has_capacity(device_id) and device_id in self.connections:
+            message = self.scheduler.pop_next(device_id)
+            if not message:
+                break
+            if self.dispatch_mode == PARALLEL and not message.device_id:
+                # Offer it to every tablet free by now, not just this one
+                await self._handle_send_start(message)
+            else:
+                await self._dispatch(message, device_id)
+                await self._send_queue_update(message, device_id, 0)
+            dispatched = True
+        
+        if dispatched:
+            for message, position in self.scheduler.positions(device_id):
+                await self._send_queue_update(message, device_id, position)
+    
+    async def requeue_expired(self, now: Optional[float] = None) -> int:
+        """Requeue documents whose lease ran out and offer them to another tablet."""
+        expired = await self.storage.expire_leases(now)
+        for doc, holders in expired:
+            # A single holder, or every tablet of an offer nobody claimed
+            previous_device_id = holders[0] if len(holders) == 1 else None
+            logger.warning("Lease expired for document %s on %s; requeueing", doc.id, ", ".join(holders),
+                           extra={"device_id": previous_device_id, "doc_id": doc.id})
+            self.scheduler.forget(doc.id)
+            for holder_id in holders:
+                self.timeline.route(doc.id, LEASE_EXPIRED, holder_id)
             
-            # Send message
-            await self.connections[target_device_id].send_text(message.json())
+            for holder_id in holders:
+                if holder_id in self.connections:
+                    await self.send_to_device(holder_id, {
+                        "type": "sendCancel",
+                        "doc_id": doc.id,
+                        "reason": "lease_expired"
+                    })
+            if doc.windows_device_id:
+                await self.send_to_device(doc.windows_device_id, {
+                    "type": "documentRequeued",
+                    "doc_id": doc.id,
+                    "previous_device_id": previous_device_id
+                })
             
-            # Send PDF data if available
-            if doc.pdf_data:
-                await self.connections[target_device_id].send_bytes(doc.pdf_data)
-                logger.info(f"Sent PDF data ({len(doc.pdf_data)} bytes) to device")
-        else:
-            logger.error(f"No available target device for document {message.doc_id}")
+            retry = SignikMessage(
+                type="sendStart",
+                name=doc.name,
+                doc_id=doc.id,
+                sender_device_id=doc.windows_device_id
+            )
+            await self._handle_send_start(retry, exclude_device_id=previous_device_id)
+            for holder_id in holders:
+                await self._drain_queue(holder_id)
+        return len(expired)
+    
+    async def reschedule_pending(self, device_id: str) -> None:
+        """Re-route documents queued for a tablet that has gone away."""
+        for message in self.scheduler.take_all(device_id):
+            message.device_id = None
+            await self._handle_send_start(message)
     
     async def _handle_signature_preview(self, message: SignikMessage) -> None:
-        """Handle signature preview from Android to Windows."""
+        """Handle signature preview from Android to Windows (coalesced per document)."""
         if not message.doc_id:
             return
         
         doc = await self.storage.get_document(message.doc_id)
-        if not doc:
+        if not doc or not await self._claim(doc, message.sender_device_id):
+            return
+        self.previews.submit(message)
+    
+    async def _deliver_preview(self, message: SignikMessage) -> bool:
+        """Forward a preview to the document's Windows device."""
+        doc = await self.storage.get_document(message.doc_id)
+        if not doc or not doc.windows_device_id or doc.windows_device_id not in self.connections:
+            return False
+        size = len(message.data) if isinstance(message.data, str) else 0
+        text = await self.workers.run(encode_message, size, message)
+        socket = self.connections.get(doc.windows_device_id)
+        if socket is None:
+            return False  # Disconnected while the preview was encoded
+        try:
+            await socket.send_text(text)
+            return True
+        except Exception as e:
+            logger.error("Error sending preview to %s: %s", doc.windows_device_id, e,
+                         extra={"device_id": doc.windows_device_id, "doc_id": doc.id})
+            self.disconnect(doc.windows_device_id)
+            return False
+    
+    async def _store_preview(self, message: SignikMessage) -> None:
+        """Save the newest preview as the document's signature data, if the sender still holds it."""
+        await self.storage.store_signature(message.doc_id, message.sender_device_id, message.data, self.lease_seconds)
+    
+    async def _handle_signature_stroke(self, message: SignikMessage) -> None:
+        """Accumulate new stroke segments from the signer and forward them to Windows."""
+        if not message.doc_id:
             return
         
-        # Update document with signature data
-        await self.storage.update_document_status(
-            message.doc_id,
-            doc.status,  # Keep current status
-            signature_data=message.data
-        )
+        doc = await self.storage.get_document(message.doc_id)
+        if (not doc or not await self._claim(doc, message.sender_device_id)
+                or message.sender_device_id != doc.android_device_id):
+            logger.warning("Ignoring strokes for document %s from %s", message.doc_id, message.sender_device_id,
+                           extra={"device_id": message.sender_device_id, "doc_id": message.doc_id})
+            return
+        
+        try:
+            result = self.strokes.apply(doc.id, message.data)
+        except StrokeError as e:
+            await self.send_to_device(message.sender_device_id, {
+                "type": "strokeRejected",
+                "doc_id": doc.id,
+                "reason": str(e)
+            })
+            return
+        if result == GAP:
+            # Ask the signer to resend everything after what we have
+            await self.send_to_device(message.sender_device_id, {
+                "type": "strokeResync",
+                "doc_id": doc.id,
+                "seq": self.strokes.last_seq(doc.id)
+            })
+            return
+        if result != APPLIED:
+            return
+        
+        # The signer is active: keep the lease alive
+        if doc.status == DocStatus.SENT and self.strokes.renew_due(doc.id, self.previews.store_interval):
+            await self.storage.renew_lease(doc.id, self.lease_seconds)
         
-        # Forward to Windows device
         if doc.windows_device_id and doc.windows_device_id in self.connections:
-            await self.connections[doc.windows_device_id].send_text(message.json())
+            await self.send_to_device(doc.windows_device_id, message.dict())
+    
+    async def _handle_stroke_snapshot_request(self, message: SignikMessage) -> None:
+        """Send a (late or reconnecting) viewer every stroke received so far."""
+        if not message.doc_id:
+            return
+        
+        doc = await self.storage.get_document(message.doc_id)
+        if not doc or message.sender_device_id not in (doc.windows_device_id, doc.android_device_id):
+            return
+        await self.send_to_device(message.sender_device_id, {
+            "type": "strokeSnapshot",
+            "doc_id": doc.id,
+            "data": self.strokes.snapshot(doc.id)
+        })
     
     async def _handle_signature_review(self, message: SignikMessage) -> None:
         """Handle signature acceptance/rejection from Windows."""
@@ -209,21 +760,44 @@ class WebSocketManager:
         doc = await self.storage.get_document(message.doc_id)
         if not doc:
             return
+        await self.previews.finish(message.doc_id)
+        strokes = self.strokes.discard(message.doc_id)
         
-        # Update document status
+        # Update document status, storing the accumulated strokes as the signature (JSON bytes)
         new_status = DocStatus.SIGNED if message.type == "signatureAccepted" else DocStatus.DECLINED
-        await self.storage.update_document_status(message.doc_id, new_status)
+        newly_signed = new_status == DocStatus.SIGNED and doc.status not in SIGNED_STATUSES
+        if new_status == DocStatus.SIGNED and strokes:
+            signature_data = json.dumps(strokes, separators=(",", ":")).encode()
+            await self.storage.update_document_status(message.doc_id, new_status, signature_data=signature_data)
+        else:
+            # Log the final preview with the review; the debounced stores kept it out of the log
+            await self.storage.update_document_status(message.doc_id, new_status, signature_data=doc.signature_data)
         
         # Forward to Android device
         if doc.android_device_id and doc.android_device_id in self.connections:
             await self.connections[doc.android_device_id].send_text(message.json())
+        
+        if newly_signed and doc.bundle_id:
+            await self._check_bundle_complete(doc.bundle_id)
+        await self._on_document_finished(message.doc_id)
     
     async def _handle_signed_complete(self, message: SignikMessage) -> None:
         """Handle final signed PDF completion."""
         if not message.doc_id:
             return
         
+        doc = await self.storage.get_document(message.doc_id)
+        newly_signed = doc is not None and doc.status not in SIGNED_STATUSES
+        
+        await self.previews.finish(message.doc_id)
+        self.strokes.discard(message.doc_id)
         await self.storage.update_document_status(
             message.doc_id,
-            DocStatus.DELIVERED
-        )
\ No newline at end of file
+            DocStatus.DELIVERED,
+            signature_data=doc.signature_data if doc else None
+        )
+        
+        # Delivered without a review first: this may be the bundle's last document
+        if newly_signed and doc.bundle_id:
+            await self._check_bundle_complete(doc.bundle_id)
+        await self._on_document_finished(message.doc_id)
@@ -0,0 +1,112 @@
+"""Worker pool for CPU-heavy payload work: base64 decoding and large message frames.
+
+Small payloads are handled inline; anything at or above ``offload_bytes`` runs
+in a thread or process pool so WebSocket sessions and other requests keep
+being served meanwhile. Base64 is decoded in chunks, so a decoding thread
+gives the event loop the GIL back between chunks. Message parsing and
+encoding hold the GIL throughout: use the process pool when large JSON
+frames are common.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import base64
+import binascii
+import time
+
+from models import SignikMessage
+
+THREAD = "thread"
+PROCESS = "process"
+INLINE = "inline"
+
+# Base64 characters decoded per call; a multiple of 4 so chunks decode independently
+DECODE_CHUNK = 256 * 1024
+
+
+def decode_base64(text: str) -> bytes:
+    """Decode base64, a chunk at a time so a decoding thread does not hold the GIL for long.
+
+    Input with line breaks or other non-alphabet characters is not chunk
+    aligned and falls back to one lenient decode, like ``base64.b64decode``.
+    """
+    if len(text) <= DECODE_CHUNK:
+        return base64.b64decode(text)
+    try:
+        return b"".join(
+            base64.b64decode(text[i:i + DECODE_CHUNK], validate=True)
+            for i in range(0, len(text), DECODE_CHUNK)
+        )
+    except binascii.Error:
+        return base64.b64decode(text)
+
+
+def parse_message(text: str) -> SignikMessage:
+    """Validate a WebSocket text frame."""
+    return SignikMessage.model_validate_json(text)
+
+
+def encode_message(message: SignikMessage) -> str:
+    return message.model_dump_json()
+
+
+class PayloadWorkers:
+    """Runs payload functions inline or in a pool depending on payload size.
+
+    ``mode`` is ``thread``, ``process`` or ``inline`` (never offload). The
+    pool is created on first use. Functions must be module-level so the
+    process pool can pickle them.
+    """
+
+    def __init__(self, mode: str = THREAD, workers: int = 2, offload_bytes: int = 256 * 1024):
+        if mode not in (THREAD, PROCESS, INLINE):
+            raise ValueError(f"Unknown payload worker mode: {mode!r}")
+        self.mode = mode
+        self.workers = workers
+        self.offload_bytes = offload_bytes
+        self._executor: Optional[Executor] = None
+        self._counts: Dict[str, Dict[str, float]] = {}
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            if self.mode == PROCESS:
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="signik-payload")
+        return self._executor
+
+    def offloads(self, size: int) -> bool:
+        """Whether a payload of ``size`` bytes goes to the pool."""
+        return self.mode != INLINE and size >= self.offload_bytes
+
+    async def run(self, func: Callable[..., Any], size: int, *args: Any) -> Any:
+        """Call ``func(*args)`` for a payload of ``size`` bytes, offloading it if large."""
+        offload = self.offloads(size)
+        counts = self._counts.get(func.__name__)
+        if counts is None:
+            counts = self._counts[func.__name__] = {"inline": 0, "offloaded": 0, "bytes": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        try:
+            if offload:
+                return await asyncio.get_running_loop().run_in_executor(self._pool(), func, *args)
+            return func(*args)
+        finally:
+            counts["offloaded" if offload else "inline"] += 1
+            counts["bytes"] += size
+            counts["seconds"] += time.perf_counter() - start
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "offload_bytes": self.offload_bytes,
+            "operations": {
+                name: {**counts, "seconds": round(counts["seconds"], 6)}
+                for name, counts in self._counts.items()
+            }
+        }
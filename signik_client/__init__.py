@@ -0,0 +1,29 @@
+"""Async Python client for the Signik Broker.
+
+``SignikClient`` covers the REST API over pooled keep-alive connections;
+``DeviceSession`` is a device's WebSocket, reconnecting with backoff and
+resuming its change feed subscription. Needs ``httpx`` and ``websockets``
+(``pip install -r signik_client/requirements.txt``).
+
+    async with SignikClient("http://broker:8000") as client:
+        pc = await client.register_device("Front desk", DeviceType.WINDOWS, "10.0.0.5")
+        doc_id = await client.enqueue_document(pc, "contract.pdf", pdf_bytes)
+
+    async with DeviceSession("http://broker:8000", pc) as session:
+        await session.send(SignikMessage(type="sendStart", doc_id=doc_id, name="contract.pdf"))
+        async for message in session:
+            ...
+"""
+from .backoff import Backoff
+from .client import MAX_BATCH, ResyncRequired, SignikClient, SignikError
+from .models import (
+    BulkItemResult, BulkResult, Bundle, ChangeEvent, ConnectionStatus, Device, DeviceConnection,
+    DeviceType, DocStatus, Document, SignikMessage
+)
+from .session import DeviceSession
+
+__all__ = [
+    "Backoff", "BulkItemResult", "BulkResult", "Bundle", "ChangeEvent", "ConnectionStatus", "Device",
+    "DeviceConnection", "DeviceSession", "DeviceType", "DocStatus", "Document", "MAX_BATCH",
+    "ResyncRequired", "SignikClient", "SignikError", "SignikMessage"
+]
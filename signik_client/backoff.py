@@ -0,0 +1,25 @@
+"""Exponential backoff with jitter for reconnecting clients."""
+import random
+from typing import Optional
+
+
+class Backoff:
+    """Delays that double from ``initial`` up to ``maximum`` seconds.
+
+    Each delay is drawn from the upper half of the current step, so devices
+    that lost the broker at the same moment do not all come back at once.
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 30.0, rng: Optional[random.Random] = None):
+        self.initial = initial
+        self.maximum = maximum
+        self.attempts = 0
+        self._rng = rng or random.Random()
+
+    def next(self) -> float:
+        step = min(self.maximum, self.initial * 2 ** self.attempts)
+        self.attempts += 1
+        return self._rng.uniform(step / 2, step)
+
+    def reset(self) -> None:
+        self.attempts = 0
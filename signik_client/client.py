@@ -0,0 +1,299 @@
+"""Async REST client for the Signik Broker."""
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import asyncio
+import base64
+import json
+
+import httpx
+
+from .backoff import Backoff
+from .models import (
+    BulkItemResult, BulkResult, Bundle, ChangeEvent, ConnectionStatus, Device, DeviceConnection,
+    DeviceType, DocStatus, Document
+)
+
+# Most items the broker accepts in one bulk request
+MAX_BATCH = 1000
+
+
+class SignikError(Exception):
+    """A request the broker rejected."""
+
+    def __init__(self, status_code: int, detail: Any, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class ResyncRequired(Exception):
+    """The change feed dropped events this client had not received; reload, then resume from ``last_event_id``."""
+
+    def __init__(self, last_event_id: int):
+        super().__init__(f"change feed resync needed (resume after {last_event_id})")
+        self.last_event_id = last_event_id
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _encode_pdf(pdf: Union[bytes, str, None]) -> Optional[str]:
+    if pdf is None or isinstance(pdf, str):
+        return pdf
+    return base64.b64encode(pdf).decode("ascii")
+
+
+def _value(value: Any) -> Any:
+    return getattr(value, "value", value)
+
+
+def _params(**params: Any) -> Dict[str, Any]:
+    """Query parameters that are set, with enums and datetimes as strings."""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else _value(value)
+        for key, value in params.items() if value is not None
+    }
+
+
+class SignikClient:
+    """The broker's REST API over a pool of keep-alive HTTP connections.
+
+    Use as ``async with SignikClient("http://broker:8000") as client``.
+    Requests answered 429 or 503 are retried after their ``Retry-After`` up
+    to ``retries`` times. Bulk calls larger than one request allows are
+    split and the batches sent concurrently over the pool.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        max_connections: int = 20,
+        timeout: float = 10.0,
+        retries: int = 2,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.retries = retries
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport
+        )
+
+    async def __aenter__(self) -> "SignikClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self._http.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs: Any) -> Any:
+        for attempt in range(self.retries + 1):
+            response = await self._http.request(method, path, **kwargs)
+            if response.status_code not in (429, 503) or attempt == self.retries:
+                break
+            await asyncio.sleep(_retry_after(response) or 1.0)
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            raise SignikError(response.status_code, detail, _retry_after(response))
+        return response.json()
+
+    async def _bulk(self, path: str, key: str, items: List[Dict[str, Any]], batch_size: int) -> BulkResult:
+        """Send items in batches, at most ``max_connections`` in flight, and merge the per-item results."""
+        batch_size = min(batch_size, MAX_BATCH)
+        slots = asyncio.Semaphore(self.max_connections)
+
+        async def send(start: int) -> List[BulkItemResult]:
+            async with slots:
+                body = await self._request("POST", path, json={key: items[start:start + batch_size]})
+            return [
+                BulkItemResult(**{**result, "index": start + result["index"]})
+                for result in body["results"]
+            ]
+
+        batches = await asyncio.gather(*(send(start) for start in range(0, len(items), batch_size)))
+        results = [result for batch in batches for result in batch]
+        succeeded = sum(1 for result in results if result.success)
+        return BulkResult(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+    # Devices
+
+    async def register_device(self, name: str, device_type: Union[DeviceType, str], ip_address: str) -> str:
+        """Register a device (or update the one with this name and type); returns its ID."""
+        body = await self._request("POST", "/register_device", json={
+            "device_name": name, "device_type": _value(device_type), "ip_address": ip_address
+        })
+        return body["device_id"]
+
+    async def register_devices(self, devices: Iterable[Dict[str, Any]], batch_size: int = MAX_BATCH) -> BulkResult:
+        """Register many devices (``device_name``, ``device_type``, ``ip_address`` each)."""
+        items = [{**device, "device_type": _value(device["device_type"])} for device in devices]
+        return await self._bulk("/register_devices", "devices", items, batch_size)
+
+    async def heartbeat(self, device_id: str) -> None:
+        await self._request("POST", f"/heartbeat/{device_id}")
+
+    async def devices(self, device_type: Optional[DeviceType] = None, online: bool = False) -> List[Device]:
+        path = "/devices/online" if online else "/devices"
+        body = await self._request("GET", path, params=_params(device_type=device_type))
+        return [Device(**device) for device in body["devices"]]
+
+    # Documents
+
+    async def enqueue_document(self, windows_device_id: str, name: str, pdf: Union[bytes, str, None] = None) -> str:
+        """Queue a document for signing (``pdf`` as bytes or base64); returns its ID."""
+        body = await self._request("POST", "/enqueue_doc", json={
+            "name": name, "windows_device_id": windows_device_id, "pdf_data": _encode_pdf(pdf)
+        })
+        return body["doc_id"]
+
+    async def enqueue_documents(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        batch_size: int = MAX_BATCH
+    ) -> BulkResult:
+        """Queue many documents (``name``, ``windows_device_id`` and optional ``pdf_data`` each)."""
+        items = [{**document, "pdf_data": _encode_pdf(document.get("pdf_data"))} for document in documents]
+        return await self._bulk("/enqueue_docs", "documents", items, batch_size)
+
+    async def enqueue_bundle(
+        self,
+        windows_device_id: str,
+        documents: Sequence[Tuple[str, Union[bytes, str, None]]]
+    ) -> Tuple[str, List[str]]:
+        """Queue (name, pdf) pairs signed together in one visit; returns the bundle and document IDs."""
+        body = await self._request("POST", "/enqueue_bundle", json={
+            "windows_device_id": windows_device_id,
+            "documents": [{"name": name, "pdf_data": _encode_pdf(pdf)} for name, pdf in documents]
+        })
+        return body["bundle_id"], body["doc_ids"]
+
+    async def bundle(self, bundle_id: str) -> Bundle:
+        return Bundle(**await self._request("GET", f"/bundles/{bundle_id}"))
+
+    async def documents(self, status: Optional[DocStatus] = None) -> List[Document]:
+        body = await self._request("GET", "/documents", params=_params(status=status))
+        return [Document(**document) for document in body["documents"]]
+
+    async def document_strokes(self, doc_id: str) -> Dict[str, Any]:
+        """Signature strokes received so far: ``{"seq": n, "strokes": [...]}``."""
+        body = await self._request("GET", f"/documents/{doc_id}/strokes")
+        return {"seq": body["seq"], "strokes": body["strokes"]}
+
+    async def document_timeline(self, doc_id: str) -> List[Dict[str, Any]]:
+        body = await self._request("GET", f"/documents/{doc_id}/timeline")
+        return body["events"]
+
+    async def timeline(
+        self,
+        start: datetime,
+        end: Optional[datetime] = None,
+        kind: Optional[str] = None,
+        device_id: Optional[str] = None,
+        limit: int = 1000
+    ) -> Dict[str, Any]:
+        return await self._request("GET", "/timeline", params=_params(
+            start=start, end=end, kind=kind, device_id=device_id, limit=limit
+        ))
+
+    async def search(
+        self,
+        q: str,
+        collection: str = "documents",
+        status: Optional[DocStatus] = None,
+        device_type: Optional[DeviceType] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> Tuple[int, List[Union[Document, Device]]]:
+        """Documents (or devices) by name; returns the total match count and one page."""
+        body = await self._request("GET", "/search", params=_params(
+            q=q, collection=collection, status=status, device_type=device_type, limit=limit, offset=offset
+        ))
+        model = Document if collection == "documents" else Device
+        return body["total"], [model(**result) for result in body["results"]]
+
+    # Connections
+
+    async def connect(self, device_id: str, target_device_id: str) -> str:
+        """Ask to pair two devices; returns the connection ID."""
+        body = await self._request("POST", f"/devices/{device_id}/connect", json={"target_device_id": target_device_id})
+        return body["connection_id"]
+
+    async def device_connections(self, device_id: str) -> List[DeviceConnection]:
+        body = await self._request("GET", f"/devices/{device_id}/connections")
+        return [DeviceConnection(**connection) for connection in body["connections"]]
+
+    async def connections(self, status: Optional[ConnectionStatus] = None) -> List[DeviceConnection]:
+        body = await self._request("GET", "/connections", params=_params(status=status))
+        return [DeviceConnection(**connection) for connection in body["connections"]]
+
+    async def update_connection(self, connection_id: str, status: ConnectionStatus) -> None:
+        await self._request("PUT", f"/connections/{connection_id}", json={"status": _value(status)})
+
+    async def delete_connection(self, connection_id: str) -> None:
+        await self._request("DELETE", f"/connections/{connection_id}")
+
+    # Broker
+
+    async def health(self) -> Dict[str, Any]:
+        return await self._request("GET", "/health")
+
+    async def stats(self) -> Dict[str, Any]:
+        return await self._request("GET", "/stats")
+
+    async def events(
+        self,
+        device_id: Optional[str] = None,
+        status: Optional[DocStatus] = None,
+        collection: Optional[str] = None,
+        last_event_id: Optional[int] = None,
+        backoff: Optional[Backoff] = None
+    ) -> AsyncIterator[ChangeEvent]:
+        """Follow the change feed, reconnecting with backoff and resuming after the last event seen.
+
+        With ``device_id`` only that device's changes are followed
+        (``/events``); without it, every device's (``/admin/events``). Raises ``ResyncRequired`` when the broker no longer has the events
+        to resume from.
+        """
+        backoff = backoff or Backoff()
+        path = "/events" if device_id else "/admin/events"
+        while True:
+            headers = {"Last-Event-ID": str(last_event_id)} if last_event_id is not None else None
+            params = _params(device_id=device_id, status=status, collection=collection)
+            try:
+                async with self._http.stream("GET", path, params=params, headers=headers, timeout=None) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        raise SignikError(response.status_code, response.text, _retry_after(response))
+                    backoff.reset()
+                    event_type, data = None, []
+                    async for line in response.aiter_lines():
+                        if line.startswith("event:"):
+                            event_type = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line:
+                            if data:
+                                payload = json.loads("\n".join(data))
+                                if event_type == "resync":
+                                    raise ResyncRequired(payload["last_event_id"])
+                                event = ChangeEvent(**payload)
+                                last_event_id = event.id
+                                yield event
+                            event_type, data = None, []
+            except (httpx.TransportError, SignikError) as e:
+                if isinstance(e, SignikError) and e.status_code not in (429, 503):
+                    raise
+            await asyncio.sleep(backoff.next())
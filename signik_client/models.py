@@ -0,0 +1,127 @@
+"""Typed models for the broker's REST responses and WebSocket protocol.
+
+They mirror ``signik_broker/models.py`` without the server-side request
+validation. Unknown fields sent by a newer broker are ignored (and kept
+on WebSocket messages).
+"""
+from datetime import datetime
+from enum import Enum
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class DeviceType(str, Enum):
+    """Supported device types."""
+    WINDOWS = "windows"
+    ANDROID = "android"
+
+
+class DocStatus(str, Enum):
+    """Document lifecycle states."""
+    QUEUED = "queued"
+    SENT = "sent"
+    SIGNED = "signed"
+    DECLINED = "declined"
+    DEFERRED = "deferred"
+    DELIVERED = "delivered"
+
+
+class ConnectionStatus(str, Enum):
+    """Device connection states."""
+    PENDING = "pending"
+    CONNECTED = "connected"
+    DISCONNECTED = "disconnected"
+    REJECTED = "rejected"
+
+
+class Device(BaseModel):
+    """A registered Windows PC or Android tablet."""
+    id: str
+    name: str
+    device_type: DeviceType
+    ip_address: str
+    last_heartbeat: datetime
+    is_online: bool = True
+    version: int = 0
+
+
+class Document(BaseModel):
+    """A document in the signing workflow (listings leave out the payloads)."""
+    id: str
+    name: str
+    status: DocStatus
+    created_at: datetime
+    updated_at: datetime
+    windows_device_id: Optional[str] = None
+    android_device_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    delivery_attempts: int = 0
+    bundle_id: Optional[str] = None
+    version: int = 0
+
+
+class DeviceConnection(BaseModel):
+    """A pairing between a Windows PC and a tablet."""
+    id: str
+    windows_device_id: str
+    android_device_id: str
+    status: ConnectionStatus
+    created_at: datetime
+    updated_at: datetime
+    initiated_by: str
+    other_device: Optional[Device] = None  # Set when listed for one device
+    version: int = 0
+
+
+class SignikMessage(BaseModel):
+    """WebSocket message protocol.
+
+    Broker notices carry fields of their own (``position`` on a
+    ``queueUpdate``, ``event`` on a ``change``); they are kept as extra attributes.
+    """
+    model_config = ConfigDict(extra="allow")
+
+    type: str
+    name: Optional[str] = None
+    data: Optional[Any] = None
+    doc_id: Optional[str] = None
+    device_id: Optional[str] = None
+    sender_device_id: Optional[str] = None
+    bundle_id: Optional[str] = None
+
+
+class BulkItemResult(BaseModel):
+    """Outcome of a single item in a bulk request."""
+    index: int
+    success: bool
+    id: Optional[str] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    """Per-item results of a bulk request (of all its batches when it was split)."""
+    results: List[BulkItemResult]
+    succeeded: int
+    failed: int
+
+
+class Bundle(BaseModel):
+    """A bundle's manifest."""
+    bundle_id: str
+    windows_device_id: Optional[str] = None
+    status: str
+    counts: dict
+    documents: List[dict]
+
+
+class ChangeEvent(BaseModel):
+    """A storage change from the change feed (``GET /events`` or a ``subscribe``)."""
+    id: int
+    type: str
+    collection: str
+    op: str
+    entity_id: str
+    data: dict = {}
+    timestamp: float
@@ -0,0 +1,234 @@
+"""A device's WebSocket session with the broker, reconnecting on its own."""
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Union
+import asyncio
+import json
+import logging
+
+import websockets
+
+from .backoff import Backoff
+from .models import SignikMessage
+
+logger = logging.getLogger(__name__)
+
+Received = Union[SignikMessage, bytes]
+
+
+class DeviceSession:
+    """The WebSocket of one device, kept open across broker restarts and network drops.
+
+    Reconnects with exponential backoff. Messages sent while disconnected
+    wait in an outbox (the oldest are dropped past ``max_outbox``) and go
+    out, in order, once the socket is back. After ``subscribe`` the change
+    feed is resumed on every reconnect after the last ``change`` received,
+    so nothing is missed while the broker still holds those events; when it
+    does not, the ``changeFeedResync`` message is delivered and the caller
+    should reload its state. After ``subscribe_presence`` the broker pushes
+    the presence of paired devices, kept in ``peers`` and renewed on every
+    reconnect. A ``rateLimited`` notice pauses sending for the time the
+    broker asks.
+
+    Use as ``async with DeviceSession(url, device_id) as session`` and read
+    with ``await session.receive()`` or ``async for message in session``.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        device_id: str,
+        backoff: Optional[Backoff] = None,
+        max_outbox: int = 1000,
+        max_inbox: int = 1000
+    ):
+        base_url = base_url.rstrip("/")
+        if base_url.startswith("http"):
+            base_url = "ws" + base_url[4:]
+        self.url = f"{base_url}/ws/{device_id}"
+        self.device_id = device_id
+        self.backoff = backoff or Backoff()
+        self.connected = asyncio.Event()
+        self.last_event_id: Optional[int] = None
+        self.peers: Dict[str, bool] = {}  # Paired device ID -> online, with a presence subscription
+        self.connects = 0
+        self.dropped = 0  # Outgoing messages dropped from a full outbox
+        self.last_error: Optional[BaseException] = None
+        self._subscription: Optional[Dict[str, Any]] = None
+        self._presence = False
+        self._outbox: Deque[Union[str, bytes]] = deque(maxlen=max_outbox)
+        self._inbox: "asyncio.Queue[Received]" = asyncio.Queue(max_inbox)
+        self._socket: Optional[Any] = None
+        self._send_lock = asyncio.Lock()
+        self._resume_sending_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def __aenter__(self) -> "DeviceSession":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._socket is not None:
+            await self._socket.close()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def wait_connected(self, timeout: Optional[float] = None) -> None:
+        await asyncio.wait_for(self.connected.wait(), timeout)
+
+    async def send(self, message: Union[SignikMessage, Dict[str, Any]]) -> None:
+        """Send a message now, or when the session is connected again."""
+        if isinstance(message, SignikMessage):
+            text = message.model_dump_json(exclude_none=True)
+        else:
+            text = json.dumps(message)
+        await self._send(text)
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self._send(data)
+
+    async def subscribe(
+        self,
+        collections: Optional[Iterable[str]] = None,
+        status: Optional[str] = None,
+        last_event_id: Optional[int] = None
+    ) -> None:
+        """Follow changes concerning this device (``change`` messages), resumed across reconnects.
+
+        Pass ``last_event_id`` (e.g. ``change_feed.last_event_id`` from
+        ``/stats``) to start from a known point rather than from now.
+        """
+        self._subscription = {
+            "topic": "changes",
+            "collections": list(collections) if collections else None,
+            "status": status
+        }
+        if last_event_id is not None:
+            self.last_event_id = last_event_id
+        await self._send_control(self._subscribe_message())
+
+    async def unsubscribe(self) -> None:
+        self._subscription = None
+        await self._send_control({"type": "unsubscribe"})
+
+    async def subscribe_presence(self) -> None:
+        """Follow whether paired devices are online (``presenceSnapshot``, then ``presence`` messages)."""
+        self._presence = True
+        await self._send_control({"type": "subscribe", "data": {"topic": "presence"}})
+
+    async def unsubscribe_presence(self) -> None:
+        self._presence = False
+        self.peers.clear()
+        await self._send_control({"type": "unsubscribe", "data": {"topic": "presence"}})
+
+    async def receive(self, timeout: Optional[float] = None) -> Received:
+        """The next message (or binary frame) from the broker."""
+        return await asyncio.wait_for(self._inbox.get(), timeout)
+
+    def __aiter__(self) -> "DeviceSession":
+        return self
+
+    async def __anext__(self) -> Received:
+        return await self.receive()
+
+    def _subscribe_message(self) -> Dict[str, Any]:
+        return {"type": "subscribe", "data": {**self._subscription, "last_event_id": self.last_event_id}}
+
+    async def _send_control(self, message: Dict[str, Any]) -> None:
+        """Send a subscription change if connected; otherwise the next connect applies it."""
+        async with self._send_lock:
+            if self._socket is not None and self.connected.is_set():
+                try:
+                    await self._socket.send(json.dumps(message))
+                except websockets.ConnectionClosed:
+                    pass
+
+    async def _send(self, payload: Union[str, bytes]) -> None:
+        async with self._send_lock:
+            delay = self._resume_sending_at - asyncio.get_running_loop().time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._socket is None or not self.connected.is_set():
+                self._queue(payload)
+                return
+            try:
+                await self._socket.send(payload)
+            except websockets.ConnectionClosed:
+                self._queue(payload)
+
+    def _queue(self, payload: Union[str, bytes]) -> None:
+        if len(self._outbox) == self._outbox.maxlen:
+            self.dropped += 1
+        self._outbox.append(payload)
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                async with websockets.connect(self.url, max_size=None) as socket:
+                    self._socket = socket
+                    await self._on_connected(socket)
+                    async for frame in socket:
+                        await self._on_frame(frame)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, websockets.WebSocketException, asyncio.TimeoutError) as e:
+                self.last_error = e
+            finally:
+                self._socket = None
+                self.connected.clear()
+            if self._closed:
+                break
+            delay = self.backoff.next()
+            logger.info("Reconnecting %s in %.1f s (%s)", self.device_id, delay, self.last_error)
+            await asyncio.sleep(delay)
+
+    async def _on_connected(self, socket: Any) -> None:
+        """Resubscribe and flush the outbox before anything else is sent."""
+        async with self._send_lock:
+            if self._subscription is not None:
+                await socket.send(json.dumps(self._subscribe_message()))
+            if self._presence:
+                await socket.send(json.dumps({"type": "subscribe", "data": {"topic": "presence"}}))
+            while self._outbox:
+                await socket.send(self._outbox[0])
+                self._outbox.popleft()
+            self.connects += 1
+            self.backoff.reset()
+            self.connected.set()
+
+    async def _on_frame(self, frame: Union[str, bytes]) -> None:
+        if isinstance(frame, bytes):
+            await self._inbox.put(frame)
+            return
+        try:
+            message = SignikMessage(**json.loads(frame))
+        except (ValueError, TypeError) as e:
+            logger.warning("Ignoring malformed message for %s: %s", self.device_id, e)
+            return
+        if message.type == "change":
+            self.last_event_id = message.event["id"]
+        elif message.type == "changeFeedResync":
+            # The broker ended the feed: restart it from now, the caller reloads what it missed
+            self.last_event_id = message.last_event_id
+            if self._subscription is not None:
+                await self._send_control(self._subscribe_message())
+        elif message.type == "presenceSnapshot":
+            self.peers = {peer["device_id"]: peer["is_online"] for peer in message.devices}
+        elif message.type == "presence":
+            self.peers[message.device_id] = message.is_online
+        elif message.type == "rateLimited":
+            self._resume_sending_at = asyncio.get_running_loop().time() + message.retry_after
+        await self._inbox.put(message)
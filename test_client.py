@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the async client (signik_client) against a broker served
+in-process by uvicorn on a local port, restarted to exercise reconnects.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "signik_broker"))
+
+import uvicorn  # noqa: E402
+
+import main  # noqa: E402
+from models import Document, DocStatus as BrokerDocStatus  # noqa: E402
+from signik_client import (  # noqa: E402
+    Backoff, DeviceSession, DeviceType, DocStatus, SignikClient, SignikError, SignikMessage
+)
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class Server:
+    """The broker app on a local port, which can be stopped and started again (state is kept)."""
+
+    def __init__(self):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = None
+        self._task = None
+
+    async def start(self):
+        config = uvicorn.Config(main.app, host="127.0.0.1", port=self.port, log_level="critical", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        self._server.should_exit = True
+        await self._task
+
+
+async def next_message(session, message_type, timeout=5.0):
+    """The next message of a type, skipping the others."""
+    while True:
+        message = await session.receive(timeout)
+        if not isinstance(message, bytes) and message.type == message_type:
+            return message
+
+
+async def test_rest_api(server):
+    """Typed results for the main endpoints; bulk calls split into batches and merged."""
+    print("\n🌐 REST API over pooled connections")
+    async with SignikClient(server.url, max_connections=4) as client:
+        pc = await client.register_device("Client-PC", DeviceType.WINDOWS, "10.0.0.1")
+        tablet = await client.register_device("Client-Tablet", DeviceType.ANDROID, "10.0.0.2")
+        await client.connect(pc, tablet)
+        connections = await client.device_connections(pc)
+        assert connections[0].other_device.id == tablet
+
+        doc_id = await client.enqueue_document(pc, "client-contract.pdf", b"%PDF-1.4")
+        result = await client.enqueue_documents(
+            [{"name": f"client-batch-{i}.pdf", "windows_device_id": pc} for i in range(25)]
+            + [{"name": "bad.pdf", "windows_device_id": "no-such-device"}],
+            batch_size=10
+        )
+        assert (result.succeeded, result.failed) == (25, 1)
+        assert [r.index for r in result.results] == list(range(26)) and not result.results[-1].success
+
+        documents = await client.documents(status=DocStatus.QUEUED)
+        assert doc_id in {doc.id for doc in documents}
+        total, found = await client.search("client batch", limit=5)
+        assert total == 25 and len(found) == 5
+        timeline = await client.document_timeline(doc_id)
+        assert timeline[0]["status"] == "queued"
+        recent = await client.timeline(datetime.now() - timedelta(minutes=1))
+        assert len(recent["events"]) >= 26
+
+        try:
+            await client.bundle("no-such-bundle")
+            raise AssertionError("expected a 404")
+        except SignikError as e:
+            assert e.status_code == 404
+    print("✅ Typed results, 26 bulk items in 3 batches with per-item indexes")
+    return pc, tablet
+
+
+async def test_session_reconnects_and_resumes(server, pc, tablet):
+    """A broker restart is invisible to a session: it reconnects, flushes its outbox and misses no change."""
+    print("\n🔌 WebSocket session across a broker restart")
+    # The PC comes back 0.5-1 s after the drop, once the tablet is back to receive what it sends
+    async with DeviceSession(server.url, pc, backoff=Backoff(initial=1.0, maximum=1.0)) as windows, \
+            DeviceSession(server.url, tablet, backoff=Backoff(initial=0.05, maximum=0.2)) as android:
+        await windows.wait_connected(5)
+        await android.wait_connected(5)
+        async with SignikClient(server.url) as client:
+            feed_position = (await client.stats())["change_feed"]["last_event_id"]
+        await windows.subscribe(collections=["documents"], last_event_id=feed_position)
+        doc_id = await enqueue(pc, "before-restart.pdf")
+        first = await next_message(windows, "change")
+        assert first.event["entity_id"] == doc_id
+        await windows.subscribe_presence()
+        await next_message(windows, "presenceSnapshot")
+        assert windows.peers == {tablet: True}
+
+        await server.stop()
+        await asyncio.sleep(0.1)
+        assert not windows.connected.is_set()
+        # Changes while this device is away, and a message it sends meanwhile
+        missed = [await enqueue(pc, f"during-restart-{i}.pdf") for i in range(3)]
+        await windows.send(SignikMessage(type="sendStart", doc_id=missed[0], name="during-restart-0.pdf"))
+        await server.start()
+        await windows.wait_connected(5)
+
+        resumed = [(await next_message(windows, "change")).event["entity_id"] for _ in missed]
+        assert resumed == missed, resumed
+        start = await next_message(android, "sendStart")
+        assert start.doc_id == missed[0]
+        assert windows.connects == 2 and windows.dropped == 0
+        # The tablet was back well within the offline delay, so the restart never showed as presence
+        assert windows.peers == {tablet: True}
+        assert main.ws_manager.presence.stats()["published"] == 0
+    print("✅ Reconnected, resumed the change feed after event", first.event["id"], "and delivered the queued sendStart")
+
+
+async def enqueue(windows_id, name):
+    """Add a document straight to storage (works while the server is down)."""
+    doc = Document(
+        id=str(uuid.uuid4()), name=name, status=BrokerDocStatus.QUEUED,
+        created_at=datetime.now(), updated_at=datetime.now(), windows_device_id=windows_id
+    )
+    await main.storage.add_document(doc)
+    return doc.id
+
+
+async def main_async():
+    """Run all scenarios"""
+    print("🚀 Starting Signik client tests")
+    print("=" * 50)
+    server = Server()
+    await server.start()
+    try:
+        pc, tablet = await test_rest_api(server)
+        # Pair them so the tablet is a routing target
+        async with SignikClient(server.url) as client:
+            connection = (await client.device_connections(pc))[0]
+            await client.update_connection(connection.id, "connected")
+        await test_session_reconnects_and_resumes(server, pc, tablet)
+    finally:
+        await server.stop()
+    print("\n" + "=" * 50)
+    print("🎉 All client tests passed!")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main_async())
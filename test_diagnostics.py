@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the event-loop lag monitor.
+Drives the watchdog by hand so the loop thread and the watchdog thread
+interleave at the points that matter.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "signik_broker"))
+
+import diagnostics  # noqa: E402
+from diagnostics import LoopLagMonitor  # noqa: E402
+
+
+def test_loop_resumes_while_stack_is_collapsed():
+    """The loop catching up during the watchdog's stack walk is not reported as a stall."""
+    print("\n🧵 Loop resumes while the watchdog walks its stack")
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+    monitor._loop_thread = threading.get_ident()
+    monitor._last_tick = time.monotonic() - 1.0
+    collapse_stack = diagnostics.collapse_stack
+
+    def resume_during_walk(frame):
+        # What _run does when its sleep finally returns
+        monitor._last_tick = time.monotonic()
+        monitor.record(1.0)
+        return collapse_stack(frame)
+
+    diagnostics.collapse_stack = resume_during_walk
+    try:
+        monitor._check()
+    finally:
+        diagnostics.collapse_stack = collapse_stack
+    stats = monitor.stats()
+    assert stats["stalls"] == 0 and stats["last_stall"] is None, stats
+    assert stats["samples"] == 1
+    print("✅ No stall recorded, no error in record()")
+
+
+def test_each_stall_gets_its_own_duration():
+    """Two stalls in a row: each one's duration is written to its own report."""
+    print("\n⏳ Consecutive stalls keep their own durations")
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+    monitor._loop_thread = threading.get_ident()
+    for lag in (0.2, 0.3):
+        monitor._last_tick = time.monotonic() - 1.0
+        monitor._check()
+        first = monitor.stats()["last_stall"]
+        assert first["seconds"] is None
+        monitor._last_tick = time.monotonic()
+        monitor.record(lag)
+        assert monitor.stats()["last_stall"] is first and first["seconds"] == lag
+    assert monitor.stats()["stalls"] == 2
+    print("✅ Durations 0.2 s and 0.3 s on two separate reports")
+
+
+async def test_blocked_loop_is_reported():
+    """A real blocking call on the loop is caught by the running watchdog."""
+    print("\n🐢 Blocking call on the running loop")
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+    monitor.start()
+    await asyncio.sleep(0.05)
+    time.sleep(0.3)
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    stall = monitor.stats()["last_stall"]
+    assert monitor.stats()["stalls"] == 1 and stall["seconds"] >= 0.25, monitor.stats()
+    assert "test_blocked_loop_is_reported" in stall["stack"]
+    print(f"✅ Stall of {stall['seconds']} s reported at the blocking call")
+
+
+def main():
+    """Run all scenarios"""
+    print("🚀 Starting Signik diagnostics tests")
+    print("=" * 50)
+    test_loop_resumes_while_stack_is_collapsed()
+    test_each_stall_gets_its_own_duration()
+    asyncio.run(test_blocked_loop_is_reported())
+    print("\n" + "=" * 50)
+    print("🎉 All scenarios passed!")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.CRITICAL)
+    main()
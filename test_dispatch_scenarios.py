@@ -0,0 +1,716 @@
+#!/usr/bin/env python3
+"""
+Dispatch scenario tests for the Signik Broker.
+Drives the WebSocket routing in-process with simulated tablets and signers,
+so no running broker is needed.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "signik_broker"))
+
+from admission import AdmissionControl, RateLimiter  # noqa: E402
+from api_routes import APIRoutes  # noqa: E402
+from events import EventFilter  # noqa: E402
+from frames import pack_frame  # noqa: E402
+from models import (  # noqa: E402
+    Device, DeviceConnection, Document, DeviceType, DocStatus, ConnectionStatus, SignikMessage
+)
+from scheduler import SINGLE, PARALLEL  # noqa: E402
+from storage import StorageManager  # noqa: E402
+from timeline import EXPIRE_PER_APPEND, Timeline, TimelineEvent  # noqa: E402
+from websocket_manager import WebSocketManager  # noqa: E402
+
+
+class FakeSocket:
+    """Stands in for a device WebSocket and hands received JSON to a callback."""
+
+    def __init__(self, on_message=None):
+        self.on_message = on_message
+        self.messages = []
+        self.frames = []
+
+    async def send_text(self, text):
+        message = json.loads(text)
+        self.messages.append(message)
+        if self.on_message:
+            self.on_message(message)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+
+class Broker:
+    """A broker stack with helpers to create devices and documents."""
+
+    def __init__(self, **ws_options):
+        self.storage = StorageManager()
+        self.ws_manager = WebSocketManager(self.storage, **ws_options)
+
+    async def add_device(self, name, device_type):
+        device = Device(
+            id=str(uuid.uuid4()),
+            name=name,
+            device_type=device_type,
+            ip_address="10.0.0.1",
+            last_heartbeat=datetime.now()
+        )
+        await self.storage.add_device(device)
+        return device.id
+
+    async def pair(self, windows_id, android_id):
+        await self.storage.add_connection(DeviceConnection(
+            id=str(uuid.uuid4()),
+            windows_device_id=windows_id,
+            android_device_id=android_id,
+            status=ConnectionStatus.CONNECTED,
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+            initiated_by=windows_id
+        ))
+
+    async def add_document(self, windows_id, name, **fields):
+        doc = Document(
+            id=str(uuid.uuid4()),
+            name=name,
+            status=DocStatus.QUEUED,
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+            windows_device_id=windows_id,
+            **fields
+        )
+        await self.storage.add_document(doc)
+        return doc.id
+
+    def attach(self, device_id, on_message=None):
+        socket = FakeSocket(on_message)
+        self.ws_manager.connections[device_id] = socket
+        return socket
+
+    async def route(self, sender_id, message_type, doc_id, **fields):
+        message = SignikMessage(type=message_type, doc_id=doc_id, sender_device_id=sender_id, **fields)
+        await self.ws_manager.route_message(message, None)
+
+
+async def test_throughput_under_tablet_churn(doc_count=200, tablet_count=6, lease_seconds=0.3):
+    """Documents on tablets that vanish are requeued by lease expiry and still get signed."""
+    print(f"\n🔄 Throughput under tablet churn ({doc_count} docs, {tablet_count} tablets)")
+    broker = Broker(max_inflight_per_tablet=2, lease_seconds=lease_seconds)
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    broker.attach(windows_id)
+
+    tablets = [await broker.add_device(f"Tablet-{i}", DeviceType.ANDROID) for i in range(tablet_count)]
+    online = set(tablets)
+    signed_by = {}
+    rng = random.Random(7)
+
+    async def sign(tablet_id, doc_id):
+        await asyncio.sleep(rng.uniform(0.01, 0.05))
+        doc = await broker.storage.get_document(doc_id)
+        if tablet_id not in online or doc.status != DocStatus.SENT or doc.android_device_id != tablet_id:
+            return  # Tablet vanished or lost the document meanwhile
+        await broker.route(tablet_id, "signaturePreview", doc_id, data="sig")
+        signed_by.setdefault(doc_id, []).append(tablet_id)
+        await broker.route(windows_id, "signatureAccepted", doc_id)
+
+    def tablet_handler(tablet_id):
+        def handle(message):
+            if message["type"] == "sendStart":
+                asyncio.ensure_future(sign(tablet_id, message["doc_id"]))
+        return handle
+
+    for tablet_id in tablets:
+        await broker.pair(windows_id, tablet_id)
+        broker.attach(tablet_id, tablet_handler(tablet_id))
+
+    doc_ids = [await broker.add_document(windows_id, f"doc-{i}.pdf") for i in range(doc_count)]
+    done = asyncio.Event()
+
+    async def churn():
+        while not done.is_set():
+            await asyncio.sleep(0.1)
+            tablet_id = rng.choice(tablets)
+            if tablet_id not in online or len(online) == 1:
+                continue
+            online.discard(tablet_id)
+            broker.ws_manager.disconnect(tablet_id)
+            await broker.storage.update_device_status(tablet_id, False)
+            await broker.ws_manager.reschedule_pending(tablet_id)
+            await asyncio.sleep(0.3)
+            online.add(tablet_id)
+            broker.attach(tablet_id, tablet_handler(tablet_id))
+            await broker.storage.update_device_status(tablet_id, True)
+
+    async def lease_checker():
+        while not done.is_set():
+            await asyncio.sleep(0.05)
+            await broker.ws_manager.requeue_expired()
+
+    background = [asyncio.ensure_future(churn()), asyncio.ensure_future(lease_checker())]
+    start = time.perf_counter()
+    for doc_id in doc_ids:
+        await broker.route(windows_id, "sendStart", doc_id)
+
+    while len(await broker.storage.get_all_documents(DocStatus.SIGNED)) < doc_count:
+        if time.perf_counter() - start > 60:
+            break
+        await asyncio.sleep(0.02)
+        # Documents that found no tablet while everything was busy or offline
+        for doc in await broker.storage.get_all_documents(DocStatus.QUEUED):
+            if not broker.ws_manager.scheduler.is_pending(doc.id):
+                await broker.route(windows_id, "sendStart", doc.id)
+    elapsed = time.perf_counter() - start
+    done.set()
+    for task in background:
+        task.cancel()
+
+    signed = len(await broker.storage.get_all_documents(DocStatus.SIGNED))
+    requeued = sum(1 for m in broker.ws_manager.connections[windows_id].messages if m["type"] == "documentRequeued")
+    assert signed == doc_count, f"only {signed}/{doc_count} documents signed"
+    assert all(len(by) == 1 for by in signed_by.values()), "a document was signed twice"
+    print(f"✅ {signed} signed in {elapsed:.2f}s ({signed / elapsed:.0f} docs/s), {requeued} lease requeues")
+
+
+async def test_lease_expiry_requeues_to_other_tablet():
+    """An unsigned document moves to another connected tablet when its lease runs out."""
+    print("\n⏱️  Lease expiry moves the document to another tablet")
+    broker = Broker(lease_seconds=60)
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    first = await broker.add_device("Tablet-A", DeviceType.ANDROID)
+    second = await broker.add_device("Tablet-B", DeviceType.ANDROID)
+    for tablet_id in (first, second):
+        await broker.pair(windows_id, tablet_id)
+    windows_socket = broker.attach(windows_id)
+    first_socket = broker.attach(first)
+    broker.attach(second)
+
+    doc_id = await broker.add_document(windows_id, "contract.pdf")
+    await broker.route(windows_id, "sendStart", doc_id, device_id=first)
+    assert (await broker.storage.get_document(doc_id)).android_device_id == first
+
+    assert await broker.ws_manager.requeue_expired() == 0
+    assert await broker.ws_manager.requeue_expired(now=time.time() + 61) == 1
+
+    doc = await broker.storage.get_document(doc_id)
+    assert doc.status == DocStatus.SENT and doc.android_device_id == second
+    assert doc.delivery_attempts == 2
+    assert first_socket.messages[-1]["type"] == "sendCancel"
+    assert windows_socket.messages[-1]["type"] == "documentRequeued"
+    timeline = [(event.kind, event.status, event.device_id) for event in broker.ws_manager.timeline.document(doc_id)]
+    assert timeline == [
+        ("status", "queued", windows_id),
+        ("status", "sent", first), ("dispatched", None, first),
+        ("status", "queued", windows_id), ("lease_expired", None, first),
+        ("status", "sent", second), ("dispatched", None, second)
+    ], timeline
+    print("✅ Document re-sent to the second tablet")
+
+
+async def test_signature_strokes_accumulate():
+    """Stroke segments are forwarded, resent ones ignored, and the accepted set stored."""
+    print("\n✍️  Incremental signature strokes")
+    broker = Broker()
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    await broker.pair(windows_id, tablet_id)
+    windows_socket = broker.attach(windows_id)
+    tablet_socket = broker.attach(tablet_id)
+    doc_id = await broker.add_document(windows_id, "contract.pdf")
+    await broker.route(windows_id, "sendStart", doc_id, device_id=tablet_id)
+
+    segments = [
+        {"seq": 1, "segments": [{"stroke": 0, "points": [[0, 0], [1, 1]]}]},
+        {"seq": 2, "segments": [{"stroke": 0, "points": [[2, 2]]}, {"stroke": 1, "points": [[5, 5]]}]},
+        {"seq": 3, "segments": [{"stroke": 1, "points": [[6, 6]]}]},
+    ]
+    for data in segments[:2]:
+        await broker.route(tablet_id, "signatureStroke", doc_id, data=data)
+    await broker.route(tablet_id, "signatureStroke", doc_id, data=segments[1])  # Resent after a reconnect
+    assert [m["data"]["seq"] for m in windows_socket.messages if m["type"] == "signatureStroke"] == [1, 2]
+
+    await broker.route(tablet_id, "signatureStroke", doc_id, data={"seq": 5, "segments": []})
+    assert tablet_socket.messages[-1] == {"type": "strokeResync", "doc_id": doc_id, "seq": 2}
+    await broker.route(tablet_id, "signatureStroke", doc_id, data=segments[2])
+
+    await broker.route(windows_id, "strokeSnapshotRequest", doc_id)
+    expected = {"seq": 3, "strokes": [[[0, 0], [1, 1], [2, 2]], [[5, 5], [6, 6]]]}
+    assert windows_socket.messages[-1]["data"] == expected
+
+    await broker.route(windows_id, "signatureAccepted", doc_id)
+    doc = await broker.storage.get_document(doc_id)
+    assert doc.status == DocStatus.SIGNED and json.loads(doc.signature_data) == expected
+    assert broker.ws_manager.strokes.stats()["documents"] == 0
+
+    # A stray preview after acceptance must not overwrite the signature
+    forwarded = len(windows_socket.messages)
+    await broker.route(tablet_id, "signaturePreview", doc_id, data="late-preview")
+    await asyncio.sleep(0.01)
+    assert json.loads((await broker.storage.get_document(doc_id)).signature_data) == expected
+    assert len(windows_socket.messages) == forwarded
+    print("✅ Strokes accumulated, resync requested on a gap, signature stored on acceptance")
+
+
+async def test_parallel_dispatch_time_to_signature(doc_count=40, tablet_count=3, arrival_gap=0.06):
+    """Offering each document to every free tablet gets it signed sooner when signers hesitate."""
+    print(f"\n⚡ Time to signature, single vs parallel dispatch ({doc_count} docs, {tablet_count} tablets)")
+    rng = random.Random(11)
+    # Per document and tablet: usually a quick signer, sometimes one who hesitates
+    delays = [[rng.uniform(0.01, 0.03) if rng.random() < 0.7 else 0.25 for _ in range(tablet_count)]
+              for _ in range(doc_count)]
+    results = {}
+    for mode in (SINGLE, PARALLEL):
+        broker = Broker(dispatch_mode=mode)
+        windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+        broker.attach(windows_id)
+        tablets = [await broker.add_device(f"Tablet-{i}", DeviceType.ANDROID) for i in range(tablet_count)]
+        doc_index, sent_at, signed_at, signed_by, cancelled = {}, {}, {}, {}, set()
+
+        async def sign(tablet_id, doc_id):
+            await asyncio.sleep(delays[doc_index[doc_id]][tablets.index(tablet_id)])
+            if (tablet_id, doc_id) in cancelled:
+                return
+            await broker.route(tablet_id, "signaturePreview", doc_id, data="sig")
+            if (await broker.storage.get_document(doc_id)).android_device_id != tablet_id:
+                return  # Another tablet claimed it first
+            signed_by.setdefault(doc_id, []).append(tablet_id)
+            await broker.route(windows_id, "signatureAccepted", doc_id)
+            signed_at[doc_id] = time.perf_counter()
+
+        def tablet_handler(tablet_id):
+            def handle(message):
+                if message["type"] == "sendStart":
+                    asyncio.ensure_future(sign(tablet_id, message["doc_id"]))
+                elif message["type"] == "sendCancel":
+                    cancelled.add((tablet_id, message["doc_id"]))
+            return handle
+
+        for tablet_id in tablets:
+            await broker.pair(windows_id, tablet_id)
+            broker.attach(tablet_id, tablet_handler(tablet_id))
+
+        for i in range(doc_count):
+            doc_id = await broker.add_document(windows_id, f"doc-{i}.pdf")
+            doc_index[doc_id] = i
+            sent_at[doc_id] = time.perf_counter()
+            await broker.route(windows_id, "sendStart", doc_id)
+            await asyncio.sleep(arrival_gap)
+        deadline = time.perf_counter() + 30
+        while len(signed_at) < doc_count and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+        assert len(signed_at) == doc_count, f"{mode}: only {len(signed_at)}/{doc_count} signed"
+        assert all(len(by) == 1 for by in signed_by.values()), f"{mode}: a document was signed twice"
+        assert all(broker.storage.get_inflight_count(t) == 0 for t in tablets), f"{mode}: in-flight count leaked"
+        waits = sorted(signed_at[d] - sent_at[d] for d in signed_at)
+        results[mode] = (sum(waits) / len(waits), waits[int(len(waits) * 0.9)])
+        if mode == PARALLEL:
+            claims = sum(1 for m in broker.ws_manager.connections[windows_id].messages if m["type"] == "documentClaimed")
+            assert claims > 0 and cancelled, "no document was offered to several tablets"
+        print(f"   {mode:<8} mean {results[mode][0] * 1000:6.0f} ms   p90 {results[mode][1] * 1000:6.0f} ms")
+
+    assert results[PARALLEL][0] < results[SINGLE][0], "parallel dispatch was not faster"
+    print(f"✅ Parallel dispatch cut mean time to signature by {1 - results[PARALLEL][0] / results[SINGLE][0]:.0%}")
+
+
+async def test_bundle_transfer_and_completion(doc_count=6):
+    """A bundle goes to one tablet in one transfer and completes once, after its last signature."""
+    print(f"\n📚 Bundle of {doc_count} documents")
+    broker = Broker()
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    await broker.pair(windows_id, tablet_id)
+    windows_socket = broker.attach(windows_id)
+    tablet_socket = broker.attach(tablet_id)
+    bundle_id = str(uuid.uuid4())
+    doc_ids = [
+        await broker.add_document(windows_id, f"form-{i}.pdf", bundle_id=bundle_id, pdf_data=b"%PDF" + bytes([i]))
+        for i in range(doc_count)
+    ]
+
+    message = SignikMessage(type="bundleStart", bundle_id=bundle_id, sender_device_id=windows_id)
+
+    # The tablet's socket breaks mid-transfer: every leased document is taken back
+    async def broken_send(data):
+        raise ConnectionError("socket closed")
+    tablet_socket.send_bytes = broken_send
+    await broker.ws_manager.route_message(message, None)
+    assert windows_socket.messages[-1]["reason"] == "send_failed"
+    for doc_id in doc_ids:
+        assert (await broker.storage.get_document(doc_id)).status == DocStatus.QUEUED
+    assert broker.storage.get_inflight_count(tablet_id) == 0
+    tablet_socket = broker.attach(tablet_id)
+
+    await broker.ws_manager.route_message(message, None)
+    assert [m["type"] for m in tablet_socket.messages] == ["bundleStart"]
+    manifest = tablet_socket.messages[0]["data"]
+    assert [entry["doc_id"] for entry in manifest["documents"]] == doc_ids
+    assert len(tablet_socket.frames) == doc_count
+    assert windows_socket.messages[-1]["type"] == "bundleSent"
+    await broker.ws_manager.route_message(message, None)  # Everything is out already
+    assert windows_socket.messages[-1]["reason"] == "nothing_to_send"
+    assert [m["type"] for m in tablet_socket.messages] == ["bundleStart"]
+    for doc_id in doc_ids:
+        doc = await broker.storage.get_document(doc_id)
+        assert doc.status == DocStatus.SENT and doc.android_device_id == tablet_id
+
+    for doc_id in doc_ids[:-1]:
+        assert not any(m["type"] == "bundleComplete" for m in windows_socket.messages)
+        await broker.route(tablet_id, "signaturePreview", doc_id, data="sig")
+        await broker.route(windows_id, "signatureAccepted", doc_id)
+    # The last one goes straight to DELIVERED without a review
+    await broker.route(tablet_id, "signaturePreview", doc_ids[-1], data="sig")
+    assert not any(m["type"] == "bundleComplete" for m in windows_socket.messages)
+    await broker.route(tablet_id, "signedComplete", doc_ids[-1])
+    await broker.route(tablet_id, "signedComplete", doc_ids[-1])  # Duplicate completion
+    await broker.route(windows_id, "signatureAccepted", doc_ids[-1])  # Late acceptance of a delivered one
+    completions = [m for m in windows_socket.messages if m["type"] == "bundleComplete"]
+    assert len(completions) == 1 and completions[0]["data"]["status"] == "complete"
+    assert any(m["type"] == "bundleComplete" for m in tablet_socket.messages)
+    print("✅ One bundleStart, one frame per PDF, one bundleComplete")
+
+
+async def test_presence_debounces_flapping(flaps=20):
+    """A flapping tablet reaches its paired PC as one presence change once it settles."""
+    print(f"\n📶 Presence of a tablet flapping {flaps} times")
+    broker = Broker(presence_online_delay=0.05, presence_offline_delay=0.1)
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    stranger_id = await broker.add_device("Other-Tablet", DeviceType.ANDROID)
+    await broker.pair(windows_id, tablet_id)
+    windows_socket = broker.attach(windows_id)
+    message = SignikMessage(type="subscribe", data={"topic": "presence"}, sender_device_id=windows_id)
+    await broker.ws_manager.route_message(message, None)
+    snapshot = windows_socket.messages[-1]
+    assert snapshot["type"] == "presenceSnapshot"
+    assert [(d["device_id"], d["is_online"]) for d in snapshot["devices"]] == [(tablet_id, True)]
+
+    def presence():
+        return [(m["device_id"], m["is_online"]) for m in windows_socket.messages if m["type"] == "presence"]
+
+    # Drops and returns within the offline delay: nothing to tell
+    for i in range(flaps):
+        await broker.storage.update_device_status(tablet_id, i % 2 == 1)
+        await broker.storage.update_device_status(stranger_id, i % 2 == 1)
+        await asyncio.sleep(0.005)
+    await asyncio.sleep(0.2)
+    assert presence() == [], presence()
+
+    # Ends offline: one change, after the tablet stayed offline for the delay
+    for i in range(flaps + 1):
+        await broker.storage.update_device_status(tablet_id, i % 2 == 1)
+        await asyncio.sleep(0.005)
+    assert presence() == []
+    await asyncio.sleep(0.2)
+    assert presence() == [(tablet_id, False)], presence()
+
+    # A heartbeat brings it back
+    await broker.storage.update_device_heartbeat(tablet_id)
+    await asyncio.sleep(0.1)
+    assert presence() == [(tablet_id, False), (tablet_id, True)], presence()
+    assert not broker.ws_manager._presence_tasks  # Finished broadcasts are let go
+    stats = broker.ws_manager.presence.stats()
+    assert stats["published"] == 2 and stats["flips"] == 3 * flaps + 2, stats
+    print(f"✅ {stats['flips']} flips, {stats['published']} presence messages")
+
+
+async def test_preview_kept_when_delivery_fails():
+    """A preview is stored even when forwarding it to the PC fails."""
+    print("\n🖊️  Signature preview with a failing PC socket")
+    broker = Broker(preview_store_interval=60)
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    await broker.pair(windows_id, tablet_id)
+    broker.attach(tablet_id)
+
+    def broken(message):
+        raise ConnectionError("socket closed")
+    broker.attach(windows_id, broken)
+    first = await broker.add_document(windows_id, "first.pdf")
+    await broker.route(windows_id, "sendStart", first)
+    await broker.route(tablet_id, "signaturePreview", first, data="first-sig")
+    await asyncio.sleep(0.05)
+    assert windows_id not in broker.ws_manager.connections
+    assert (await broker.storage.get_document(first)).signature_data == "first-sig"
+
+    await broker.route(windows_id, "signatureAccepted", first)
+
+    # Forwarding itself raising: the drain task ends, the preview is still stored
+    async def failing_deliver(message):
+        raise RuntimeError("encoder crashed")
+    broker.ws_manager.previews._deliver = failing_deliver
+    second = await broker.add_document(windows_id, "second.pdf")
+    await broker.route(windows_id, "sendStart", second, device_id=tablet_id)
+    await broker.route(tablet_id, "signaturePreview", second, data="second-sig")
+    await asyncio.sleep(0.05)
+    assert (await broker.storage.get_document(second)).signature_data == "second-sig"
+    assert broker.ws_manager.previews.stats()["active_documents"] == 0
+    print("✅ Both previews stored despite the failures")
+
+
+async def test_preview_store_leaves_status_and_log_alone():
+    """Debounced preview stores never undo a status change and keep the preview out of change events."""
+    print("\n📝 Preview stores against status changes")
+    broker = Broker(preview_store_interval=0)
+    events = []
+    broker.storage.add_listener(events.append)
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    await broker.pair(windows_id, tablet_id)
+    broker.attach(windows_id)
+    broker.attach(tablet_id)
+
+    doc_id = await broker.add_document(windows_id, "contract.pdf")
+    await broker.route(windows_id, "sendStart", doc_id)
+    for i in range(5):
+        await broker.route(tablet_id, "signaturePreview", doc_id, data=f"sig-{i}")
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    assert (await broker.storage.get_document(doc_id)).signature_data == "sig-4"
+    stores = [event for event in events if event.type == "document_signature"]
+    assert stores and all("signature_data" not in event.data for event in stores)
+
+    # The lease runs out while a store is on its way: the document stays requeued
+    stale = SignikMessage(type="signaturePreview", doc_id=doc_id, sender_device_id=tablet_id, data="sig-late")
+    await broker.storage.update_document_status(doc_id, DocStatus.QUEUED, android_device_id=None)
+    await broker.ws_manager._store_preview(stale)
+    doc = await broker.storage.get_document(doc_id)
+    assert doc.status == DocStatus.QUEUED and doc.signature_data == "sig-4"
+
+    # The review logs the final preview
+    await broker.route(windows_id, "sendStart", doc_id)
+    await broker.route(tablet_id, "signaturePreview", doc_id, data="sig-final")
+    await broker.route(windows_id, "signatureAccepted", doc_id)
+    review = [event for event in events if event.data.get("status") == DocStatus.SIGNED]
+    assert len(review) == 1 and review[0].data["signature_data"] == "sig-final", review
+    print(f"✅ {len(stores)} preview stores logged without their data; the review carried the final one")
+
+
+async def test_offer_survives_failing_tablet():
+    """A tablet whose socket fails mid-offer is dropped; the others still get the document."""
+    print("\n📵 Parallel offer with a dead tablet socket")
+    broker = Broker(dispatch_mode=PARALLEL, parallel_offers=3, max_inflight_per_tablet=2)
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    windows_socket = broker.attach(windows_id)
+    tablets = [await broker.add_device(f"Tablet-{i}", DeviceType.ANDROID) for i in range(3)]
+
+    def broken(message):
+        raise ConnectionError("socket closed")
+    sockets = {}
+    for i, tablet_id in enumerate(tablets):
+        await broker.pair(windows_id, tablet_id)
+        sockets[tablet_id] = broker.attach(tablet_id, broken if i == 0 else None)
+
+    doc_id = await broker.add_document(windows_id, "contract.pdf", pdf_data=b"%PDF")
+    await broker.route(windows_id, "sendStart", doc_id)
+    assert tablets[0] not in broker.ws_manager.connections
+    for tablet_id in tablets[1:]:
+        assert [m["doc_id"] for m in sockets[tablet_id].messages] == [doc_id]
+        assert sockets[tablet_id].frames == [b"%PDF"]
+    assert broker.storage._offers[doc_id] == set(tablets[1:])
+    assert broker.storage.get_inflight_count(tablets[0]) == 0
+
+    # Every socket failing: the document is not left on an offer nobody got
+    for tablet_id in tablets[1:]:
+        sockets[tablet_id].on_message = broken
+    second = await broker.add_document(windows_id, "second.pdf")
+    await broker.route(windows_id, "sendStart", second)
+    doc = await broker.storage.get_document(second)
+    assert doc.status == DocStatus.QUEUED and not broker.storage.is_offered(second)
+    assert all(broker.storage.get_inflight_count(tablet_id) == 1 for tablet_id in tablets[1:])
+    assert [m["doc_id"] for m in windows_socket.messages if m["type"] == "documentRequeued"] == [second]
+    print("✅ Offer went on without the dead tablet; an undeliverable one was requeued")
+
+
+async def test_change_feed_is_scoped_to_the_subscriber(heartbeats=50):
+    """A device's change feed carries only its own changes, and heartbeats stay out of the history."""
+    print("\n🔒 Change feed scoped to the subscribing device")
+    broker = Broker()
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    other_id = await broker.add_device("Other PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    windows_socket = broker.attach(windows_id)
+    broker.attach(other_id)
+    start = broker.storage.changes.last_seq
+
+    # Asking for another device's feed still gets only the sender's own
+    message = SignikMessage(type="subscribe", data={"topic": "changes", "device_id": other_id},
+                            sender_device_id=windows_id)
+    await broker.ws_manager.route_message(message, None)
+    mine = await broker.add_document(windows_id, "mine.pdf")
+    theirs = await broker.add_document(other_id, "theirs.pdf")
+    for _ in range(heartbeats):
+        await broker.storage.update_device_heartbeat(tablet_id)
+    await broker.storage.update_document_status(theirs, DocStatus.DEFERRED)
+    await broker.storage.update_document_status(mine, DocStatus.DEFERRED)
+    await asyncio.sleep(0.05)
+    changes = [m["event"] for m in windows_socket.messages if m["type"] == "change"]
+    assert [(event["entity_id"], event["type"]) for event in changes] == [
+        (mine, "document_added"), (mine, "document_status")
+    ], changes
+
+    history = [event for event in broker.storage.changes.history() if event.seq > start]
+    assert len(history) == 4 and all(event.type != "heartbeat" for event in history)
+    assert broker.storage.changes.last_seq == broker.storage.last_seq
+    # A follower resuming from the same point still gets the tablet's latest heartbeat
+    replay = broker.storage.changes.subscribe(EventFilter(include_heartbeats=True), start)
+    replayed = await replay.next_batch(timeout=0)
+    heartbeat_events = [event for event in replayed if event.type == "heartbeat"]
+    assert len(replayed) == 5 and len(heartbeat_events) == 1
+    assert heartbeat_events[0].data["last_heartbeat"] == broker.storage.devices[tablet_id].last_heartbeat
+    broker.storage.changes.unsubscribe(replay)
+    broker.ws_manager.disconnect(windows_id)
+    print(f"✅ 2 of {len(history)} changes delivered; {heartbeats} heartbeats kept out of the history")
+
+
+async def test_rate_limit_spares_transfer_frames(chunks=5):
+    """Over its WebSocket budget, a PC is told about dropped messages but its PDF frames still go through."""
+    print("\n🚦 WebSocket rate limit during a PDF transfer")
+    broker = Broker()
+    admission = AdmissionControl(websocket=RateLimiter(per_device_rate=0.001, per_device_burst=1))
+    routes = APIRoutes(broker.storage, broker.ws_manager, admission=admission)
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    await broker.pair(windows_id, tablet_id)
+    tablet_socket = broker.attach(tablet_id)
+    doc_id = await broker.add_document(windows_id, "contract.pdf")
+
+    class ScriptedSocket(FakeSocket):
+        """The PC: sends a sendStart, the PDF in chunks, then one message too many."""
+
+        def __init__(self):
+            super().__init__()
+            start = SignikMessage(type="sendStart", doc_id=doc_id, name="contract.pdf").model_dump_json()
+            late = SignikMessage(type="signatureAccepted", doc_id=doc_id).model_dump_json()
+            self.script = [{"type": "websocket.receive", "text": start}]
+            self.script += [{"type": "websocket.receive", "bytes": b"chunk-%d" % i} for i in range(chunks)]
+            self.script += [{"type": "websocket.receive", "text": late}, {"type": "websocket.disconnect"}]
+
+        async def accept(self):
+            pass
+
+        async def receive(self):
+            return self.script.pop(0)
+
+    windows_socket = ScriptedSocket()
+    await routes.handle_websocket(windows_socket, windows_id)
+    assert [m["type"] for m in tablet_socket.messages] == ["sendStart"]
+    assert tablet_socket.frames == [b"chunk-%d" % i for i in range(chunks)], tablet_socket.frames
+    assert [m["type"] for m in windows_socket.messages] == ["rateLimited"]
+    assert (await broker.storage.get_document(doc_id)).status == DocStatus.SENT
+    print(f"✅ {chunks} PDF frames forwarded past the limit; the dropped message was reported")
+
+
+async def test_status_update_fields_are_checked():
+    """Records hash by identity, and a status change cannot set private or unknown fields."""
+    print("\n🛡️  Record hashing and status update fields")
+    broker = Broker()
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    doc_id = await broker.add_document(windows_id, "contract.pdf")
+    doc = await broker.storage.get_document(doc_id)
+    copy = type(doc).from_row(doc.to_row())
+    assert copy == doc and len({doc, copy}) == 2
+
+    created_at = doc.created_at
+    for field in ("_created_at", "id", "pdf_data"):
+        try:
+            await broker.storage.update_document_status(doc_id, DocStatus.DEFERRED, **{field: None})
+        except AttributeError:
+            pass
+        else:
+            raise AssertionError(f"{field} was accepted")
+    assert doc.status == DocStatus.QUEUED and doc.created_at == created_at
+    await broker.storage.update_document_status(doc_id, DocStatus.DEFERRED, signature_data=b"sig")
+    assert doc.status == DocStatus.DEFERRED and doc.signature_data == b"sig"
+    print("✅ Equal records stay distinct in a set; only allowed fields were set")
+
+
+async def test_tagged_frames_need_a_live_assignment():
+    """Tagged frames pass only while the document is out with the tablet that holds it."""
+    print("\n🏷️  Tagged frames for stale documents")
+    broker = Broker()
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    tablet_id = await broker.add_device("Tablet", DeviceType.ANDROID)
+    await broker.pair(windows_id, tablet_id)
+    windows_socket = broker.attach(windows_id)
+    tablet_socket = broker.attach(tablet_id)
+    doc_id = await broker.add_document(windows_id, "contract.pdf")
+    await broker.route(windows_id, "sendStart", doc_id)
+
+    def failures(socket):
+        return [m["reason"] for m in socket.messages if m["type"] == "binaryRouteFailed"]
+
+    assert await broker.ws_manager.route_binary_data(pack_frame(doc_id, b"page", stream_id=1), windows_id)
+    await broker.route(tablet_id, "signaturePreview", doc_id, data="sig")
+    await broker.route(windows_id, "signatureAccepted", doc_id)
+    # Accepted: the PC's late frame is refused, the tablet's signed PDF still goes through
+    assert not await broker.ws_manager.route_binary_data(pack_frame(doc_id, b"late", stream_id=1), windows_id)
+    assert await broker.ws_manager.route_binary_data(pack_frame(doc_id, b"signed", stream_id=2), tablet_id)
+    await broker.route(tablet_id, "signedComplete", doc_id)
+    assert not await broker.ws_manager.route_binary_data(pack_frame(doc_id, b"again", stream_id=2), tablet_id)
+
+    assert len(tablet_socket.frames) == 1 and len(windows_socket.frames) == 1
+    assert failures(windows_socket) == ["document_not_sent"]
+    assert failures(tablet_socket) == ["document_not_sent"]
+    print("✅ Frames refused once the document left the signing tablet")
+
+
+async def test_timeline_expiry_is_bounded_and_reset_on_restore():
+    """Evicting a backlog is spread over appends, and a restored snapshot starts a fresh timeline."""
+    print("\n🗂️  Timeline eviction and snapshot restore")
+    timeline = Timeline(bucket_seconds=1, retention_seconds=10)
+    for i in range(500):
+        timeline.append(TimelineEvent(i / 100, f"doc-{i % 7}", "status"))
+    timeline.append(TimelineEvent(1000.0, "doc-late", "status"))  # Everything before is past retention
+    assert timeline.evicted == EXPIRE_PER_APPEND
+    for _ in range(500 // EXPIRE_PER_APPEND):
+        timeline.append(TimelineEvent(1000.0, "doc-late", "status"))
+    assert timeline.evicted == 500 and timeline.document("doc-0") == []
+    assert len(timeline) == len(timeline.document("doc-late"))
+
+    broker = Broker()
+    windows_id = await broker.add_device("PC", DeviceType.WINDOWS)
+    doc_id = await broker.add_document(windows_id, "contract.pdf")
+    await broker.storage.update_document_status(doc_id, DocStatus.DEFERRED)
+    # Queued under the storage lock, filed on the next read
+    assert len(broker.ws_manager.timeline._incoming) == 2
+    assert len(broker.ws_manager.timeline.document(doc_id)) == 2
+    assert not broker.ws_manager.timeline._incoming
+    await broker.storage.restore_state(broker.storage.export_state())
+    restored = broker.ws_manager.timeline.document(doc_id)
+    assert [(event.kind, event.status) for event in restored] == [("status", "deferred")], restored
+    print(f"✅ At most {EXPIRE_PER_APPEND} evictions per append; restore replaced the history")
+
+
+async def main():
+    """Run all scenarios"""
+    print("🚀 Starting Signik dispatch scenario tests")
+    print("=" * 50)
+    await test_lease_expiry_requeues_to_other_tablet()
+    await test_signature_strokes_accumulate()
+    await test_preview_kept_when_delivery_fails()
+    await test_preview_store_leaves_status_and_log_alone()
+    await test_parallel_dispatch_time_to_signature()
+    await test_offer_survives_failing_tablet()
+    await test_bundle_transfer_and_completion()
+    await test_presence_debounces_flapping()
+    await test_change_feed_is_scoped_to_the_subscriber()
+    await test_rate_limit_spares_transfer_frames()
+    await test_status_update_fields_are_checked()
+    await test_tagged_frames_need_a_live_assignment()
+    await test_timeline_expiry_is_bounded_and_reset_on_restore()
+    await test_throughput_under_tablet_churn()
+    print("\n" + "=" * 50)
+    print("🎉 All scenarios passed!")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Replication tests for the Signik Broker.
+Runs a primary and a follower in-process over a Unix socket and checks that
+the follower's state matches, survives reconnects and can be promoted, and
+that TCP replication serves only authenticated followers.
+"""
+
+import asyncio
+import os
+import pickle
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "signik_broker"))
+
+from models import (  # noqa: E402
+    Device, DeviceConnection, Document, DeviceType, DocStatus, ConnectionStatus
+)
+from storage import StorageManager  # noqa: E402
+from replication import ReplicationServer, ReplicationClient, FRAME_HEADER, HELLO, MAC_SIZE  # noqa: E402
+from wal import WriteAheadLog  # noqa: E402
+
+
+async def populate(storage, documents=20):
+    """A PC paired with two tablets and some documents in various states."""
+    now = datetime.now()
+    pc, *tablets = [
+        Device(id=str(uuid.uuid4()), name=name, device_type=device_type,
+               ip_address="10.0.0.1", last_heartbeat=now)
+        for name, device_type in (("PC", DeviceType.WINDOWS), ("Tab-A", DeviceType.ANDROID),
+                                  ("Tab-B", DeviceType.ANDROID))
+    ]
+    await storage.add_devices([pc, *tablets])
+    for tablet in tablets:
+        await storage.update_device_heartbeat(tablet.id)
+        await storage.add_connection(DeviceConnection(
+            id=str(uuid.uuid4()), windows_device_id=pc.id, android_device_id=tablet.id,
+            status=ConnectionStatus.CONNECTED, created_at=now, updated_at=now, initiated_by=pc.id
+        ))
+    await add_documents(storage, pc.id, documents)
+    doc_ids = list(storage.documents)
+    await storage.lease_document(doc_ids[0], tablets[0].id, 60)
+    await storage.update_document_status(doc_ids[1], DocStatus.SIGNED, signature_data=b"sig")
+    return pc.id, [t.id for t in tablets]
+
+
+async def add_documents(storage, windows_id, count):
+    now = datetime.now()
+    await storage.add_documents([
+        Document(id=str(uuid.uuid4()), name=f"doc-{i}.pdf", status=DocStatus.QUEUED,
+                 created_at=now, updated_at=now, windows_device_id=windows_id, pdf_data=b"%PDF")
+        for i in range(count)
+    ])
+
+
+async def caught_up(primary, replica, timeout=5.0):
+    """Wait until the follower has applied everything the primary has."""
+    deadline = time.monotonic() + timeout
+    while replica.storage.last_seq != primary.last_seq or replica.last_applied_at is None:
+        assert time.monotonic() < deadline, f"follower stuck at {replica.storage.last_seq}/{primary.last_seq}"
+        await asyncio.sleep(0.01)
+
+
+def assert_same(primary, follower, windows_id):
+    assert follower.export_state() == primary.export_state(), "state differs"
+    assert follower.get_eligible_tablets(windows_id) == primary.get_eligible_tablets(windows_id)
+    assert follower.stats.snapshot()["documents"] == primary.stats.snapshot()["documents"]
+    assert follower.memory.snapshot() == primary.memory.snapshot()
+    assert follower.versions.version("documents") == primary.versions.version("documents")
+
+
+async def test_follow_reconnect_and_promote(directory):
+    """A follower mirrors the primary, resumes after a dropped link and takes over on promotion."""
+    print("\n🔁 Follow, reconnect and promote")
+    address = f"unix:{os.path.join(directory, 'replication.sock')}"
+    primary = StorageManager()
+    windows_id, tablets = await populate(primary)
+    server = ReplicationServer(primary, address, heartbeat_seconds=0.05)
+    await server.start()
+
+    follower = StorageManager()
+    replica = ReplicationClient(follower, address, reconnect_seconds=0.05)
+    replica.start()
+    await caught_up(primary, replica)
+    assert_same(primary, follower, windows_id)
+    assert replica.snapshots_loaded == 0, "full history should not need a snapshot"
+
+    await primary.update_device_status(tablets[1], False)
+    await add_documents(primary, windows_id, 5)
+    await caught_up(primary, replica)
+    assert_same(primary, follower, windows_id)
+
+    # Drop the link, change things meanwhile, and let the follower resume from history
+    await server.stop()
+    await add_documents(primary, windows_id, 5)
+    await primary.update_device_status(tablets[1], True)
+    await server.start()
+    await caught_up(primary, replica)
+    assert_same(primary, follower, windows_id)
+    assert replica.reconnects >= 1 and replica.snapshots_loaded == 0
+    assert replica.lag_events == 0
+    print(f"✅ Follower in sync at change {follower.last_seq} after {replica.reconnects} reconnect(s)")
+
+    start = time.perf_counter()
+    await replica.promote()
+    await add_documents(follower, windows_id, 1)
+    failover = time.perf_counter() - start
+    assert not replica.read_only and follower.last_seq == primary.last_seq + 1
+    print(f"✅ Promoted and accepted a write in {failover * 1000:.1f} ms")
+    await server.stop()
+
+
+async def test_snapshot_when_history_is_gone(directory):
+    """A follower whose position fell out of the change history is sent a snapshot."""
+    print("\n📸 Snapshot for a follower beyond the change history")
+    address = f"unix:{os.path.join(directory, 'replication-2.sock')}"
+    primary = StorageManager(change_history_size=10)
+    windows_id, _ = await populate(primary, documents=200)
+    for doc_id in list(primary.documents)[2:50]:
+        await primary.update_document_status(doc_id, DocStatus.DEFERRED)
+    server = ReplicationServer(primary, address, heartbeat_seconds=0.05)
+    await server.start()
+
+    # The follower keeps its own write-ahead log, restarted from the primary's snapshot
+    follower = StorageManager()
+    wal_dir = os.path.join(directory, "follower-wal")
+    wal = WriteAheadLog(wal_dir)
+    await wal.recover(follower)
+    follower.add_listener(wal.record)
+    replica = ReplicationClient(follower, address, wal=wal)
+    replica.start()
+    await caught_up(primary, replica)
+    assert replica.snapshots_loaded == 1
+    await add_documents(primary, windows_id, 3)
+    await caught_up(primary, replica)
+    assert_same(primary, follower, windows_id)
+    status = replica.status()
+    assert status["role"] == "follower" and status["lag_events"] == 0
+    await replica.stop()
+    await server.stop()
+    wal.close()
+
+    restarted = StorageManager()
+    await WriteAheadLog(wal_dir).recover(restarted)
+    assert_same(primary, restarted, windows_id)
+    print(f"✅ Snapshot loaded, {follower.last_seq} changes in sync, follower log recovers the same state")
+
+
+async def test_tcp_frames_are_authenticated():
+    """Over TCP only a follower with the shared secret is served; forged frames are never unpickled."""
+    print("\n🔐 Authenticated replication over TCP")
+    try:
+        ReplicationServer(StorageManager(), "tcp:127.0.0.1:0")
+        raise AssertionError("TCP without a secret should be refused")
+    except ValueError:
+        pass
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    address = f"tcp:127.0.0.1:{port}"
+    primary = StorageManager()
+    windows_id, _ = await populate(primary)
+    server = ReplicationServer(primary, address, heartbeat_seconds=0.05, secret="s3cret")
+    await server.start()
+
+    # A peer without the secret sending a pickle bomb as HELLO: dropped before decoding
+    class Exploit:
+        def __reduce__(self):
+            return (exploited.append, (True,))
+    exploited = []
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = pickle.dumps({"last_seq": 0, "x": Exploit()})
+    writer.write(FRAME_HEADER.pack(HELLO, len(payload)) + payload + bytes(MAC_SIZE))
+    assert await reader.read() == b"" and not exploited
+    writer.close()
+
+    intruder = StorageManager()
+    rejected = ReplicationClient(intruder, address, reconnect_seconds=0.05, secret="guess")
+    rejected.start()
+    follower = StorageManager()
+    replica = ReplicationClient(follower, address, reconnect_seconds=0.05, secret="s3cret")
+    replica.start()
+    await caught_up(primary, replica)
+    assert_same(primary, follower, windows_id)
+    assert intruder.last_seq == 0 and rejected.last_applied_at is None
+    await rejected.stop()
+    await replica.stop()
+    await server.stop()
+    print(f"✅ Follower with the secret in sync at change {follower.last_seq}; others got nothing")
+
+
+async def main():
+    """Run all scenarios"""
+    print("🚀 Starting Signik replication tests")
+    print("=" * 50)
+    directory = tempfile.mkdtemp(prefix="signik-repl-")
+    try:
+        await test_follow_reconnect_and_promote(directory)
+        await test_snapshot_when_history_is_gone(directory)
+        await test_tcp_frames_are_authenticated()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print("\n" + "=" * 50)
+    print("🎉 All scenarios passed!")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the hot-endpoint response cache.
+Drives a storage manager directly and counts how often the cached body
+is rebuilt while devices heartbeat.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "signik_broker"))
+
+from events import DEVICES  # noqa: E402
+from models import Device, DeviceType  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from storage import StorageManager  # noqa: E402
+
+
+async def setup(cache, tablet_count=5):
+    """A storage manager feeding ``cache`` and a /devices-like builder that counts rebuilds."""
+    storage = StorageManager()
+    storage.add_listener(cache.record)
+    tablets = []
+    for i in range(tablet_count):
+        device = Device(
+            id=str(uuid.uuid4()), name=f"Tablet-{i}", device_type=DeviceType.ANDROID,
+            ip_address="10.0.0.1", last_heartbeat=datetime.now()
+        )
+        await storage.add_device(device)
+        tablets.append(device.id)
+    builds = []
+
+    async def build():
+        builds.append(1)
+        devices = await storage.get_all_devices()
+        return json.dumps([device.to_dict() for device in devices], default=str).encode(), None
+
+    async def get():
+        return await cache.get_or_build("devices", (DEVICES,), build)
+
+    return storage, tablets, builds, get
+
+
+async def test_heartbeats_keep_cache_hits():
+    """Steady heartbeats do not empty the cache; a real device change still does."""
+    print("\n💓 Cache hits while tablets heartbeat")
+    cache = ResponseCache(heartbeat_seconds=1.0)
+    storage, tablets, builds, get = await setup(cache)
+    for _ in range(50):
+        for tablet_id in tablets:
+            await storage.update_device_heartbeat(tablet_id)
+        await get()
+        await asyncio.sleep(0.005)
+    stats = cache.stats()
+    assert len(builds) <= 2, (len(builds), stats)
+    assert stats["hits"] + stats["coalesced_hits"] >= 47, stats
+
+    # Going offline is not a heartbeat: the next request sees it at once
+    await storage.update_device_status(tablets[0], False)
+    offline = [d for d in json.loads((await get()).body) if d["id"] == tablets[0]]
+    assert offline[0]["is_online"] is False
+    print(f"✅ {len(builds)} rebuilds for 50 requests under {50 * len(tablets)} heartbeats")
+
+
+async def test_heartbeat_window_zero_rebuilds():
+    """With no heartbeat window every heartbeat invalidates, as before."""
+    print("\n🔁 Heartbeat window of 0")
+    cache = ResponseCache(heartbeat_seconds=0)
+    storage, tablets, builds, get = await setup(cache)
+    for _ in range(10):
+        await storage.update_device_heartbeat(tablets[0])
+        await get()
+    assert len(builds) == 10 and cache.stats()["hits"] == 0
+    print("✅ One rebuild per heartbeat")
+
+
+async def main():
+    """Run all scenarios"""
+    print("🚀 Starting Signik response cache tests")
+    print("=" * 50)
+    await test_heartbeats_keep_cache_hits()
+    await test_heartbeat_window_zero_rebuilds()
+    print("\n" + "=" * 50)
+    print("🎉 All scenarios passed!")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main())
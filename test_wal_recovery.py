@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Crash-consistency tests for the Signik Broker write-ahead log.
+Kills a writer process mid-stream and damages log files, then checks that
+recovery restores exactly the acknowledged prefix of changes.
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "signik_broker"))
+
+from models import Device, Document, DeviceType, DocStatus  # noqa: E402
+from storage import StorageManager  # noqa: E402
+from wal import WriteAheadLog  # noqa: E402
+
+
+async def open_broker(directory, **wal_options):
+    """Recover a storage manager from ``directory`` and attach its log."""
+    storage = StorageManager()
+    wal = WriteAheadLog(directory, **wal_options)
+    result = await wal.recover(storage)
+    storage.add_listener(wal.record)
+    return storage, wal, result
+
+
+async def write_steps(storage, windows_id, start, count, on_step=None, wal=None):
+    """Step k adds doc-k and signs doc-(k-1): two changes per step."""
+    for k in range(start, start + count):
+        await storage.add_document(Document(
+            id=f"doc-{k}",
+            name=f"doc-{k}.pdf",
+            status=DocStatus.QUEUED,
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+            windows_device_id=windows_id,
+            pdf_data=os.urandom(random.randint(0, 512))
+        ))
+        if k:
+            await storage.update_document_status(f"doc-{k - 1}", DocStatus.SIGNED, signature_data=b"sig")
+        if wal and wal.snapshot_due:
+            await wal.snapshot(storage)
+        if on_step:
+            on_step(k)
+
+
+def check_prefix(storage):
+    """The recovered documents must be doc-0..doc-n, all signed but possibly the newest."""
+    count = len(storage.documents)
+    for k in range(count):
+        doc = storage.documents[f"doc-{k}"]
+        expected = DocStatus.QUEUED if k == count - 1 else DocStatus.SIGNED
+        if doc.status != expected:
+            # The crash may fall between adding doc-k and signing doc-(k-1)
+            assert k == count - 2 and doc.status == DocStatus.QUEUED, f"doc-{k} is {doc.status}"
+    queued = len(storage._docs_by_status[DocStatus.QUEUED])
+    assert queued == sum(1 for d in storage.documents.values() if d.status == DocStatus.QUEUED)
+    assert storage.stats.documents_by_status[DocStatus.QUEUED.value] == queued
+    return count
+
+
+async def run_writer(directory):
+    """Child process: recover, then keep writing and acknowledge each step on stdout."""
+    storage, wal, _ = await open_broker(directory, fsync="never", snapshot_every=300)
+    windows = await storage.find_device_by_name_and_type("PC", DeviceType.WINDOWS)
+    if not windows:
+        windows = Device(
+            id=str(uuid.uuid4()), name="PC", device_type=DeviceType.WINDOWS,
+            ip_address="10.0.0.1", last_heartbeat=datetime.now()
+        )
+        await storage.add_device(windows)
+    start = len(storage.documents)
+    if start >= 2 and storage.documents[f"doc-{start - 2}"].status == DocStatus.QUEUED:
+        # Finish the step the previous kill interrupted, or doc-(start-2) would stay queued
+        await storage.update_document_status(f"doc-{start - 2}", DocStatus.SIGNED, signature_data=b"sig")
+
+    def ack(k):
+        print(f"{k} {storage.last_seq}", flush=True)
+
+    await write_steps(storage, windows.id, start, 10 ** 9, ack, wal)
+
+
+async def test_kill_mid_write(rounds=8):
+    """SIGKILL a writer at random points; every acknowledged change must survive."""
+    print(f"\n💥 Killing the writer mid-stream ({rounds} rounds)")
+    directory = tempfile.mkdtemp(prefix="signik-wal-")
+    rng = random.Random(35)
+    try:
+        for round_number in range(rounds):
+            child = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--writer", directory],
+                stdout=subprocess.PIPE, text=True
+            )
+            kill_after = rng.randint(50, 1500)
+            acked_step = acked_seq = -1
+            for _ in range(kill_after):
+                line = child.stdout.readline()
+                if not line:
+                    break
+                acked_step, acked_seq = map(int, line.split())
+            child.send_signal(signal.SIGKILL)
+            child.wait()
+            assert acked_step >= 0, "writer produced no output"
+
+            storage, wal, result = await open_broker(directory)
+            wal.close()
+            count = check_prefix(storage)
+            assert count >= acked_step + 1, f"lost acknowledged steps: {count} <= {acked_step}"
+            assert storage.last_seq >= acked_seq
+            print(f"  round {round_number + 1}: acked step {acked_step}, recovered {count} documents "
+                  f"(snapshot {result.snapshot_seq}, {result.replayed} replayed)")
+        print("✅ No acknowledged change lost across kills")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def test_torn_and_corrupt_tail():
+    """A torn or bit-flipped last record is dropped and the log stays appendable."""
+    print("\n✂️  Torn and corrupt log tails")
+    rng = random.Random(36)
+    for damage in ("truncate", "flip"):
+        directory = tempfile.mkdtemp(prefix="signik-wal-")
+        try:
+            storage, wal, _ = await open_broker(directory, snapshot_every=10 ** 9)
+            await storage.add_device(Device(
+                id="pc", name="PC", device_type=DeviceType.WINDOWS,
+                ip_address="10.0.0.1", last_heartbeat=datetime.now()
+            ))
+            await write_steps(storage, "pc", 0, 200)
+            wal.close()
+            last_seq = storage.last_seq
+            (_, path), = wal.segments()
+            size = os.path.getsize(path)
+            with open(path, "r+b") as f:
+                if damage == "truncate":
+                    f.truncate(size - rng.randint(1, 100))
+                else:
+                    f.seek(size - rng.randint(1, 100))
+                    byte = f.read(1)
+                    f.seek(-1, os.SEEK_CUR)
+                    f.write(bytes([byte[0] ^ 0xFF]))
+
+            storage, wal, result = await open_broker(directory)
+            assert result.truncated_bytes > 0 and storage.last_seq == last_seq - 1
+            dropped = result.truncated_bytes
+            count = check_prefix(storage)
+            await write_steps(storage, "pc", count, 50)
+            wal.close()
+            expected = storage.export_state()
+
+            storage, wal, result = await open_broker(directory)
+            wal.close()
+            assert result.truncated_bytes == 0
+            assert storage.export_state() == expected
+            print(f"  {damage}: last record dropped ({dropped} bytes), log appendable afterwards")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    print("✅ Damaged tails recovered")
+
+
+async def test_snapshot_fallback():
+    """A corrupt newest snapshot falls back to the previous one plus its log."""
+    print("\n📸 Corrupt snapshot fallback")
+    directory = tempfile.mkdtemp(prefix="signik-wal-")
+    try:
+        storage, wal, _ = await open_broker(directory, snapshot_every=100)
+        await storage.add_device(Device(
+            id="pc", name="PC", device_type=DeviceType.WINDOWS,
+            ip_address="10.0.0.1", last_heartbeat=datetime.now()
+        ))
+        await write_steps(storage, "pc", 0, 500, wal=wal)
+        wal.close()
+        expected = storage.export_state()
+        assert len(wal.snapshots()) == 2
+
+        newest = wal.snapshots()[-1][1]
+        with open(newest, "r+b") as f:
+            f.seek(os.path.getsize(newest) // 2)
+            f.write(b"\x00" * 16)
+
+        storage, wal, result = await open_broker(directory)
+        wal.close()
+        assert result.snapshot_seq == wal.snapshots()[0][0]
+        assert storage.export_state() == expected
+        print(f"✅ Recovered from snapshot {result.snapshot_seq} and {result.replayed} logged changes")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def test_open_offer_survives_recovery():
+    """A document offered to several tablets is still on offer after replay and after a snapshot."""
+    print("\n🤝 Open offer across recovery")
+    directory = tempfile.mkdtemp(prefix="signik-wal-")
+    try:
+        storage, wal, _ = await open_broker(directory)
+        await storage.add_document(Document(
+            id="offered", name="offered.pdf", status=DocStatus.QUEUED,
+            created_at=datetime.now(), updated_at=datetime.now(), windows_device_id="pc"
+        ))
+        await storage.offer_document("offered", ["tab-1", "tab-2", "tab-3"], 300)
+        wal.close()
+
+        def check(storage):
+            assert storage.is_offered("offered")
+            assert storage.documents["offered"].status == DocStatus.SENT
+            assert [storage.get_inflight_count(tab) for tab in ("tab-1", "tab-2", "tab-3")] == [1, 1, 1]
+            assert storage.next_lease_deadline() is not None
+
+        storage, wal, result = await open_broker(directory)
+        check(storage)
+        assert result.replayed == 4
+        await wal.snapshot(storage, keep_previous=False)
+        wal.close()
+
+        storage, wal, result = await open_broker(directory)
+        check(storage)
+        assert result.replayed == 0
+        assert await storage.claim_document("offered", "tab-2", 300) == {"tab-1", "tab-3"}
+        wal.close()
+
+        storage, wal, _ = await open_broker(directory)
+        wal.close()
+        assert not storage.is_offered("offered")
+        assert storage.documents["offered"].android_device_id == "tab-2"
+        assert [storage.get_inflight_count(tab) for tab in ("tab-1", "tab-2", "tab-3")] == [0, 1, 0]
+        print("✅ Offer rebuilt from the log and from a snapshot, then claimed")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def main():
+    """Run all scenarios"""
+    print("🚀 Starting Signik write-ahead log tests")
+    print("=" * 50)
+    await test_torn_and_corrupt_tail()
+    await test_snapshot_fallback()
+    await test_open_offer_survives_recovery()
+    await test_kill_mid_write()
+    print("\n" + "=" * 50)
+    print("🎉 All scenarios passed!")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.CRITICAL)
+    if sys.argv[1:2] == ["--writer"]:
+        asyncio.run(run_writer(sys.argv[2]))
+    else:
+        asyncio.run(main())